@@ -1,9 +1,20 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.db import connections, router, transaction
+from .archive import archive_due_messages
+from .cache import bump_conversation_version
 from .models import User, Conversation, Message
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableMixin:
+    """Changelist settings for tables with millions of rows: no exact counts"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 @admin.register(User)
-class UserAdmin(DjangoUserAdmin):
+class UserAdmin(LargeTableMixin, DjangoUserAdmin):
     model = User
     list_display = ('email', 'username', 'first_name', 'last_name', 'role', 'created_at')
     fieldsets = DjangoUserAdmin.fieldsets + (
@@ -11,12 +22,75 @@ class UserAdmin(DjangoUserAdmin):
     )
 
 @admin.register(Conversation)
-class ConversationAdmin(admin.ModelAdmin):
-    list_display = ('conversation_id', 'created_at')
-    filter_horizontal = ('participants',)
+class ConversationAdmin(LargeTableMixin, admin.ModelAdmin):
+    # Inbox columns are denormalized, so the listing never touches the messages table.
+    list_display = ('conversation_id', 'created_at', 'last_message_at', 'message_count')
+    ordering = ('-last_message_at', '-conversation_id')
+    sortable_by = ('last_message_at',)
+    autocomplete_fields = ('participants',)
+    raw_id_fields = ('last_message',)
+    readonly_fields = ('message_count', 'last_message_at')
+    actions = ('archive_old_messages', 'recount_messages')
+
+    @admin.action(description="Archive old messages of selected conversations", permissions=['change'])
+    def archive_old_messages(self, request, queryset):
+        moved = archive_due_messages(conversation_ids=list(queryset.values_list('pk', flat=True)))
+        self.message_user(
+            request, f"Archived {sum(moved.values())} messages from {len(moved)} conversations", messages.SUCCESS
+        )
+
+    @admin.action(description="Recount inbox columns of selected conversations", permissions=['change'])
+    def recount_messages(self, request, queryset):
+        conversation_ids = list(queryset.values_list('pk', flat=True))
+        with transaction.atomic():
+            updated = Conversation.refresh_inbox(conversation_ids)
+            for conversation_id in conversation_ids:
+                bump_conversation_version(conversation_id)
+        self.message_user(request, f"Recounted {updated} conversations", messages.SUCCESS)
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
-    list_display = ('message_id', 'sender', 'conversation', 'sent_at')
-    list_filter = ('sent_at',)
+class MessageAdmin(LargeTableMixin, admin.ModelAdmin):
+    list_display = ('message_id', 'sender', 'conversation_id', 'sent_at')
+    list_select_related = ('sender',)
+    ordering = ('-sent_at',)
+    sortable_by = ('sent_at',)
+    date_hierarchy = 'sent_at'
+    autocomplete_fields = ('sender',)
+    raw_id_fields = ('conversation',)
+    actions = ('delete_messages',)
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Loads and renders every selected message and its relations; delete_messages does not.
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.action(description="Delete selected messages", permissions=['delete'])
+    def delete_messages(self, request, queryset):
+        conversation_ids = list(queryset.order_by().values_list('conversation_id', flat=True).distinct())
+        message_ids = queryset.order_by().values('pk')
+        using = router.db_for_write(Message)
+        with transaction.atomic(using=using):
+            Conversation.objects.filter(last_message__in=message_ids).update(last_message=None)
+            deleted = self.delete_rows(using, message_ids)
+            Conversation.refresh_inbox(conversation_ids)
+            for conversation_id in conversation_ids:
+                bump_conversation_version(conversation_id)
+        self.message_user(request, f"Deleted {deleted} messages", messages.SUCCESS)
+
+    @staticmethod
+    def delete_rows(using, message_ids):
+        """
+        One ``DELETE ... WHERE pk IN (<selection>)``, with no collector or signals.
 
+        ``QuerySet.delete()`` would load every row, because the inbox's
+        ``last_message`` foreign key points at messages.
+        """
+        select_sql, params = message_ids.query.sql_with_params()
+        quote = connections[using].ops.quote_name
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(Message._meta.db_table)} WHERE {quote(Message._meta.pk.column)} IN ({select_sql})",
+                params,
+            )
+            return cursor.rowcount
@@ -0,0 +1,78 @@
+"""
+Move old messages out of ``chats_message`` into the ``ArchivedMessage`` table.
+
+A message is due once it is older than its conversation's
+``archive_after_days``, or ``CHATS_ARCHIVE_AFTER_DAYS`` when the conversation
+does not set one (``None`` disables the global threshold). A conversation's
+latest message always stays hot so the inbox preview keeps working. Each
+batch is copied and deleted in one transaction. The nested messages route
+and the export read both tiers, so archiving never changes what clients see.
+
+Run ``manage.py archive_messages`` from cron (or call :func:`archive_due_messages`
+from any scheduler).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedMessage, Conversation, Message
+
+DEFAULT_BATCH_SIZE = 1000
+COLUMNS = ("message_id", "conversation_id", "sender_id", "message_body", "sent_at")
+
+
+def due_conversations(now=None, conversation_ids=None):
+    """``(conversation_id, cutoff)`` for every conversation with messages to archive"""
+    now = now or timezone.now()
+    due = []
+    default_days = getattr(settings, "CHATS_ARCHIVE_AFTER_DAYS", None)
+    if default_days is not None:
+        cutoff = now - timedelta(days=default_days)
+        messages = Message.objects.filter(sent_at__lt=cutoff, conversation__archive_after_days__isnull=True)
+        if conversation_ids is not None:
+            messages = messages.filter(conversation_id__in=conversation_ids)
+        due.extend((pk, cutoff) for pk in messages.values_list("conversation_id", flat=True).distinct())
+
+    overrides = Conversation.objects.filter(archive_after_days__isnull=False)
+    if conversation_ids is not None:
+        overrides = overrides.filter(pk__in=conversation_ids)
+    due.extend((pk, now - timedelta(days=days)) for pk, days in overrides.values_list("pk", "archive_after_days"))
+    return due
+
+
+def archive_conversation(conversation_id, cutoff, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Archive the conversation's messages sent before ``cutoff``; returns how many moved"""
+    latest = Conversation.objects.filter(pk=conversation_id).values_list("last_message_id", flat=True).first()
+    due = (
+        Message.objects.filter(conversation_id=conversation_id, sent_at__lt=cutoff)
+        .exclude(pk=latest)
+        .order_by("sent_at", "message_id")
+    )
+    if dry_run:
+        return due.count()
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(due.values(*COLUMNS)[:batch_size])
+            if not batch:
+                break
+            ArchivedMessage.objects.bulk_create([ArchivedMessage(**row) for row in batch])
+            Message.objects.filter(pk__in=[row["message_id"] for row in batch]).delete()
+        moved += len(batch)
+        if len(batch) < batch_size:
+            break
+    return moved
+
+
+def archive_due_messages(now=None, conversation_ids=None, batch_size=None, dry_run=False):
+    """Archive everything that is due; returns ``{conversation_id: messages moved}``"""
+    batch_size = batch_size or getattr(settings, "CHATS_ARCHIVE_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    moved = {}
+    for conversation_id, cutoff in due_conversations(now, conversation_ids):
+        count = archive_conversation(conversation_id, cutoff, batch_size=batch_size, dry_run=dry_run)
+        if count:
+            moved[conversation_id] = count
+    return moved
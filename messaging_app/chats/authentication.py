@@ -0,0 +1,136 @@
+"""
+Bearer token authentication backed by :class:`chats.models.AuthToken`.
+
+Authenticating a request costs one SHA-256 of the presented token and, on a
+cache miss, one indexed lookup. This replaces a PBKDF2 password hash per
+request under Basic auth. Resolved tokens are kept in a bounded in-process
+LRU. Revoking a token or saving or deleting its user evicts the entry
+immediately in this process. Other processes notice within
+``CHATS_TOKEN_CACHE_TTL`` seconds.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .models import AuthToken
+
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 60
+
+
+class TokenCache:
+    """
+    Thread-safe LRU of token digest -> (user, expires_at, cached_at).
+
+    The cached ``User`` is never handed out: ``put`` stores a copy and ``get``
+    returns a fresh copy, so a request that sets attributes on
+    ``request.user`` cannot leak them into other requests or threads.
+    """
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.ttl:
+                self._drop(digest)
+                return None
+            self._entries.move_to_end(digest)
+            return copy.copy(entry[0]), entry[1], entry[2]
+
+    def put(self, digest, user, expires_at):
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+            self._entries[digest] = (copy.copy(user), expires_at, time.monotonic())
+            self._by_user.setdefault(user.pk, set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, digest):
+        with self._lock:
+            if digest in self._entries:
+                self._drop(digest)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for digest in list(self._by_user.get(user_id, ())):
+                self._drop(digest)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, digest):
+        user = self._entries.pop(digest)[0]
+        digests = self._by_user.get(user.pk)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[user.pk]
+
+
+token_cache = TokenCache(
+    max_entries=getattr(settings, "CHATS_TOKEN_CACHE_SIZE", DEFAULT_CACHE_SIZE),
+    ttl=getattr(settings, "CHATS_TOKEN_CACHE_TTL", DEFAULT_CACHE_TTL),
+)
+
+
+class HashedTokenAuthentication(BaseAuthentication):
+    """``Authorization: Bearer <token>``"""
+    keyword = "Bearer"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        try:
+            raw = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed("Invalid token header.")
+        return self.authenticate_credentials(raw)
+
+    def authenticate_credentials(self, raw):
+        digest = AuthToken.hash(raw)
+        entry = token_cache.get(digest)
+        if entry is None:
+            token = (
+                AuthToken.objects.select_related("user")
+                .filter(digest=digest, revoked_at__isnull=True)
+                .first()
+            )
+            if token is None:
+                raise exceptions.AuthenticationFailed("Invalid token.")
+            token_cache.put(digest, token.user, token.expires_at)
+            user, expires_at = token.user, token.expires_at
+        else:
+            user, expires_at = entry[0], entry[1]
+
+        if expires_at is not None and expires_at <= timezone.now():
+            token_cache.invalidate(digest)
+            raise exceptions.AuthenticationFailed("Token has expired.")
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        return user, digest
+
+    def authenticate_header(self, request):
+        return self.keyword
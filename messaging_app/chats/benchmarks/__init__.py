@@ -0,0 +1,83 @@
+"""
+Reproducible performance benchmarks for the chats app.
+
+Each suite is a module in this package exposing ``run(options)`` and returning
+a JSON-serializable dict; ``manage.py benchmark <suite>`` runs it against a
+throwaway database seeded by :mod:`chats.benchmarks.data`. A suite may also
+define ``add_arguments(parser)`` for its own options and ``check(results,
+options)`` returning failures that make the command exit non-zero (for CI).
+"""
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+SUITES = {
+    "api": "chats.benchmarks.api",
+    "auth": "chats.benchmarks.auth",
+    "concurrency": "chats.benchmarks.concurrency",
+    "instrumentation": "chats.benchmarks.instrumentation",
+    "search": "chats.benchmarks.search",
+}
+
+
+@contextmanager
+def scratch_database(using="default", on_disk=False):
+    """
+    Point ``using`` at a freshly migrated test database for the duration of the block.
+
+    The test environment is set up as well (DEBUG off, ``testserver`` allowed)
+    so suites can drive the API with the test client. ``on_disk`` puts the
+    database in a temporary file instead of SQLite's shared in-memory test
+    database, for suites that need real file locking between connections.
+    """
+    connection = connections[using]
+    old_name = connection.settings_dict["NAME"]
+    old_test_name = connection.settings_dict["TEST"].get("NAME")
+    workdir = None
+    if on_disk:
+        workdir = tempfile.mkdtemp(prefix="chats-bench-")
+        connection.settings_dict["TEST"]["NAME"] = str(Path(workdir) / "bench.sqlite3")
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        connection.settings_dict["TEST"]["NAME"] = old_test_name
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def timed(func, repeat):
+    """Call ``func`` ``repeat`` times and return the wall time of each call in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    return {
+        "n": len(samples),
+        "mean_ms": round(statistics.fmean(samples), 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p99_ms": round(percentile(samples, 99), 3),
+    }
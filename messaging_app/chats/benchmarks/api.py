@@ -0,0 +1,121 @@
+"""
+Query count, latency and payload size for every route in ``chats/urls.py``.
+
+The SSE stream is left out: it is a long-lived connection, not a request.
+The ``-compact`` routes are the same reads with ``?repr=compact``.
+Read routes are measured with the response cache cleared before every
+sample, so the numbers describe the database path. With ``--check-budgets``
+the run fails when a route issues more queries than ``budgets.json`` allows;
+``--record-budgets`` rewrites that file from the current run.
+"""
+import json
+import time
+from pathlib import Path
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chats.benchmarks import summarize
+from chats.benchmarks.data import WORDS
+from chats.models import Conversation, Message
+
+BUDGETS_PATH = Path(__file__).with_name("budgets.json")
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--check-budgets", action="store_true",
+        help="Fail when a route exceeds its query budget in chats/benchmarks/budgets.json",
+    )
+    parser.add_argument(
+        "--record-budgets", action="store_true",
+        help="Write the measured query counts to chats/benchmarks/budgets.json",
+    )
+
+
+def routes(user, conversation, message, other_user):
+    """(name, method, url, payload) for each measured route"""
+    conversation_url = reverse("conversation-detail", args=[conversation.pk])
+    messages_url = reverse("conversation-messages-list", args=[conversation.pk])
+    return [
+        ("conversation-list", "get", reverse("conversation-list"), None),
+        ("conversation-create", "post", reverse("conversation-list"),
+         {"participants": [str(user.pk), str(other_user.pk)]}),
+        ("conversation-detail", "get", conversation_url, None),
+        ("conversation-detail-compact", "get", conversation_url, {"repr": "compact"}),
+        ("conversation-inbox", "get", reverse("conversation-inbox"), None),
+        ("conversation-search", "get", reverse("conversation-search-messages"), {"search": WORDS[300]}),
+        ("message-list", "get", messages_url, {"page_size": 20}),
+        ("message-list-compact", "get", messages_url, {"page_size": 20, "repr": "compact"}),
+        ("message-list-later-page", "get", messages_url, "next-page"),
+        ("message-detail", "get", reverse("conversation-messages-detail", args=[conversation.pk, message.pk]), None),
+        ("message-create", "post", messages_url, {"message_body": "benchmark message"}),
+        ("message-bulk-create", "post", reverse("message-bulk-create"), {"messages": [
+            {"conversation": str(conversation.pk), "message_body": f"bulk {i}"} for i in range(50)
+        ]}),
+    ]
+
+
+def measure(client, method, url, payload, repeat):
+    cache = caches["default"]
+    samples, queries, sizes, status = [], [], [], None
+    for _ in range(repeat):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            if method == "get":
+                response = client.get(url, payload)
+            else:
+                response = client.post(url, payload, format="json")
+            samples.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+        queries.append(len(ctx.captured_queries))
+        sizes.append(len(response.content))
+    return {
+        "status": status,
+        "queries": max(queries),
+        "bytes": max(sizes),
+        **summarize(samples),
+    }
+
+
+def run(options):
+    users = options["seeded_users"]
+    # The busiest conversation makes the per-row costs visible.
+    conversation = Conversation.objects.order_by("-message_count").first()
+    user = conversation.participants.first()
+    other_user = next(u for u in users if u.pk != user.pk)
+    message = Message.objects.filter(conversation=conversation).first()
+
+    client = APIClient()
+    client.force_authenticate(user)
+
+    results = {}
+    for name, method, url, payload in routes(user, conversation, message, other_user):
+        if payload == "next-page":
+            # Falls back to the first page when the conversation has only one.
+            url, payload = client.get(url, {"page_size": 20}).json()["next"] or url, None
+        results[name] = measure(client, method, url, payload, options["repeat"])
+
+    if options.get("record_budgets"):
+        budgets = {name: result["queries"] for name, result in results.items()}
+        BUDGETS_PATH.write_text(json.dumps(budgets, indent=2, sort_keys=True) + "\n")
+    return results
+
+
+def check(results, options):
+    """Budget violations as human-readable strings; empty when the run is within budget"""
+    if not options.get("check_budgets"):
+        return []
+    budgets = json.loads(BUDGETS_PATH.read_text())
+    violations = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            violations.append(f"{name}: no query budget recorded")
+        elif result["queries"] > budget:
+            violations.append(f"{name}: {result['queries']} queries, budget is {budget}")
+    return violations
@@ -0,0 +1,46 @@
+"""Requests per second with Basic auth (PBKDF2 per request) versus bearer tokens."""
+import base64
+import time
+
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from chats.authentication import token_cache
+from chats.models import AuthToken, Conversation, Message
+
+PASSWORD = "benchmark-password"
+
+
+def add_arguments(parser):
+    parser.add_argument("--requests", type=int, default=200, help="Requests per authentication scheme")
+
+
+def requests_per_second(client, url, headers, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(url, **headers)
+        assert response.status_code == 200, response.status_code
+    elapsed = time.perf_counter() - started
+    return {"requests": count, "seconds": round(elapsed, 3), "rps": round(count / elapsed, 1)}
+
+
+def run(options):
+    conversation = Conversation.objects.order_by("-message_count").first()
+    user = conversation.participants.first()
+    user.set_password(PASSWORD)  # the project's real hasher, as in production
+    user.save()
+    message = Message.objects.filter(conversation=conversation).first()
+    url = reverse("conversation-messages-detail", args=[conversation.pk, message.pk])
+
+    basic = base64.b64encode(f"{user.email}:{PASSWORD}".encode()).decode()
+    _, raw = AuthToken.issue(user)
+    token_cache.clear()
+
+    client = APIClient()
+    count = options["requests"]
+    results = {
+        "basic": requests_per_second(client, url, {"HTTP_AUTHORIZATION": f"Basic {basic}"}, count),
+        "bearer": requests_per_second(client, url, {"HTTP_AUTHORIZATION": f"Bearer {raw}"}, count),
+    }
+    results["speedup"] = round(results["bearer"]["rps"] / results["basic"]["rps"], 1)
+    return results
@@ -0,0 +1,151 @@
+"""
+Concurrent readers and writers under each SQLite profile in ``messaging_app.db``.
+
+Writers run the send path as a read-then-write transaction (look up the
+conversation, insert the message, update the inbox columns); readers page
+through messages and load the inbox. The ``default`` profile's deferred
+transactions turn that read-then-write pattern into "database is locked"
+errors under contention, and its rollback journal makes readers wait on
+every commit; the ``production`` profile removes both.
+"""
+import random
+import sqlite3
+import threading
+import time
+
+from django.db import OperationalError, connection, connections, transaction
+
+from chats.benchmarks import summarize
+from chats.models import Conversation, Message
+from messaging_app.db import PROFILES, sqlite_database
+
+SCRATCH_ON_DISK = True
+
+
+def add_arguments(parser):
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per profile")
+
+
+def apply_profile(profile):
+    """Reconfigure the default alias in place; threads open new connections from it"""
+    connections.close_all()
+    settings_dict = connections.settings["default"]
+    path = settings_dict["NAME"]
+    configured = sqlite_database(path, profile)
+    settings_dict["OPTIONS"] = configured["OPTIONS"]
+    settings_dict["CONN_MAX_AGE"] = configured["CONN_MAX_AGE"]
+    # journal_mode is stored in the file; reset it so each profile starts from its own mode.
+    mode = PROFILES[profile]["pragmas"].get("journal_mode", "DELETE")
+    with sqlite3.connect(path) as raw:
+        raw.execute(f"PRAGMA journal_mode={mode}")
+
+
+class Tally:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {"write": [], "read": []}
+        self.errors = {"write": 0, "read": 0}
+
+    def record(self, kind, started, failed):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            if failed:
+                self.errors[kind] += 1
+            else:
+                self.latencies[kind].append(elapsed)
+
+
+def writer(conversations, users_by_conversation, deadline, tally, rng):
+    while time.perf_counter() < deadline:
+        conversation_id = rng.choice(conversations)
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                conversation = Conversation.objects.get(pk=conversation_id)
+                message = Message.objects.create(
+                    conversation=conversation,
+                    sender_id=rng.choice(users_by_conversation[conversation_id]),
+                    message_body="concurrency benchmark",
+                )
+                Conversation.record_message(message)
+        except OperationalError:
+            tally.record("write", started, failed=True)
+        else:
+            tally.record("write", started, failed=False)
+
+
+def reader(conversations, users, deadline, tally, rng):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            list(
+                Message.objects.filter(conversation_id=rng.choice(conversations))
+                .select_related("sender").order_by("sent_at", "message_id")[:50]
+            )
+            list(
+                Conversation.objects.filter(participants=rng.choice(users))
+                .order_by("-last_message_at", "-conversation_id")[:20]
+            )
+        except OperationalError:
+            tally.record("read", started, failed=True)
+        else:
+            tally.record("read", started, failed=False)
+
+
+def run_profile(profile, options, conversations, users_by_conversation, users):
+    apply_profile(profile)
+    tally = Tally()
+    deadline = time.perf_counter() + options["duration"]
+
+    def thread_main(target, seed, *args):
+        try:
+            target(*args, deadline, tally, random.Random(seed))
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=thread_main, args=(writer, i, conversations, users_by_conversation))
+        for i in range(options["writers"])
+    ] + [
+        threading.Thread(target=thread_main, args=(reader, 1000 + i, conversations, users))
+        for i in range(options["readers"])
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        kind: {
+            "ops_per_sec": round(len(tally.latencies[kind]) / elapsed, 1),
+            "lock_errors": tally.errors[kind],
+            **summarize(tally.latencies[kind]),
+        }
+        for kind in ("write", "read")
+    }
+
+
+def run(options):
+    users = [u.pk for u in options["seeded_users"]]
+    through = Conversation.participants.through
+    users_by_conversation = {}
+    for conversation_id, user_id in through.objects.values_list("conversation_id", "user_id"):
+        users_by_conversation.setdefault(conversation_id, []).append(user_id)
+    conversations = list(users_by_conversation)
+    connections.close_all()
+
+    results = {
+        profile: run_profile(profile, options, conversations, users_by_conversation, users)
+        for profile in ("default", "production")
+    }
+    connections.close_all()
+    base, tuned = results["default"], results["production"]
+    results["improvement"] = {
+        f"{kind}_throughput_x": round(tuned[kind]["ops_per_sec"] / max(base[kind]["ops_per_sec"], 0.1), 2)
+        for kind in ("write", "read")
+    }
+    return results
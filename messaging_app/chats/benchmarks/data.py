@@ -0,0 +1,87 @@
+"""Synthetic users, conversations and messages for benchmarks."""
+import itertools
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from chats.models import Conversation, Message, User
+
+COMMON_WORDS = (
+    "the and you for that this with have are not but what all can just was "
+    "meeting lunch invoice flight hotel booking review deploy release ticket "
+    "weekend schedule payment refund address parcel delivery photo video call"
+).split()
+SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+
+
+def vocabulary(size=20_000):
+    """Common words followed by pronounceable filler words, most frequent first"""
+    filler = ("".join(parts) for parts in itertools.product(SYLLABLES, repeat=3))
+    return COMMON_WORDS + list(itertools.islice(filler, max(0, size - len(COMMON_WORDS))))
+
+
+WORDS = vocabulary()
+# Zipf-distributed word frequencies, like natural language: the n-th word is
+# about 1/n as frequent as the first, so rare terms are genuinely selective.
+_CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+def random_body(rng, min_words=3, max_words=24):
+    count = rng.randint(min_words, max_words)
+    return " ".join(rng.choices(WORDS, cum_weights=_CUM_WEIGHTS, k=count))
+
+
+def seed(users=50, conversations=200, messages=10_000, participants=(2, 4), batch_size=5_000, seed=0):
+    """
+    Bulk-insert a deterministic data set and return the created users and conversations.
+
+    Inbox columns are recomputed with :meth:`Conversation.refresh_inbox` at the
+    end, so the data looks exactly like data written through the API.
+    """
+    rng = random.Random(seed)
+    password = make_password(None)
+    with transaction.atomic():
+        user_rows = User.objects.bulk_create(
+            User(
+                user_id=uuid.UUID(int=rng.getrandbits(128)),
+                username=f"bench{i}",
+                email=f"bench{i}@example.com",
+                first_name=f"Bench{i}",
+                last_name="User",
+                password=password,
+            )
+            for i in range(users)
+        )
+        conversation_rows = Conversation.objects.bulk_create(
+            Conversation(conversation_id=uuid.UUID(int=rng.getrandbits(128)))
+            for _ in range(conversations)
+        )
+        members = {}
+        through = Conversation.participants.through
+        links = []
+        for conversation in conversation_rows:
+            chosen = rng.sample(user_rows, min(len(user_rows), rng.randint(*participants)))
+            members[conversation.pk] = chosen
+            links.extend(through(conversation_id=conversation.pk, user_id=u.pk) for u in chosen)
+        through.objects.bulk_create(links, batch_size=batch_size)
+
+        remaining = messages
+        while remaining > 0:
+            batch = []
+            for _ in range(min(batch_size, remaining)):
+                conversation = rng.choice(conversation_rows)
+                batch.append(Message(
+                    message_id=uuid.UUID(int=rng.getrandbits(128)),
+                    conversation_id=conversation.pk,
+                    sender_id=rng.choice(members[conversation.pk]).pk,
+                    message_body=random_body(rng),
+                ))
+            Message.objects.bulk_create(batch)
+            remaining -= len(batch)
+
+        for start in range(0, len(conversation_rows), batch_size):
+            Conversation.refresh_inbox([c.pk for c in conversation_rows[start:start + batch_size]])
+    return user_rows, conversation_rows
+
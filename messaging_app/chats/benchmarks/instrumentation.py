@@ -0,0 +1,90 @@
+"""
+Overhead of ``PerformanceMiddleware`` and the query wrapper behind it.
+
+Each read route from the API suite is requested with the middleware in
+``MIDDLEWARE`` and without it, alternating, so drift on the machine affects
+both sides alike. A separate measurement times a single-row query with the
+wrapper absent, installed but idle (outside a request) and recording.
+The response cache is cleared before every request.
+"""
+import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import modify_settings
+from rest_framework.test import APIClient
+
+from chats import metrics
+from chats.benchmarks import summarize
+from chats.benchmarks.api import routes
+from chats.models import Conversation, Message, User
+
+MIDDLEWARE = "chats.middleware.PerformanceMiddleware"
+
+
+def request_overhead(user, conversation, message, other_user, repeat):
+    with modify_settings(MIDDLEWARE={"remove": MIDDLEWARE}):
+        plain = APIClient()
+        plain.force_authenticate(user)
+        plain.get("/api/conversations/inbox/")  # build the handler while the setting is in effect
+    instrumented = APIClient()
+    instrumented.force_authenticate(user)
+
+    cache = caches["default"]
+    results = {}
+    for name, method, url, payload in routes(user, conversation, message, other_user):
+        if method != "get" or payload == "next-page":
+            continue
+        samples = {"off": [], "on": []}
+        for _ in range(repeat):
+            for mode, client in (("off", plain), ("on", instrumented)):
+                cache.clear()
+                start = time.perf_counter()
+                client.get(url, payload)
+                samples[mode].append((time.perf_counter() - start) * 1000)
+        off, on = summarize(samples["off"]), summarize(samples["on"])
+        results[name] = {
+            "off_p50_ms": off["p50_ms"],
+            "on_p50_ms": on["p50_ms"],
+            "overhead_ms": round(on["p50_ms"] - off["p50_ms"], 3),
+            "overhead_pct": round((on["p50_ms"] - off["p50_ms"]) / off["p50_ms"] * 100, 1),
+        }
+    return results
+
+
+def query_overhead(repeat):
+    """Microseconds per query for each wrapper state"""
+    pk = User.objects.values_list("pk", flat=True).first()
+    query = User.objects.filter(pk=pk)
+
+    def per_query():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query.exists()
+        return round((time.perf_counter() - start) / repeat * 1e6, 2)
+
+    connection.ensure_connection()
+    connection.execute_wrappers.remove(metrics.record_queries)
+    try:
+        unwrapped = per_query()
+    finally:
+        metrics.install(connection)
+    idle = per_query()
+    timings, token = metrics.start_request()
+    try:
+        recording = per_query()
+    finally:
+        metrics.end_request(token)
+    return {"no_wrapper_us": unwrapped, "idle_us": idle, "recording_us": recording}
+
+
+def run(options):
+    users = options["seeded_users"]
+    conversation = Conversation.objects.order_by("-message_count").first()
+    user = conversation.participants.first()
+    other_user = next(u for u in users if u.pk != user.pk)
+    message = Message.objects.filter(conversation=conversation).first()
+    return {
+        "requests": request_overhead(user, conversation, message, other_user, options["repeat"]),
+        "per_query": query_overhead(options["repeat"] * 100),
+    }
@@ -0,0 +1,44 @@
+"""FTS5 search versus the previous ``icontains`` scan."""
+from chats.benchmarks import summarize, timed
+from chats.benchmarks.data import WORDS
+from chats.models import Message
+from chats.search import search_messages
+
+# Frequent, mid-frequency and rare terms, a prefix, a conjunction and a miss.
+QUERIES = [WORDS[20], WORDS[500], WORDS[15_000], WORDS[500][:4], f"{WORDS[40]} {WORDS[900]}", "nomatchterm"]
+
+
+def run(options):
+    users = options["seeded_users"]
+    repeat = options["repeat"]
+    results = {}
+    for text in QUERIES:
+        for user in users[:3]:
+            base = Message.objects.filter(conversation__participants=user)
+
+            def fts():
+                qs = search_messages(base, text).order_by("search_rank", "message_id")
+                return list(qs.values_list("pk", flat=True)[:20])
+
+            def icontains():
+                # The old SearchFilter path: every term must appear in the body.
+                qs = base
+                for term in text.split():
+                    qs = qs.filter(message_body__icontains=term)
+                return list(qs.values_list("pk", flat=True)[:20])
+
+            fts_samples = timed(fts, repeat)
+            like_samples = timed(icontains, repeat)
+            entry = results.setdefault(text, {"fts": [], "icontains": []})
+            entry["fts"].extend(fts_samples)
+            entry["icontains"].extend(like_samples)
+
+    report = {}
+    for text, samples in results.items():
+        fts, like = summarize(samples["fts"]), summarize(samples["icontains"])
+        report[text] = {
+            "fts": fts,
+            "icontains": like,
+            "speedup_p50": round(like["p50_ms"] / max(fts["p50_ms"], 1e-3), 1),
+        }
+    return report
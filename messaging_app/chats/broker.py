@@ -0,0 +1,131 @@
+"""
+Publish/subscribe fan-out of new messages to streaming connections.
+
+Publishers never block: every connection owns a bounded queue, and a consumer
+that falls ``maxsize`` events behind is cut off with an overflow marker so it
+can resynchronise through the REST cursor instead of holding memory hostage.
+The broker class is chosen by the ``CHATS_BROKER`` setting, so a multi-node
+backend (Redis, Postgres LISTEN/NOTIFY, ...) only has to implement
+:class:`BaseBroker`.
+"""
+import asyncio
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = "chats.broker.InMemoryBroker"
+DEFAULT_QUEUE_SIZE = 100
+
+# Sentinel delivered in place of an event once a subscription overflowed or closed.
+OVERFLOW = object()
+CLOSED = object()
+
+
+def conversation_channel(conversation_id):
+    return f"conversation:{conversation_id}"
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Subscription:
+    """One connection's bounded inbox on a channel"""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=maxsize + 1)  # one slot reserved for the sentinel
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.closed = False
+        self.loop = _running_loop()
+
+    def deliver(self, event):
+        """Hand ``event`` to the consumer from any thread"""
+        if self.loop is None or _running_loop() is self.loop:
+            self._put(event)
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._put, event)
+            except RuntimeError:  # the connection's event loop has shut down
+                self.broker.unsubscribe(self)
+
+    def _put(self, event):
+        if self.closed:
+            return
+        if self.queue.qsize() >= self.maxsize:
+            self.overflowed = self.closed = True
+            self.queue.put_nowait(OVERFLOW)
+            self.broker.unsubscribe(self)
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Next event, ``OVERFLOW``/``CLOSED`` once the subscription ended; raises ``TimeoutError``"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(CLOSED)
+        self.broker.unsubscribe(self)
+
+
+class BaseBroker:
+    """Interface every broker backend implements"""
+
+    def subscribe(self, channel, maxsize=None):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, event):
+        """Deliver ``event`` to the channel's subscribers and return how many there were"""
+        raise NotImplementedError
+
+
+class InMemoryBroker(BaseBroker):
+    """Single-process broker: subscribers must live in the same process as publishers"""
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or getattr(settings, "CHATS_STREAM_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel, maxsize=None):
+        subscription = Subscription(self, channel, maxsize or self.queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return len(subscribers)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    """The process-wide broker configured by ``CHATS_BROKER``"""
+    return import_string(getattr(settings, "CHATS_BROKER", DEFAULT_BROKER))()
@@ -0,0 +1,151 @@
+"""
+Response cache for conversation reads, invalidated by a per-conversation version.
+
+Every write that can change what a conversation's read endpoints return bumps
+that conversation's version (see :mod:`chats.signals`). Cached bodies and
+ETags embed the version, so a bump invalidates them all at once without
+having to find and delete individual keys.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULT_TIMEOUT = 300
+
+
+def _cache():
+    return caches[getattr(settings, "CHATS_RESPONSE_CACHE", "default")]
+
+
+def _timeout():
+    return getattr(settings, "CHATS_RESPONSE_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def _canonical(conversation_id):
+    """The ``str(UUID)`` form, so upper-case or undashed URL pks share keys with the bumps"""
+    try:
+        return str(uuid.UUID(str(conversation_id)))
+    except ValueError:
+        return str(conversation_id)
+
+
+def _version_key(conversation_id):
+    return f"chats:conversation-version:{_canonical(conversation_id)}"
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters for the response cache"""
+
+    FIELDS = ("hits", "misses", "not_modified", "bumps")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field):
+        with self._lock:
+            self._counts[field] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        served = counts["hits"] + counts["misses"] + counts["not_modified"]
+        counts["hit_ratio"] = round((counts["hits"] + counts["not_modified"]) / served, 4) if served else 0.0
+        return counts
+
+
+stats = CacheStats()
+
+
+def conversation_version(conversation_id):
+    """
+    Current version of a conversation's cached representations.
+
+    A missing version (first read, or evicted) starts from the clock rather
+    than 1, so it can never collide with a version that was used before.
+    """
+    cache = _cache()
+    key = _version_key(conversation_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_conversation_version(conversation_id):
+    """Invalidate everything cached for the conversation once the current transaction commits"""
+    def bump():
+        cache = _cache()
+        key = _version_key(conversation_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+        stats.incr("bumps")
+    transaction.on_commit(bump)
+
+
+def _fingerprint(request, version):
+    accept = request.accepted_renderer.media_type if hasattr(request, "accepted_renderer") else ""
+    raw = f"{version}|{request.build_absolute_uri()}|{accept}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def _etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    candidates = {tag.strip() for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class VersionedResponseCacheMixin:
+    """
+    View mixin that serves ``cached_response()`` bodies from the cache and answers
+    ``If-None-Match`` with 304 using only the version lookup.
+    """
+    cache_skip_params = ("search",)
+
+    def cached_response(self, request, conversation_id, build):
+        if any(param in request.query_params for param in self.cache_skip_params):
+            return build()
+
+        version = conversation_version(conversation_id)
+        fingerprint = _fingerprint(request, version)
+        etag = f'"{fingerprint}"'
+        if _etag_matches(request, etag):
+            stats.incr("not_modified")
+            return self._tag(Response(status=status.HTTP_304_NOT_MODIFIED), etag, "REVALIDATED")
+
+        key = f"chats:response:{_canonical(conversation_id)}:{fingerprint}"
+        cache = _cache()
+        cached = cache.get(key)
+        if cached is not None:
+            stats.incr("hits")
+            return self._tag(Response(cached), etag, "HIT")
+
+        stats.incr("misses")
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=_timeout())
+            self._tag(response, etag, "MISS")
+        return response
+
+    @staticmethod
+    def _tag(response, etag, outcome):
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        response["X-Cache"] = outcome
+        return response
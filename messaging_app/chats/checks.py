@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core import checks
+
+from .jobs import DEFAULT_WORKERS
+
+
+@checks.register(checks.Tags.compatibility, deploy=True)
+def check_job_workers(app_configs, **kwargs):
+    """Background jobs pile up unseen when nothing runs them"""
+    if getattr(settings, "CHATS_JOB_WORKERS", DEFAULT_WORKERS):
+        return []
+    return [
+        checks.Warning(
+            "CHATS_JOB_WORKERS is 0, so message fan-out and other jobs only run while "
+            "`manage.py run_workers` is running.",
+            hint="Run `manage.py run_workers` alongside the web processes, or set MESSAGING_JOB_WORKERS.",
+            id="chats.W001",
+        )
+    ]
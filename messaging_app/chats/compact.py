@@ -0,0 +1,78 @@
+"""
+Compact read representation of messages and conversations.
+
+Built straight from ``values()`` rows instead of model instances and
+``ModelSerializer`` fields: a message's sender shrinks to ``user_id`` and
+``display_name``, and every other field is formatted exactly as the regular
+serializers format it. Clients opt in with ``?repr=compact``; a view can make
+it the default with ``compact_reads = True``.
+"""
+from django.core.exceptions import ValidationError
+from rest_framework import serializers
+
+from .models import Conversation, Message, User
+
+REPR_PARAM = "repr"
+MESSAGE_FIELDS = (
+    "message_id", "conversation_id", "message_body", "sent_at",
+    "sender_id", "sender__username", "sender__first_name", "sender__last_name",
+)
+USER_FIELDS = ("user_id", "username", "first_name", "last_name")
+
+_datetime = serializers.DateTimeField()
+
+
+def wants_compact(request, view=None):
+    value = request.query_params.get(REPR_PARAM)
+    if value is not None:
+        return value == "compact"
+    return getattr(view, "compact_reads", False)
+
+
+def display_name(username, first_name, last_name):
+    return f"{first_name} {last_name}".strip() or username
+
+
+def message_rows(queryset):
+    """``values()`` rows carrying everything the compact message needs, in one query"""
+    return queryset.values(*MESSAGE_FIELDS)
+
+
+def compact_message(row):
+    return {
+        "message_id": str(row["message_id"]),
+        "sender": {
+            "user_id": str(row["sender_id"]),
+            "display_name": display_name(
+                row["sender__username"], row["sender__first_name"], row["sender__last_name"]
+            ),
+        },
+        "conversation": str(row["conversation_id"]),
+        "message_body": row["message_body"],
+        "sent_at": _datetime.to_representation(row["sent_at"]),
+    }
+
+
+def compact_user(row):
+    return {
+        "user_id": str(row["user_id"]),
+        "display_name": display_name(row["username"], row["first_name"], row["last_name"]),
+    }
+
+
+def compact_conversation(conversation_id):
+    """The conversation detail in three narrow queries, or ``None`` if it does not exist"""
+    try:
+        conversation = Conversation.objects.filter(pk=conversation_id).values("conversation_id", "created_at").first()
+    except ValidationError:
+        return None
+    if conversation is None:
+        return None
+    participants = User.objects.filter(conversations=conversation_id).values(*USER_FIELDS)
+    messages = message_rows(Message.objects.filter(conversation_id=conversation_id).order_by("sent_at"))
+    return {
+        "conversation_id": str(conversation["conversation_id"]),
+        "participants": [compact_user(row) for row in participants],
+        "messages": [compact_message(row) for row in messages],
+        "created_at": _datetime.to_representation(conversation["created_at"]),
+    }
@@ -0,0 +1,198 @@
+"""
+Durable background jobs for work that must not delay a request.
+
+:func:`enqueue` inserts a :class:`~chats.models.Job` row in the caller's
+transaction, so the job commits or rolls back with the data it refers to.
+Workers claim due jobs in batches with one conditional UPDATE, which lets
+any number of worker threads and processes share the table, and run each
+job outside a transaction. A job that raises is retried with exponential
+backoff and jitter until ``max_attempts``; a claim older than
+``CHATS_JOB_LEASE`` seconds (its worker died) goes back to the queue, or
+fails once it has used its attempts, so a task must tolerate running more
+than once.
+
+Workers run inside the web process (``CHATS_JOB_WORKERS`` threads, started
+by the first commit that enqueues) or standalone with ``manage.py run_workers``.
+With no in-process workers, ``manage.py check --deploy`` warns that jobs
+only run under ``run_workers`` (``chats.W001``).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 0
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_LEASE = 300
+DEFAULT_RETRY_BASE = 5.0
+DEFAULT_RETRY_MAX = 3600.0
+
+TASKS = {}
+
+
+def task(name=None, max_attempts=5):
+    """Register a function as a job task, run as ``func(**payload)``"""
+    def register(func):
+        func.task_name = name or f"{func.__module__}.{func.__name__}"
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return register
+
+
+def enqueue(func, payload=None, delay=0, using=None):
+    """Queue ``func(**payload)``; workers see it once the current transaction commits"""
+    job = Job.objects.using(using).create(
+        task=func.task_name,
+        payload=payload or {},
+        max_attempts=func.max_attempts,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    transaction.on_commit(wake, using=using)
+    return job
+
+
+def retry_delay(attempts):
+    """Seconds before retrying after the ``attempts``-th failure: doubling, capped, with equal jitter"""
+    base = getattr(settings, "CHATS_JOB_RETRY_BASE", DEFAULT_RETRY_BASE)
+    cap = getattr(settings, "CHATS_JOB_RETRY_MAX", DEFAULT_RETRY_MAX)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def claim(worker_id, limit, now=None):
+    """Mark up to ``limit`` due jobs as running for this worker and return them"""
+    now = now or timezone.now()
+    lease = getattr(settings, "CHATS_JOB_LEASE", DEFAULT_LEASE)
+    expired = Job.objects.filter(status=Job.RUNNING, claimed_at__lt=now - timedelta(seconds=lease))
+    # The lost run was counted when it was claimed; a job that keeps killing its worker ends up failed.
+    failed = expired.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, claimed_by="", failed_at=now, last_error="Lease expired: the worker stopped mid-run"
+    )
+    requeued = expired.update(status=Job.QUEUED, claimed_by="")
+    if failed or requeued:
+        logger.warning("Lease expired on %s jobs: %s requeued, %s failed", failed + requeued, requeued, failed)
+    token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by("run_at").values("pk")[:limit]
+    # The status condition makes a job lost to a concurrent claim simply not match.
+    claimed = Job.objects.filter(pk__in=due, status=Job.QUEUED).update(
+        status=Job.RUNNING, claimed_by=token, claimed_at=now, attempts=F("attempts") + 1
+    )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status=Job.RUNNING, claimed_by=token).order_by("run_at"))
+
+
+def run_job(job):
+    """Run a claimed job; delete it on success, reschedule or fail it otherwise. Returns True on success."""
+    func = TASKS.get(job.task)
+    try:
+        if func is None:
+            raise LookupError(f"Unknown task {job.task!r}")
+        func(**job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %s", job.pk, job.task, job.attempts)
+        mine = Job.objects.filter(pk=job.pk, status=Job.RUNNING, claimed_by=job.claimed_by)
+        error = traceback.format_exc()
+        if func is None or job.attempts >= job.max_attempts:
+            mine.update(status=Job.FAILED, last_error=error, failed_at=timezone.now(), claimed_by="")
+        else:
+            run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+            mine.update(status=Job.QUEUED, last_error=error, run_at=run_at, claimed_by="")
+        return False
+    Job.objects.filter(pk=job.pk, claimed_by=job.claimed_by).delete()
+    return True
+
+
+def drain(worker_id, batch_size=None):
+    """Run due jobs until there are none left; returns how many ran"""
+    batch_size = batch_size or getattr(settings, "CHATS_JOB_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    ran = 0
+    while True:
+        jobs = claim(worker_id, batch_size)
+        if not jobs:
+            return ran
+        for job in jobs:
+            run_job(job)
+        ran += len(jobs)
+
+
+class WorkerPool:
+    """Threads that drain the queue, woken by :meth:`notify` or every ``poll_interval`` seconds"""
+
+    def __init__(self, workers, batch_size=None, poll_interval=None, name=None):
+        self.workers = workers
+        self.batch_size = batch_size or getattr(settings, "CHATS_JOB_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        self.poll_interval = poll_interval or getattr(settings, "CHATS_JOB_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, args=(f"{self.name}:{index}",), name=f"chats-worker-{index}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Let every worker finish its current batch and exit"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def _run(self, worker_id):
+        try:
+            while not self._stop.is_set():
+                try:
+                    ran = drain(worker_id, self.batch_size)
+                except Exception:
+                    logger.exception("Worker %s could not claim jobs", worker_id)
+                    ran = 0
+                if not ran:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+        finally:
+            connections.close_all()
+
+
+@lru_cache(maxsize=None)
+def get_worker_pool():
+    """This process's pool of ``CHATS_JOB_WORKERS`` threads (not started)"""
+    return WorkerPool(getattr(settings, "CHATS_JOB_WORKERS", DEFAULT_WORKERS))
+
+
+def wake():
+    """Start the in-process workers if configured and have them look for jobs"""
+    pool = get_worker_pool()
+    if pool.workers:
+        pool.start()
+        pool.notify()
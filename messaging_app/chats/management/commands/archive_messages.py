@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+
+from chats.archive import archive_due_messages
+
+
+class Command(BaseCommand):
+    help = "Move messages past their archive threshold into the archive table (run from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conversation", action="append", dest="conversations", metavar="ID",
+            help="Only archive this conversation; repeat for several",
+        )
+        parser.add_argument("--batch-size", type=int, help="Messages moved per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Report what is due without moving anything")
+
+    def handle(self, *args, **options):
+        try:
+            moved = archive_due_messages(
+                conversation_ids=options["conversations"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+        except ValidationError as exc:
+            raise CommandError(" ".join(exc.messages))
+
+        verb = "Would archive" if options["dry_run"] else "Archived"
+        for conversation_id, count in moved.items():
+            self.stdout.write(f"{conversation_id}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {sum(moved.values())} messages from {len(moved)} conversations"
+        ))
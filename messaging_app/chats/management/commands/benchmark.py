@@ -0,0 +1,60 @@
+import json
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.benchmarks import SUITES, scratch_database
+from chats.benchmarks.data import seed
+
+
+class Command(BaseCommand):
+    help = "Run a chats benchmark suite against a freshly seeded scratch database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES))
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--conversations", type=int, default=200)
+        parser.add_argument("--messages", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=20, help="Samples per measurement")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the data generator")
+        parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+        for path in SUITES.values():
+            suite = import_module(path)
+            if hasattr(suite, "add_arguments"):
+                suite.add_arguments(parser)
+
+    def handle(self, *args, **options):
+        suite = import_module(SUITES[options["suite"]])
+        with scratch_database(on_disk=getattr(suite, "SCRATCH_ON_DISK", False)):
+            started = time.perf_counter()
+            users, conversations = seed(
+                users=options["users"],
+                conversations=options["conversations"],
+                messages=options["messages"],
+                seed=options["seed"],
+            )
+            seeded_in = time.perf_counter() - started
+            options.update(seeded_users=users, seeded_conversations=conversations)
+            results = suite.run(options)
+
+        report = json.dumps({
+            "suite": options["suite"],
+            "data": {
+                "users": options["users"],
+                "conversations": options["conversations"],
+                "messages": options["messages"],
+                "seed": options["seed"],
+                "seed_seconds": round(seeded_in, 2),
+            },
+            "results": results,
+        }, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(report + "\n")
+        else:
+            self.stdout.write(report)
+
+        failures = suite.check(results, options) if hasattr(suite, "check") else []
+        if failures:
+            raise CommandError("Benchmark checks failed:\n  " + "\n  ".join(failures))
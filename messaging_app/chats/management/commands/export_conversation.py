@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.export import FORMATS, ExportError, encode, export_rows, export_tiers
+from chats.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "Stream a conversation's full message history as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("conversation_id")
+        parser.add_argument("--output-format", choices=sorted(FORMATS), default="ndjson")
+        parser.add_argument("--since", help="Only messages sent at or after this ISO timestamp")
+        parser.add_argument("--after", help="Resume after this message id")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument("--file", help="Write to this path instead of stdout")
+
+    def handle(self, *args, **options):
+        conversation_id = options["conversation_id"]
+        try:
+            if not Conversation.objects.filter(pk=conversation_id).exists():
+                raise CommandError(f"Conversation {conversation_id} does not exist")
+            tiers = export_tiers(conversation_id, since=options["since"], after=options["after"])
+        except (ExportError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        lines = encode(export_rows(tiers, chunk_size=options["chunk_size"]), options["output_format"])
+        if options["file"]:
+            with open(options["file"], "w", newline="", encoding="utf-8") as fh:
+                fh.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from chats.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 message search index from chats_message"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to rebuild")
+        parser.add_argument(
+            "--no-optimize", action="store_true", help="Skip merging the index b-trees afterwards"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rebuild_index(using=options["database"], optimize=not options["no_optimize"])
+        except DatabaseError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS("Message search index rebuilt"))
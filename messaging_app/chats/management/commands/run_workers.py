@@ -0,0 +1,36 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chats.jobs import DEFAULT_BATCH_SIZE, WorkerPool, drain
+
+
+class Command(BaseCommand):
+    help = "Run background job workers until interrupted (or once, with --once)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Worker threads")
+        parser.add_argument("--batch-size", type=int, help="Jobs claimed at a time by each worker")
+        parser.add_argument("--poll-interval", type=float, help="Seconds between looks at an empty queue")
+        parser.add_argument("--once", action="store_true", help="Run every due job, then exit")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"] or getattr(settings, "CHATS_JOB_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        if options["once"]:
+            ran = drain("run_workers", batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} jobs"))
+            return
+
+        pool = WorkerPool(options["workers"], batch_size=batch_size, poll_interval=options["poll_interval"])
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        pool.start()
+        self.stdout.write(f"Started {options['workers']} workers as {pool.name}")
+        try:
+            stopping.wait()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write("Stopping workers after their current jobs")
+        pool.stop()
@@ -0,0 +1,249 @@
+"""
+In-process request metrics for :class:`chats.middleware.PerformanceMiddleware`.
+
+A request's measurements live in a :class:`RequestTimings` held in a context
+variable, so queries issued from ``sync_to_async`` threads are charged to the
+request that caused them. Every database connection gets one execute wrapper
+(installed from :mod:`chats.signals`); outside an instrumented request it
+costs a single context variable lookup.
+
+Completed requests are folded into per-route histograms with fixed
+logarithmic buckets, kept for the current and previous window of
+``CHATS_METRICS_WINDOW`` seconds. The slowest queries over
+``CHATS_SLOW_QUERY_MS`` are sampled, without their parameters.
+"""
+import bisect
+import contextvars
+import heapq
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DEFAULT_WINDOW = 300
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_SLOW_QUERY_SAMPLES = 20
+# Upper bounds (ms) of the latency buckets; the last bucket is open-ended.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_SQL_LENGTH = 500
+
+_current = contextvars.ContextVar("chats_request_timings", default=None)
+
+
+class RequestTimings:
+    """Counters for one request; phases are in seconds"""
+    __slots__ = ("started", "queries", "db", "serialize", "render", "serializing")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.serializing = False
+
+    def server_timing(self, total):
+        return ", ".join([
+            f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries"',
+            f"serialize;dur={self.serialize * 1000:.2f}",
+            f"render;dur={self.render * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+def start_request():
+    """Begin collecting for the current context; returns ``(timings, token)``"""
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Charge the block's wall time to ``name`` (``serialize`` or ``render``) of the current request"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, name, getattr(timings, name) + time.perf_counter() - started)
+
+
+def record_queries(execute, sql, params, many, context):
+    """Database execute wrapper: counts and times queries of instrumented requests"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.queries += 1
+        timings.db += elapsed
+        if elapsed * 1000 >= slow_queries.threshold_ms:
+            slow_queries.offer(elapsed, sql, context["connection"].alias)
+
+
+class Histogram:
+    """Request count per latency bucket, plus running sums of each phase"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sums = dict.fromkeys(("total_ms", "db_ms", "queries", "serialize_ms", "render_ms"), 0.0)
+
+    def add(self, total_ms, timings):
+        self.buckets[bisect.bisect_left(BUCKETS, total_ms)] += 1
+        self.count += 1
+        self.sums["total_ms"] += total_ms
+        self.sums["db_ms"] += timings.db * 1000
+        self.sums["queries"] += timings.queries
+        self.sums["serialize_ms"] += timings.serialize * 1000
+        self.sums["render_ms"] += timings.render * 1000
+
+    def merge(self, other):
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        for key, value in other.sums.items():
+            self.sums[key] += value
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the ``pct``-th percentile (None if open-ended)"""
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else None
+        return None
+
+    def summary(self):
+        means = {f"mean_{key}": round(value / self.count, 3) for key, value in self.sums.items()}
+        return {
+            "requests": self.count,
+            **means,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets": dict(zip([*map(str, BUCKETS), "inf"], self.buckets)),
+        }
+
+
+class RouteStats:
+    """Thread-safe per-route histograms over a rolling window of one to two periods"""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._current, self._previous = {}, {}
+            self._rotated_at = time.monotonic()
+
+    def record(self, route, total_ms, timings):
+        with self._lock:
+            self._rotate()
+            histogram = self._current.get(route)
+            if histogram is None:
+                histogram = self._current[route] = Histogram()
+            histogram.add(total_ms, timings)
+
+    def snapshot(self):
+        with self._lock:
+            self._rotate()
+            merged = {}
+            for period in (self._previous, self._current):
+                for route, histogram in period.items():
+                    merged.setdefault(route, Histogram()).merge(histogram)
+        return {route: histogram.summary() for route, histogram in sorted(merged.items())}
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._rotated_at >= self.window:
+            # A gap longer than two windows leaves nothing worth keeping.
+            self._previous = self._current if now - self._rotated_at < 2 * self.window else {}
+            self._current = {}
+            self._rotated_at = now
+
+
+class SlowQueries:
+    """The ``size`` slowest queries at or above ``threshold_ms``, SQL only"""
+
+    def __init__(self, threshold_ms=DEFAULT_SLOW_QUERY_MS, size=DEFAULT_SLOW_QUERY_SAMPLES):
+        self.threshold_ms = threshold_ms
+        self.size = size
+        self._lock = threading.Lock()
+        self._heap = []
+        self._sequence = 0
+
+    def offer(self, elapsed, sql, alias):
+        entry = {
+            "duration_ms": round(elapsed * 1000, 3),
+            "sql": sql[:MAX_SQL_LENGTH],
+            "database": alias,
+            "at": time.time(),
+        }
+        with self._lock:
+            self._sequence += 1
+            item = (elapsed, self._sequence, entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif elapsed > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def snapshot(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self._heap = []
+
+
+route_stats = RouteStats(window=getattr(settings, "CHATS_METRICS_WINDOW", DEFAULT_WINDOW))
+slow_queries = SlowQueries(
+    threshold_ms=getattr(settings, "CHATS_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS),
+    size=getattr(settings, "CHATS_SLOW_QUERY_SAMPLES", DEFAULT_SLOW_QUERY_SAMPLES),
+)
+
+
+def install(connection):
+    """
+    Add the query wrapper to ``connection`` once; called for every new connection.
+
+    It goes to the bottom of the wrapper stack: a connection opened lazily
+    inside ``with connection.execute_wrapper(...)`` must leave that block's
+    wrapper on top for its ``pop()``.
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+class InstrumentedSerializerMixin:
+    """Charge the outermost ``to_representation`` of a request to its ``serialize`` phase"""
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or timings.serializing:
+            return super().to_representation(instance)
+        timings.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializing = False
+            timings.serialize += time.perf_counter() - started
@@ -0,0 +1,58 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+
+def route_name(request):
+    """``<METHOD> <url name>``, or the URL pattern for unnamed routes"""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return f"{request.method} <unresolved>"
+    return f"{request.method} {match.view_name or match.route}"
+
+
+class PerformanceMiddleware:
+    """
+    Measure query count and time, serializer, render and total time of every
+    request, add them as a ``Server-Timing`` header (unless
+    ``CHATS_SERVER_TIMING`` is off) and fold them into
+    :data:`chats.metrics.route_stats`.
+
+    Put it first in ``MIDDLEWARE`` so the total covers the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "CHATS_SERVER_TIMING", True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = metrics.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = metrics.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        metrics.route_stats.record(route_name(request), total * 1000, timings)
+        if self.server_timing:
+            response["Server-Timing"] = timings.server_timing(total)
+        return response
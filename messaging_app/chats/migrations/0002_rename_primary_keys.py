@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Bring the migration state in line with the UUID primary key names used by the models."""
+
+    dependencies = [
+        ('chats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='conversation',
+            old_name='id',
+            new_name='conversation_id',
+        ),
+        migrations.RenameField(
+            model_name='message',
+            old_name='id',
+            new_name='message_id',
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='id',
+            new_name='user_id',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='password',
+            field=models.CharField(max_length=128),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:26
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_inbox_fields(apps, schema_editor):
+    Conversation = apps.get_model('chats', 'Conversation')
+    Message = apps.get_model('chats', 'Message')
+    for conversation in Conversation.objects.iterator():
+        messages = Message.objects.filter(conversation_id=conversation.pk)
+        latest = messages.order_by('-sent_at', '-pk').first()
+        conversation.message_count = messages.count()
+        conversation.last_message = latest
+        conversation.last_message_at = latest.sent_at if latest else conversation.created_at
+        conversation.save(update_fields=['message_count', 'last_message', 'last_message_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_message_conversation_sent_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['-last_message_at', '-conversation_id'], name='chats_conv_activity_idx'),
+        ),
+        migrations.RunPython(backfill_inbox_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# External-content FTS5 index over chats_message.message_body. The index stores
+# only tokens; snippets are read back from chats_message through its rowid,
+# which the triggers below keep in step with every insert, update and delete.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chats_message_fts USING fts5(
+        message_body,
+        content='chats_message',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_message_fts_ai AFTER INSERT ON chats_message BEGIN
+        INSERT INTO chats_message_fts(rowid, message_body) VALUES (new.rowid, new.message_body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_message_fts_ad AFTER DELETE ON chats_message BEGIN
+        INSERT INTO chats_message_fts(chats_message_fts, rowid, message_body)
+        VALUES ('delete', old.rowid, old.message_body);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_message_fts_au AFTER UPDATE OF message_body ON chats_message BEGIN
+        INSERT INTO chats_message_fts(chats_message_fts, rowid, message_body)
+        VALUES ('delete', old.rowid, old.message_body);
+        INSERT INTO chats_message_fts(rowid, message_body) VALUES (new.rowid, new.message_body);
+    END
+    """,
+    "INSERT INTO chats_message_fts(chats_message_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS chats_message_fts_au",
+    "DROP TRIGGER IF EXISTS chats_message_fts_ad",
+    "DROP TRIGGER IF EXISTS chats_message_fts_ai",
+    "DROP TABLE IF EXISTS chats_message_fts",
+]
+
+
+def _run(statements):
+    def apply(apps, schema_editor):
+        # FTS5 is SQLite-only; other backends keep the icontains fallback.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_conversation_inbox_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(CREATE_SQL), _run(DROP_SQL)),
+    ]
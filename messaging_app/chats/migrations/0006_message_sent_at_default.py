@@ -0,0 +1,24 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0005_message_fts'),
+    ]
+
+    # auto_now_add -> default is a Python-side change only. Applying it as a
+    # state change avoids SQLite remaking chats_message, which would drop the
+    # FTS triggers and renumber the rowids the search index is keyed on.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='sent_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
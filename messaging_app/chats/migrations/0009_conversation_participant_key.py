@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import hashlib
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_participant_keys(apps, schema_editor):
+    """Key each two-person conversation; only the oldest of duplicate pairs keeps the key"""
+    Conversation = apps.get_model('chats', 'Conversation')
+    Participant = Conversation.participants.through
+    members = {}
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id').iterator():
+        members.setdefault(conversation_id, set()).add(user_id)
+    seen = set()
+    for conversation_id in Conversation.objects.order_by('created_at').values_list('pk', flat=True).iterator():
+        user_ids = members.get(conversation_id, ())
+        if len(user_ids) != 2:
+            continue
+        canonical = ','.join(sorted(uuid.UUID(str(pk)).hex for pk in user_ids))
+        key = hashlib.sha256(canonical.encode()).hexdigest()
+        if key in seen:
+            continue
+        seen.add(key)
+        Conversation.objects.filter(pk=conversation_id).update(participant_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_message_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participant_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_participant_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('participant_key__isnull', False)), fields=('participant_key',), name='chats_conv_participant_key_uniq'),
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('request_hash', models.CharField(max_length=64)),
+                ('created', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chats.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='chats_idempotency_user_key_uniq')],
+            },
+        ),
+    ]
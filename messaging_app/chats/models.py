@@ -1,5 +1,10 @@
+import hashlib
+import secrets
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 
@@ -37,8 +42,123 @@ class Conversation(models.Model):
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='conversations')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized inbox columns, maintained by record_message()/refresh_inbox_fields()
+    # so listing conversations never touches the messages table.
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(default=timezone.now)  # creation time until the first message
+    message_count = models.PositiveIntegerField(default=0)  # hot and archived messages together
+    # Overrides settings.CHATS_ARCHIVE_AFTER_DAYS for this conversation (see chats.archive).
+    archive_after_days = models.PositiveIntegerField(null=True, blank=True)
+    # participant_set_hash() of a direct (two-person) conversation, so each pair has at most one;
+    # NULL for group conversations, which may share a participant set.
+    participant_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-last_message_at', '-conversation_id'], name='chats_conv_activity_idx'),
+        ]
+        constraints = [
+            # Partial unique index, so adding it does not rebuild the table.
+            models.UniqueConstraint(
+                fields=['participant_key'], condition=Q(participant_key__isnull=False),
+                name='chats_conv_participant_key_uniq',
+            ),
+        ]
+
     def __str__(self):
-        return f"Conversation {self.id}"
+        return f"Conversation {self.pk}"
+
+    @staticmethod
+    def participant_set_hash(user_ids):
+        """Order-independent SHA-256 of a set of user ids"""
+        canonical = ','.join(sorted(uuid.UUID(str(pk)).hex for pk in set(user_ids)))
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    @classmethod
+    def direct_key(cls, user_ids):
+        """``participant_key`` for this participant set: its hash for exactly two users, else None"""
+        return cls.participant_set_hash(user_ids) if len(set(user_ids)) == 2 else None
+
+    @classmethod
+    def open(cls, user_ids):
+        """
+        The direct conversation between two users if it exists, else a new
+        conversation with ``user_ids``. Returns ``(conversation, created)``.
+        """
+        key = cls.direct_key(user_ids)
+        if key is not None:
+            existing = cls.objects.filter(participant_key=key).first()
+            if existing is not None:
+                return existing, False
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(participant_key=key)
+                through = cls.participants.through
+                through.objects.bulk_create(
+                    [through(conversation_id=conversation.pk, user_id=pk) for pk in set(user_ids)]
+                )
+        except IntegrityError:
+            if key is None:
+                raise
+            # Another request opened the same pair first.
+            return cls.objects.get(participant_key=key), False
+        return conversation, True
+
+    def refresh_participant_key(self):
+        """Recompute ``participant_key`` after the participants changed"""
+        key = self.direct_key(self.participants.values_list('pk', flat=True))
+        if key == self.participant_key:
+            return
+        try:
+            with transaction.atomic():
+                type(self).objects.filter(pk=self.pk).update(participant_key=key)
+        except IntegrityError:
+            # Now a duplicate of an existing direct conversation; stays an ordinary one.
+            key = None
+            type(self).objects.filter(pk=self.pk).update(participant_key=None)
+        self.participant_key = key
+
+    @classmethod
+    def record_message(cls, message, count=1):
+        """Fold newly inserted messages into the inbox columns with a single UPDATE"""
+        is_newer = Q(last_message_at__lte=message.sent_at)
+        return cls.objects.filter(pk=message.conversation_id).update(
+            message_count=F('message_count') + count,
+            last_message=Case(
+                When(is_newer, then=Value(message.pk, output_field=models.UUIDField())),
+                default=F('last_message'),
+            ),
+            last_message_at=Case(
+                When(is_newer, then=Value(message.sent_at)),
+                default=F('last_message_at'),
+            ),
+        )
+
+    @classmethod
+    def refresh_inbox(cls, conversation_ids):
+        """``refresh_inbox_fields`` for many conversations in a single UPDATE"""
+        latest = Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at', '-message_id')
+
+        def counted(model):
+            rows = model.objects.filter(conversation=OuterRef('pk')).order_by().values('conversation')
+            return Coalesce(Subquery(rows.annotate(n=Count('pk')).values('n')), 0)
+
+        return cls.objects.filter(pk__in=conversation_ids).update(
+            last_message=Subquery(latest.values('pk')[:1]),
+            last_message_at=Coalesce(Subquery(latest.values('sent_at')[:1]), F('created_at')),
+            message_count=counted(Message) + counted(ArchivedMessage),
+        )
+
+    def refresh_inbox_fields(self, save=True):
+        """Recompute the inbox columns from the messages and archive tables"""
+        latest = self.messages.order_by('-sent_at', '-message_id').first()
+        self.message_count = self.messages.count() + self.archived_messages.count()
+        self.last_message = latest
+        self.last_message_at = latest.sent_at if latest else self.created_at
+        if save:
+            self.save(update_fields=['message_count', 'last_message', 'last_message_at'])
 
 
 class Message(models.Model):
@@ -46,8 +166,138 @@ class Message(models.Model):
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='sent_messages')
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     message_body = models.TextField()
-    sent_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(default=timezone.now, editable=False)  # set explicitly only by bulk imports
+
+    class Meta:
+        indexes = [
+            # Serves the nested messages route: equality on conversation, then a
+            # range seek and ordered scan on the (sent_at, message_id) cursor.
+            models.Index(fields=['conversation', 'sent_at', 'message_id'], name='chats_msg_conv_sent_idx'),
+            # Admin changelist: default ordering and date_hierarchy drill-down across conversations.
+            models.Index(fields=['sent_at'], name='chats_msg_sent_idx'),
+        ]
 
     def __str__(self):
-        return f"Message {self.id} from {self.sender}"
+        # sender_id, not sender: listing messages must not load every sender.
+        return f"Message {self.pk} from {self.sender_id}"
+
 
+class ArchivedMessage(models.Model):
+    """
+    Cold tier of :class:`Message`, filled by ``manage.py archive_messages``.
+
+    Same columns and ids as the hot table, so both tiers serialize and
+    paginate alike. Archived messages are read-only and not in the search index.
+    """
+    message_id = models.UUIDField(primary_key=True, editable=False)
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archived_messages')
+    message_body = models.TextField()
+    sent_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', 'sent_at', 'message_id'], name='chats_archived_conv_sent_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived message {self.message_id} from {self.sender_id}"
+
+
+class AuthToken(models.Model):
+    """
+    Revocable, expiring API token. Only the SHA-256 digest of the token is
+    stored, so a leaked table does not leak credentials, and a lookup is one
+    unique-index probe instead of a password hash.
+    """
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='auth_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Token {self.digest[:8]} for {self.user_id}"
+
+    @staticmethod
+    def hash(raw):
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user, ttl=None, name=''):
+        """Create a token and return ``(token, raw)``; the raw value is never stored"""
+        raw = secrets.token_urlsafe(32)
+        expires_at = timezone.now() + ttl if ttl else None
+        token = cls.objects.create(digest=cls.hash(raw), user=user, name=name, expires_at=expires_at)
+        return token, raw
+
+    @property
+    def is_active(self):
+        if self.revoked_at is not None:
+            return False
+        return self.expires_at is None or self.expires_at > timezone.now()
+
+    def revoke(self):
+        if self.revoked_at is None:
+            self.revoked_at = timezone.now()
+            self.save(update_fields=['revoked_at'])
+
+
+class IdempotencyKey(models.Model):
+    """
+    ``Idempotency-Key`` of a conversation create request, so a retried request
+    returns the conversation the first one created instead of making another.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='+')
+    # Whether the first request created the conversation (201) or found it (200).
+    created = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='chats_idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} for {self.user_id}"
+
+
+class Job(models.Model):
+    """
+    A unit of background work for :mod:`chats.jobs`.
+
+    Enqueued with an INSERT in the caller's transaction, so a job exists
+    exactly when the data it refers to was committed. Finished jobs are
+    deleted; failed ones stay for inspection.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # not before; pushed back after each failure
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers only ever look for due queued jobs and expired claims.
+            models.Index(fields=['run_at'], condition=Q(status='queued'), name='chats_job_due_idx'),
+            models.Index(fields=['claimed_at'], condition=Q(status='running'), name='chats_job_claimed_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.task} ({self.status})"
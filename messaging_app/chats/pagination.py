@@ -0,0 +1,222 @@
+import base64
+import binascii
+import heapq
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def keyset_filter(ordering, position):
+    """
+    Build ``(a, b, c) > (x, y, z)`` for the given per-field directions.
+
+    The leading ``a >= x`` conjunct lets SQLite start a range scan on the
+    composite index instead of evaluating the OR branches row by row.
+    """
+    lookups = [
+        (f.lstrip("-"), "lt" if f.startswith("-") else "gt") for f in ordering
+    ]
+    branches = []
+    for index, (name, op) in enumerate(lookups):
+        condition = {prev: position[i] for i, (prev, _) in enumerate(lookups[:index])}
+        condition[f"{name}__{op}"] = position[index]
+        branches.append(Q(**condition))
+    first, first_op = lookups[0]
+    return Q(**{f"{first}__{first_op}e": position[0]}) & reduce(or_, branches)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple instead of using OFFSET.
+
+    The cursor is an opaque token holding the ordering values of the row at the
+    edge of the current page, so every page costs one index range scan no matter
+    how deep into the result set it is. ``ordering`` must end in a unique field.
+
+    ``paginate_queryset`` also accepts a list of querysets over the same fields
+    (storage tiers). Each one is sought and limited the same way, in order,
+    and the rows are merged, so a page can span tiers.
+    """
+
+    ordering = ()
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        tiers = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        position, reverse = self.decode_cursor(request, tiers[0].model)
+
+        ordering = [self._invert(f) if reverse else f for f in self.ordering]
+        rows = self.fetch(tiers, ordering, position)
+
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, position is not None
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+
+        self.page = rows
+        return rows
+
+    def fetch(self, tiers, ordering, position):
+        """Up to ``page_size + 1`` rows past ``position``, merged across tiers"""
+        fetched = []
+        for queryset in tiers:
+            if position is not None:
+                queryset = queryset.filter(keyset_filter(ordering, position))
+            fetched.append(list(queryset.order_by(*ordering)[: self.page_size + 1]))
+        if len(fetched) == 1:
+            return fetched[0]
+        descending = {f.startswith("-") for f in ordering}
+        if len(descending) != 1:
+            raise ValueError("Merging tiers needs every ordering field in the same direction")
+        fields = [f.lstrip("-") for f in ordering]
+        merged = heapq.merge(
+            *fetched, key=lambda row: tuple(self._raw(row, f) for f in fields), reverse=descending.pop()
+        )
+        return [row for _, row in zip(range(self.page_size + 1), merged)]
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        values = [self._value(row, f.lstrip("-")) for f in self.ordering]
+        payload = json.dumps({"p": values, "r": int(reverse)}, separators=(",", ":"))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            raw, reverse = payload["p"], bool(payload["r"])
+            if len(raw) != len(self.ordering):
+                raise ValueError
+            position = [
+                model._meta.get_field(f.lstrip("-")).to_python(value)
+                for f, value in zip(self.ordering, raw)
+            ]
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def _raw(row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def _value(self, row, field):
+        value = self._raw(row, field)
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return str(value)
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+
+class MessageCursorPagination(KeysetPagination):
+    """Chronological pages of a conversation's messages, keyed on ``(sent_at, message_id)``"""
+
+    ordering = ("sent_at", "message_id")
+
+
+class InboxCursorPagination(KeysetPagination):
+    """Conversations by most recent activity, keyed on ``(last_message_at, conversation_id)``"""
+
+    ordering = ("-last_message_at", "-conversation_id")
+    page_size = 20
+
+
+def estimated_row_count(model, using="default"):
+    """
+    The planner's row count for ``model``'s table, or None when the database
+    has no statistics for it (SQLite: run ``ANALYZE`` or ``PRAGMA optimize``).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        elif connection.vendor == "sqlite":
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of each stat row is the row count of that index (or table).
+            cursor.execute("SELECT max(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin paginator for tables too big to ``COUNT(*)`` on every page view.
+
+    An unfiltered changelist uses the planner's estimate. A filtered one, or a
+    table without statistics, counts at most ``max_count`` rows, so the last
+    page number is a lower bound on large results.
+    """
+    max_count = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None:
+                return estimate
+        return queryset.order_by()[: self.max_count].count()
@@ -0,0 +1,63 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metrics import phase
+
+try:
+    import orjson
+except ImportError:  # optional speed-up; falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` that encodes with orjson when it is installed.
+
+    Only compact, non-indented output takes the fast path; the browsable API's
+    indented rendering and requests without orjson use DRF's encoder.
+    Datetimes and types orjson does not know go through DRF's
+    ``JSONEncoder.default``, so the two paths produce the same values.
+    """
+    _fallback = JSONEncoder()
+    _options = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase("render"):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=self._fallback.default, option=self._options)
+        # Same escaping as JSONRenderer: U+2028/U+2029 are invalid in JavaScript strings.
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Makes an export format negotiable through ``Accept`` (or ``?format=``).
+
+    The export body is streamed by the view, not rendered; this only renders
+    the JSON error payloads returned before streaming starts.
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
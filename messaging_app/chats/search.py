@@ -0,0 +1,97 @@
+import re
+
+from django.db import connections
+from django.db.utils import DatabaseError
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+FTS_TABLE = "chats_message_fts"
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+SNIPPET_TOKENS = 12
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_fts_available = {}
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term (``"hel"*``) and the terms are
+    ANDed, so user input can never inject FTS5 operators or column filters.
+    """
+    tokens = _TOKEN.findall(text or "")
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def fts_available(using="default"):
+    """Whether the FTS index table exists on this database alias"""
+    if using not in _fts_available:
+        connection = connections[using]
+        available = False
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [FTS_TABLE],
+                )
+                available = cursor.fetchone() is not None
+        _fts_available[using] = available
+    return _fts_available[using]
+
+
+def search_messages(queryset, text):
+    """
+    Filter ``queryset`` to messages matching ``text``.
+
+    Matches are annotated with ``search_rank`` (BM25, lower is better) and
+    ``search_snippet`` (the matching fragment with highlighted terms).
+    Without FTS5 the search degrades to a plain ``icontains`` scan.
+    """
+    match = build_match_query(text)
+    if not match:
+        return queryset
+    if not fts_available(queryset.db):
+        return queryset.filter(message_body__icontains=text).extra(
+            select={"search_rank": "0", "search_snippet": "NULL"}
+        )
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {table}.rowid", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+        select={
+            "search_rank": f"bm25({FTS_TABLE})",
+            "search_snippet": f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s)",
+        },
+        select_params=[SNIPPET_START, SNIPPET_END, SNIPPET_TOKENS],
+    )
+
+
+def rebuild_index(using="default", optimize=True):
+    """Rebuild the FTS index from chats_message, e.g. after a VACUUM renumbers rowids"""
+    if not fts_available(using):
+        raise DatabaseError(f"{FTS_TABLE} does not exist on database '{using}'")
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+class MessageSearchFilter(filters.BaseFilterBackend):
+    """
+    Full-text ``?search=`` over message bodies, limited to conversations the
+    requesting user participates in.
+    """
+    search_param = api_settings.SEARCH_PARAM
+
+    def get_search_text(self, request):
+        return request.query_params.get(self.search_param, "").strip()
+
+    def filter_queryset(self, request, queryset, view):
+        text = self.get_search_text(request)
+        if not build_match_query(text):
+            return queryset
+        queryset = queryset.filter(conversation__participants=request.user)
+        return search_messages(queryset, text)
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from .metrics import InstrumentedSerializerMixin
 from .models import User, Conversation, Message
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     username = serializers.CharField(max_length=150)
     email = serializers.CharField()
 
@@ -28,7 +29,7 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
 
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     message_body = serializers.CharField()  
 
@@ -37,7 +38,31 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ["message_id", "sender", "conversation", "message_body", "sent_at"]
 
 
-class ConversationSerializer(serializers.ModelSerializer):
+class MessageSearchResultSerializer(MessageSerializer):
+    rank = serializers.FloatField(source="search_rank", read_only=True)
+    snippet = serializers.CharField(source="search_snippet", read_only=True, allow_null=True)
+
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ["rank", "snippet"]
+
+
+class BulkMessageItemSerializer(serializers.Serializer):
+    """One entry of a bulk ingestion request; ``sender`` and ``sent_at`` are for staff imports"""
+    conversation = serializers.UUIDField()
+    message_body = serializers.CharField()
+    sender = serializers.UUIDField(required=False)
+    sent_at = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+        if not user.is_staff:
+            for field in ("sender", "sent_at"):
+                if field in attrs:
+                    raise serializers.ValidationError({field: "Only staff imports may set this field."})
+        return attrs
+
+
+class ConversationSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
     messages = serializers.SerializerMethodField()  
 
@@ -47,5 +72,38 @@ class ConversationSerializer(serializers.ModelSerializer):
 
     def get_messages(self, obj):
         """Return nested messages within the conversation"""
-        messages = obj.messages.all().order_by("sent_at")
-        return MessageSerializer(messages, many=True).data
+        messages = getattr(obj, "ordered_messages", None)
+        if messages is None:
+            messages = obj.messages.select_related("sender").order_by("sent_at")
+        return MessageSerializer(messages, many=True, context=self.context).data
+
+
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender = serializers.CharField(source="sender.username", read_only=True)
+    preview = serializers.SerializerMethodField()
+
+    PREVIEW_LENGTH = 100
+
+    class Meta:
+        model = Message
+        fields = ["message_id", "sender", "preview", "sent_at"]
+
+    def get_preview(self, obj):
+        """First characters of the message body, for the inbox row"""
+        body = obj.message_body
+        if len(body) <= self.PREVIEW_LENGTH:
+            return body
+        return body[: self.PREVIEW_LENGTH - 1] + "\u2026"
+
+
+class InboxConversationSerializer(InstrumentedSerializerMixin, serializers.ModelSerializer):
+    """Compact conversation row built only from the denormalized inbox columns"""
+    participants = UserSerializer(many=True, read_only=True)
+    last_message = LastMessageSerializer(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = [
+            "conversation_id", "participants", "last_message",
+            "last_message_at", "message_count", "created_at",
+        ]
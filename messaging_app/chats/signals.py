@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import metrics
+from .authentication import token_cache
+from .cache import bump_conversation_version
+from .models import AuthToken, Conversation, Message
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    bump_conversation_version(instance.conversation_id)
+
+
+@receiver(post_save, sender=Conversation)
+@receiver(post_delete, sender=Conversation)
+def conversation_changed(sender, instance, **kwargs):
+    bump_conversation_version(instance.pk)
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_conversation_version(instance.pk)
+            instance.refresh_participant_key()
+    elif action in ("post_add", "post_remove"):
+        # user.conversations.add(...): instance is the user, pk_set the conversations
+        for conversation in Conversation.objects.filter(pk__in=pk_set):
+            bump_conversation_version(conversation.pk)
+            conversation.refresh_participant_key()
+    elif action == "pre_clear":
+        instance._cleared_conversations = list(instance.conversations.all())
+        for conversation in instance._cleared_conversations:
+            bump_conversation_version(conversation.pk)
+    elif action == "post_clear":
+        for conversation in instance.__dict__.pop("_cleared_conversations", ()):
+            conversation.refresh_participant_key()
+
+
+@receiver(post_save, sender=AuthToken)
+@receiver(post_delete, sender=AuthToken)
+def token_changed(sender, instance, **kwargs):
+    token_cache.invalidate(instance.digest)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_profile_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # Cached conversation and message bodies embed participant and sender fields.
+    if created or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+    for conversation_id in instance.conversations.values_list("pk", flat=True):
+        bump_conversation_version(conversation_id)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    metrics.install(connection)
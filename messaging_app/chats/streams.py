@@ -0,0 +1,89 @@
+"""
+Server-Sent Events stream of new messages, served by the ASGI application.
+
+Clients keep one ``text/event-stream`` connection per conversation instead of
+polling the messages route. After an ``overflow`` event (the client fell too
+far behind) they should refetch from their last cursor and reconnect.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .broker import CLOSED, OVERFLOW, conversation_channel, get_broker
+from .models import Conversation
+from .serializers import MessageSerializer
+
+DEFAULT_KEEPALIVE = 15
+
+
+def publish_message(message):
+    """Push a committed message to everyone streaming its conversation"""
+    payload = json.dumps(MessageSerializer(message).data, default=str)
+    get_broker().publish(conversation_channel(message.conversation_id), {
+        "id": str(message.message_id),
+        "event": "message",
+        "data": payload,
+    })
+
+
+def format_event(event):
+    lines = [f"id: {event['id']}", f"event: {event['event']}"]
+    lines.extend(f"data: {line}" for line in event["data"].splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
+
+def _authenticate(request):
+    """Run the API's configured authenticators so the stream accepts the same credentials"""
+    drf_request = Request(
+        request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    try:
+        return drf_request.user
+    except APIException:
+        return None
+
+
+async def message_stream(request, conversation_pk):
+    if "wsgi.version" in request.META:
+        return JsonResponse({"error": "Streaming requires the ASGI server"}, status=501)
+
+    user = await sync_to_async(_authenticate)(request)
+    if user is None or not user.is_authenticated:
+        return JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    is_member = await Conversation.objects.filter(
+        conversation_id=conversation_pk, participants=user
+    ).aexists()
+    if not is_member:
+        return JsonResponse({"error": "Not found."}, status=404)
+
+    broker = get_broker()
+    subscription = broker.subscribe(conversation_channel(conversation_pk))
+    keepalive = getattr(settings, "CHATS_STREAM_KEEPALIVE", DEFAULT_KEEPALIVE)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await subscription.get(timeout=keepalive)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is OVERFLOW:
+                    yield "event: overflow\ndata: {}\n\n"
+                    break
+                if event is CLOSED:
+                    break
+                yield format_event(event)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,30 @@
+"""
+Background tasks (see :mod:`chats.jobs`).
+
+Work that follows a message send (notifications, counters, webhooks, ...)
+connects a receiver to :data:`message_sent` instead of running in the
+request. Receivers run in a worker, possibly more than once per message.
+With no receivers connected, sends queue no jobs at all.
+"""
+from django.dispatch import Signal
+
+from .jobs import enqueue, task
+from .models import Message
+
+# Sent with ``message`` for every new message, from a job worker.
+message_sent = Signal()
+
+
+@task(name="chats.fan_out_messages")
+def fan_out_messages(message_ids):
+    """Send :data:`message_sent` for each message that still exists"""
+    messages = Message.objects.filter(pk__in=message_ids).select_related("sender", "conversation")
+    for message in messages.order_by("sent_at", "message_id"):
+        message_sent.send(sender=Message, message=message)
+
+
+def queue_fan_out(messages):
+    """Enqueue :func:`fan_out_messages` for ``messages`` in the current transaction, if anyone listens"""
+    if not message_sent.has_listeners(Message):
+        return None
+    return enqueue(fan_out_messages, {"message_ids": [str(m.pk) for m in messages]})
@@ -1,3 +1,1422 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from messaging_app.db import ReadReplicaRouter, ReadYourWritesMiddleware, sqlite_database
+
+from . import cache as response_cache
+from . import jobs
+from . import metrics
+from .archive import archive_due_messages
+from .authentication import TokenCache, token_cache
+from .benchmarks import api as api_benchmark
+from .benchmarks.data import seed
+from .checks import check_job_workers
+from .compact import compact_conversation
+from .broker import OVERFLOW, InMemoryBroker, conversation_channel, get_broker
+from .models import ArchivedMessage, AuthToken, Job, User, Conversation, Message
+from .pagination import EstimatedCountPaginator, keyset_filter
+from .renderers import FastJSONRenderer
+from .search import build_match_query
+from .streams import publish_message
+from .tasks import message_sent
+from .throttling import InMemoryBucketStore, get_bucket_store
+
+
+def make_user(username, password=None):
+    return User.objects.create_user(
+        username=username,
+        email=f"{username}@example.com",
+        password=password,
+        first_name=username.title(),
+        last_name="Tester",
+    )
+
+
+def make_conversation(participants, message_count=0):
+    conversation = Conversation.objects.create()
+    conversation.participants.set(participants)
+    for index in range(message_count):
+        Message.objects.create(
+            sender=participants[index % len(participants)],
+            conversation=conversation,
+            message_body=f"message {index}",
+        )
+    return conversation
+
+
+class APITestMixin:
+    """Shared fixtures for tests that talk to the chats API as an authenticated user"""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries), response
+
+
+class ConversationQueryCountTests(APITestMixin, TestCase):
+    """The conversation read endpoints must not issue queries per row"""
+
+    def test_list_query_count_is_constant(self):
+        make_conversation([self.alice, self.bob], message_count=1)
+        small, _ = self.count_queries("/api/conversations/")
+
+        users = [make_user(f"user{i}") for i in range(4)]
+        for user in users:
+            make_conversation([self.alice, self.bob, user], message_count=12)
+        large, response = self.count_queries("/api/conversations/")
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_retrieve_query_count_is_constant(self):
+        quiet = make_conversation([self.alice, self.bob], message_count=1)
+        busy = make_conversation(
+            [self.alice, self.bob] + [make_user(f"user{i}") for i in range(3)],
+            message_count=30,
+        )
+        small, _ = self.count_queries(f"/api/conversations/{quiet.pk}/")
+        large, response = self.count_queries(f"/api/conversations/{busy.pk}/")
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.json()["messages"]), 30)
+
+    def test_messages_are_ordered_and_nest_sender(self):
+        conversation = make_conversation([self.alice, self.bob], message_count=3)
+        _, response = self.count_queries(f"/api/conversations/{conversation.pk}/")
+
+        messages = response.json()["messages"]
+        self.assertEqual(
+            [m["message_body"] for m in messages],
+            ["message 0", "message 1", "message 2"],
+        )
+        self.assertEqual(messages[1]["sender"]["username"], "bob")
+
+
+class MessageCursorPaginationTests(APITestMixin, TestCase):
+    """The nested messages route is scoped to its conversation and keyset-paged"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=7)
+        make_conversation([self.alice, self.bob], message_count=3)
+        self.url = f"/api/conversations/{self.conversation.pk}/messages/"
+
+    def bodies(self, payload):
+        return [m["message_body"] for m in payload["results"]]
+
+    def test_only_messages_of_the_routed_conversation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.bodies(response.json()), [f"message {i}" for i in range(7)])
+
+    def test_pages_forward_and_back(self):
+        first = self.client.get(self.url, {"page_size": 3}).json()
+        self.assertEqual(self.bodies(first), ["message 0", "message 1", "message 2"])
+        self.assertIsNone(first["previous"])
+
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(self.bodies(second), ["message 3", "message 4", "message 5"])
+
+        last = self.client.get(second["next"]).json()
+        self.assertEqual(self.bodies(last), ["message 6"])
+        self.assertIsNone(last["next"])
+
+        back = self.client.get(last["previous"]).json()
+        self.assertEqual(self.bodies(back), ["message 3", "message 4", "message 5"])
+        back = self.client.get(back["previous"]).json()
+        self.assertEqual(self.bodies(back), ["message 0", "message 1", "message 2"])
+        self.assertIsNone(back["previous"])
+
+    def test_ties_on_sent_at_are_broken_by_message_id(self):
+        Message.objects.filter(conversation=self.conversation).update(
+            sent_at=self.conversation.created_at
+        )
+        seen = []
+        url = self.url + "?page_size=2"
+        while url:
+            payload = self.client.get(url).json()
+            seen.extend(m["message_id"] for m in payload["results"])
+            url = payload["next"]
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, key=lambda pk: pk.replace("-", "")))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_later_pages_seek_on_the_composite_index(self):
+        message = Message.objects.filter(conversation=self.conversation).first()
+        plan = (
+            Message.objects.filter(conversation=self.conversation)
+            .filter(keyset_filter(["sent_at", "message_id"], [message.sent_at, message.pk]))
+            .order_by("sent_at", "message_id")
+            .explain()
+        )
+        self.assertIn("chats_msg_conv_sent_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_send_uses_the_routed_conversation(self):
+        response = self.client.post(self.url, {"message_body": "hello"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["conversation"], str(self.conversation.pk))
+
+
+class InboxTests(APITestMixin, TestCase):
+    """The inbox is served from the denormalized conversation columns"""
+
+    def send(self, conversation, body):
+        url = f"/api/conversations/{conversation.pk}/messages/"
+        response = self.client.post(url, {"message_body": body}, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_send_updates_counters_and_last_message(self):
+        conversation = make_conversation([self.alice, self.bob])
+        self.send(conversation, "first")
+        sent = self.send(conversation, "second")
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 2)
+        self.assertEqual(str(conversation.last_message_id), sent["message_id"])
+
+    def test_inbox_orders_by_last_activity(self):
+        older = make_conversation([self.alice, self.bob])
+        newer = make_conversation([self.alice, self.bob])
+        make_conversation([self.bob, make_user("carol")])
+        self.send(newer, "hi")
+        self.send(older, "x" * 300)
+
+        payload = self.client.get("/api/conversations/inbox/").json()
+        rows = payload["results"]
+        self.assertEqual([r["conversation_id"] for r in rows], [str(older.pk), str(newer.pk)])
+        self.assertEqual(rows[0]["message_count"], 1)
+        self.assertEqual(len(rows[0]["last_message"]["preview"]), 100)
+        self.assertEqual(rows[0]["last_message"]["sender"], "alice")
+        self.assertNotIn("messages", rows[0])
+
+    def test_inbox_query_count_does_not_depend_on_history(self):
+        make_conversation([self.alice, self.bob], message_count=1)
+        small, _ = self.count_queries("/api/conversations/inbox/")
+        for _ in range(3):
+            conversation = make_conversation([self.alice, self.bob])
+            for i in range(10):
+                self.send(conversation, f"message {i}")
+        large, _ = self.count_queries("/api/conversations/inbox/")
+        self.assertEqual(small, large)
+
+    def test_deleting_the_last_message_rolls_back_the_preview(self):
+        conversation = make_conversation([self.alice, self.bob])
+        first = self.send(conversation, "first")
+        second = self.send(conversation, "second")
+        url = f"/api/conversations/{conversation.pk}/messages/{second['message_id']}/"
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.message_count, 1)
+        self.assertEqual(str(conversation.last_message_id), first["message_id"])
+
+
+class MessageSearchTests(APITestMixin, TestCase):
+    """Full-text search runs on the FTS5 index and respects membership"""
+
+    def setUp(self):
+        super().setUp()
+        self.mine = make_conversation([self.alice, self.bob])
+        self.theirs = make_conversation([self.bob, make_user("carol")])
+        self.post(self.mine, self.bob, "the invoice for the flight is attached")
+        self.post(self.mine, self.alice, "invoice invoice invoice, please pay the invoice")
+        self.post(self.mine, self.alice, "see you at lunch")
+        self.post(self.theirs, self.bob, "a private invoice")
+
+    def post(self, conversation, sender, body):
+        return Message.objects.create(conversation=conversation, sender=sender, message_body=body)
+
+    def search(self, text):
+        response = self.client.get("/api/conversations/search/", {"search": text})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_build_match_query_quotes_terms(self):
+        self.assertEqual(build_match_query('inv "x" OR col:y*'), '"inv"* "x"* "OR"* "col"* "y"*')
+        self.assertEqual(build_match_query("  "), "")
+
+    def test_ranked_prefix_search_with_snippets(self):
+        results = self.search("invo")
+        self.assertEqual(len(results), 2)
+        self.assertTrue(results[0]["message_body"].startswith("invoice invoice"))
+        self.assertLessEqual(results[0]["rank"], results[1]["rank"])
+        self.assertIn("<mark>invoice</mark>", results[0]["snippet"])
+
+    def test_search_is_limited_to_member_conversations(self):
+        bodies = [r["message_body"] for r in self.search("private invoice")]
+        self.assertEqual(bodies, [])
+
+    def test_nested_list_filters_by_search(self):
+        url = f"/api/conversations/{self.mine.pk}/messages/"
+        payload = self.client.get(url, {"search": "lunch"}).json()
+        self.assertEqual([m["message_body"] for m in payload["results"]], ["see you at lunch"])
+
+    def test_index_follows_updates_and_deletes(self):
+        message = self.post(self.mine, self.alice, "original wording")
+        message.message_body = "replacement wording"
+        message.save()
+        self.assertEqual(self.search("original"), [])
+        self.assertEqual(len(self.search("replacement")), 1)
+
+        message.delete()
+        self.assertEqual(self.search("replacement"), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chats_message_fts")
+        self.assertEqual(self.search("lunch"), [])
+        call_command("rebuild_message_index", stdout=StringIO())
+        self.assertEqual(len(self.search("lunch")), 1)
+
+
+class BrokerTests(TestCase):
+    """The in-memory broker fans out to bounded per-connection queues"""
+
+    def setUp(self):
+        self.broker = InMemoryBroker(queue_size=3)
+
+    async def test_publish_reaches_every_subscriber_of_the_channel(self):
+        first = self.broker.subscribe("a")
+        second = self.broker.subscribe("a")
+        other = self.broker.subscribe("b")
+        self.assertEqual(self.broker.publish("a", {"n": 1}), 2)
+        self.assertEqual(await first.get(1), {"n": 1})
+        self.assertEqual(await second.get(1), {"n": 1})
+        self.assertTrue(other.queue.empty())
+
+    async def test_slow_consumer_is_cut_off_instead_of_blocking(self):
+        slow = self.broker.subscribe("a")
+        for n in range(5):
+            self.broker.publish("a", n)
+        received = [await slow.get(1) for _ in range(4)]
+        self.assertEqual(received, [0, 1, 2, OVERFLOW])
+        self.assertTrue(slow.overflowed)
+        self.assertEqual(self.broker.subscriber_count("a"), 0)
+
+    async def test_publish_from_another_thread(self):
+        subscription = self.broker.subscribe("a")
+        await sync_to_async(self.broker.publish, thread_sensitive=False)("a", "hello")
+        self.assertEqual(await subscription.get(1), "hello")
+
+    def test_close_unsubscribes(self):
+        subscription = self.broker.subscribe("a")
+        subscription.close()
+        self.assertEqual(self.broker.publish("a", "x"), 0)
+
+
+@override_settings(CHATS_STREAM_KEEPALIVE=0.05)
+class MessageStreamTests(TestCase):
+    """The SSE endpoint streams new messages to conversation participants"""
+
+    def setUp(self):
+        get_broker.cache_clear()
+        self.alice = make_user("alice")
+        self.bob = make_user("bob")
+        self.conversation = make_conversation([self.alice, self.bob])
+        self.url = f"/api/conversations/{self.conversation.pk}/stream/"
+
+    def tearDown(self):
+        get_broker.cache_clear()
+
+    async def test_requires_membership(self):
+        await self.async_client.aforce_login(await User.objects.acreate(username="eve", email="eve@example.com"))
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_streams_published_messages(self):
+        await self.async_client.aforce_login(self.alice)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b"retry: 3000\n\n")
+
+        message = await Message.objects.acreate(
+            conversation=self.conversation, sender=self.bob, message_body="ping"
+        )
+        await sync_to_async(publish_message)(message)
+        event = (await anext(chunks)).decode()
+        while event.startswith(":"):
+            event = (await anext(chunks)).decode()
+        self.assertIn(f"id: {message.message_id}\nevent: message\n", event)
+        self.assertIn('"message_body": "ping"', event)
+        await response.streaming_content.aclose()
+
+    def test_sending_publishes_after_commit(self):
+        subscription = get_broker().subscribe(conversation_channel(self.conversation.pk))
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f"/api/conversations/{self.conversation.pk}/messages/",
+                {"message_body": "hello"}, format="json",
+            )
+        event = subscription.queue.get_nowait()
+        self.assertEqual(event["id"], response.json()["message_id"])
+
+
+class BulkMessageTests(APITestMixin, TestCase):
+    """Bulk ingestion validates membership in one query and reports per-item errors"""
+
+    url = "/api/messages/bulk/"
+
+    def setUp(self):
+        super().setUp()
+        self.first = make_conversation([self.alice, self.bob])
+        self.second = make_conversation([self.alice, self.bob])
+        self.foreign = make_conversation([self.bob, make_user("carol")])
+
+    def test_inserts_across_conversations_and_updates_inbox(self):
+        items = [
+            {"conversation": str(conversation.pk), "message_body": f"bulk {i}"}
+            for i, conversation in enumerate([self.first, self.second] * 30)
+        ]
+        response = self.client.post(self.url, {"messages": items}, format="json")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()["created"], 60)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.message_count, 30)
+        self.assertEqual(self.first.last_message.message_body, "bulk 58")
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def post(count):
+            items = [{"conversation": str(self.first.pk), "message_body": "x"}] * count
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.url, {"messages": items}, format="json")
+            self.assertEqual(response.status_code, 201)
+            return len(ctx.captured_queries)
+
+        # 150 rows still fit one INSERT under SQLite's 999 bound-parameter limit.
+        self.assertEqual(post(5), post(150))
+
+    def test_reports_item_errors_without_aborting(self):
+        items = [
+            {"conversation": str(self.first.pk), "message_body": "ok"},
+            {"conversation": str(self.foreign.pk), "message_body": "not a member"},
+            {"conversation": "nope", "message_body": "bad id"},
+            {"conversation": str(self.first.pk), "message_body": "x", "sent_at": "2020-01-01T00:00:00Z"},
+        ]
+        response = self.client.post(self.url, {"messages": items}, format="json")
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertIn("message_id", results[0])
+        self.assertIn("conversation", results[1]["errors"])
+        self.assertIn("conversation", results[2]["errors"])
+        self.assertIn("sent_at", results[3]["errors"])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_staff_import_keeps_sender_and_timestamp(self):
+        self.alice.is_staff = True
+        self.alice.save()
+        items = [{
+            "conversation": str(self.first.pk), "message_body": "from the archive",
+            "sender": str(self.bob.pk), "sent_at": "2020-01-01T00:00:00Z",
+        }]
+        response = self.client.post(self.url, {"messages": items}, format="json")
+
+        self.assertEqual(response.status_code, 201, response.content)
+        message = Message.objects.get()
+        self.assertEqual(message.sender, self.bob)
+        self.assertEqual(message.sent_at.year, 2020)
+
+    def test_rejects_empty_or_oversized_requests(self):
+        self.assertEqual(self.client.post(self.url, {"messages": []}, format="json").status_code, 400)
+        items = [{"conversation": str(self.first.pk), "message_body": "x"}] * 5001
+        self.assertEqual(self.client.post(self.url, {"messages": items}, format="json").status_code, 400)
+
+
+class ResponseCacheTests(APITestMixin, TestCase):
+    """Conversation reads are cached per version and revalidated with ETags"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=2)
+        self.detail = f"/api/conversations/{self.conversation.pk}/"
+        self.messages = f"/api/conversations/{self.conversation.pk}/messages/"
+        response_cache.stats.reset()
+
+    def test_second_read_is_served_from_cache_without_queries(self):
+        first = self.client.get(self.detail)
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.client.get(self.detail)
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(response_cache.stats.snapshot()["hits"], 1)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.messages)["ETag"]
+        response = self.client.get(self.messages, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response_cache.stats.snapshot()["not_modified"], 1)
+
+    def test_new_message_invalidates(self):
+        etag = self.client.get(self.messages)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.messages, {"message_body": "fresh"}, format="json")
+
+        response = self.client.get(self.messages, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_participant_profile_edit_invalidates(self):
+        detail = self.client.get(self.detail)
+        messages = self.client.get(self.messages)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.first_name = "Robert"
+            self.bob.save()
+
+        for url, before in [(self.detail, detail), (self.messages, messages)]:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=before["ETag"])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertNotEqual(response["ETag"], before["ETag"])
+            self.assertIn("Robert", response.content.decode())
+            self.assertNotEqual(response.json(), before.json())
+
+    def test_last_login_update_keeps_the_cache(self):
+        etag = self.client.get(self.detail)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bob.last_login = timezone.now()
+            self.bob.save(update_fields=["last_login"])
+        self.assertEqual(self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_new_message_invalidates_non_canonical_pks(self):
+        variants = [
+            f"/api/conversations/{str(self.conversation.pk).upper()}/messages/",
+            f"/api/conversations/{self.conversation.pk.hex}/messages/",
+        ]
+        etags = [self.client.get(url)["ETag"] for url in variants]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.messages, {"message_body": "fresh"}, format="json")
+
+        for url, etag in zip(variants, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_participant_change_invalidates(self):
+        before = self.client.get(self.detail)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation.participants.add(make_user("carol"))
+        response = self.client.get(self.detail)
+        self.assertNotEqual(response["ETag"], before)
+        self.assertEqual(len(response.json()["participants"]), 3)
+
+    def test_bulk_insert_invalidates(self):
+        self.client.get(self.messages)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/api/messages/bulk/", {"messages": [
+                {"conversation": str(self.conversation.pk), "message_body": "bulk"},
+            ]}, format="json")
+        self.assertEqual(len(self.client.get(self.messages).json()["results"]), 3)
+
+    def test_query_params_are_part_of_the_key(self):
+        self.client.get(self.messages)
+        response = self.client.get(self.messages, {"page_size": 1})
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class CompactRepresentationTests(APITestMixin, TestCase):
+    """?repr=compact returns the regular fields with a slimmed-down sender"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=3)
+        self.detail = f"/api/conversations/{self.conversation.pk}/"
+        self.messages = f"/api/conversations/{self.conversation.pk}/messages/"
+
+    def assertMatchesFull(self, compact, full):
+        self.assertEqual(compact["sender"]["user_id"], full["sender"]["user_id"])
+        self.assertEqual(
+            compact["sender"]["display_name"],
+            f"{full['sender']['first_name']} {full['sender']['last_name']}",
+        )
+        for field in ("message_id", "conversation", "message_body", "sent_at"):
+            self.assertEqual(compact[field], full[field])
+
+    def test_message_list_matches_serializer(self):
+        full = self.client.get(self.messages).json()["results"]
+        _, response = self.count_queries(f"{self.messages}?repr=compact")
+        compact = response.json()["results"]
+        self.assertEqual(len(compact), len(full))
+        for compact_row, full_row in zip(compact, full):
+            self.assertMatchesFull(compact_row, full_row)
+
+    def test_compact_message_list_paginates(self):
+        first = self.client.get(self.messages, {"repr": "compact", "page_size": 2}).json()
+        rest = self.client.get(first["next"]).json()
+        self.assertEqual(len(first["results"]) + len(rest["results"]), 3)
+        self.assertIsNone(rest["next"])
+
+    def test_conversation_detail_matches_serializer(self):
+        full = self.client.get(self.detail).json()
+        queries, response = self.count_queries(f"{self.detail}?repr=compact")
+        compact = response.json()
+        self.assertEqual(queries, 3)
+        self.assertEqual(compact["conversation_id"], full["conversation_id"])
+        self.assertEqual(compact["created_at"], full["created_at"])
+        self.assertEqual(
+            {p["user_id"] for p in compact["participants"]}, {p["user_id"] for p in full["participants"]}
+        )
+        for compact_row, full_row in zip(compact["messages"], full["messages"]):
+            self.assertMatchesFull(compact_row, full_row)
+
+    def test_display_name_falls_back_to_username(self):
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password=None)
+        conversation = make_conversation([carol], message_count=1)
+        data = compact_conversation(conversation.pk)
+        self.assertEqual(data["messages"][0]["sender"]["display_name"], "carol")
+
+    def test_view_default_and_override(self):
+        from .views import MessageViewSet
+
+        MessageViewSet.compact_reads = True
+        try:
+            compact = self.client.get(self.messages).json()["results"][0]
+            full = self.client.get(self.messages, {"repr": "full"}).json()["results"][0]
+        finally:
+            del MessageViewSet.compact_reads
+        self.assertNotIn("email", compact["sender"])
+        self.assertIn("email", full["sender"])
+
+    def test_unknown_conversation_is_404(self):
+        response = self.client.get("/api/conversations/00000000-0000-0000-0000-000000000000/?repr=compact")
+        self.assertEqual(response.status_code, 404)
+
+    def test_fast_renderer_output_parses_like_json_renderer(self):
+        data = self.client.get(self.detail).json()
+        data["created"] = timezone.now()
+        data["ids"] = [self.alice.pk]
+        data["text"] = "line\u2028separator \u00e9"
+        fast = json.loads(FastJSONRenderer().render(data))
+        standard = json.loads(JSONRenderer().render(data))
+        self.assertEqual(fast, standard)
+
+
+@override_settings(CHATS_ARCHIVE_AFTER_DAYS=30)
+class ArchiveTests(APITestMixin, TestCase):
+    """Old messages move to the archive table and stay readable through the API"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=6)
+        self.messages = f"/api/conversations/{self.conversation.pk}/messages/"
+        old = timezone.now() - timedelta(days=60)
+        ids = list(self.conversation.messages.order_by("sent_at").values_list("pk", flat=True))
+        for offset, pk in enumerate(ids[:4]):
+            Message.objects.filter(pk=pk).update(sent_at=old + timedelta(minutes=offset))
+        self.conversation.refresh_inbox_fields()
+        self.expected = [str(pk) for pk in ids]
+
+    def test_archives_messages_past_the_threshold(self):
+        moved = archive_due_messages()
+        self.assertEqual(moved, {self.conversation.pk: 4})
+        self.assertEqual(self.conversation.messages.count(), 2)
+        self.assertEqual(ArchivedMessage.objects.count(), 4)
+        self.conversation.refresh_inbox_fields()
+        self.assertEqual(self.conversation.message_count, 6)
+
+    def test_latest_message_stays_hot(self):
+        self.conversation.messages.update(sent_at=timezone.now() - timedelta(days=60))
+        self.conversation.refresh_inbox_fields()
+        archive_due_messages()
+        self.assertEqual(list(self.conversation.messages.all()), [self.conversation.last_message])
+
+    def test_per_conversation_threshold_overrides_default(self):
+        self.conversation.archive_after_days = 90
+        self.conversation.save(update_fields=["archive_after_days"])
+        self.assertEqual(archive_due_messages(), {})
+        with self.settings(CHATS_ARCHIVE_AFTER_DAYS=None):
+            self.conversation.archive_after_days = 1
+            self.conversation.save(update_fields=["archive_after_days"])
+            self.assertEqual(archive_due_messages(), {self.conversation.pk: 4})
+
+    def test_dry_run_moves_nothing(self):
+        self.assertEqual(archive_due_messages(dry_run=True), {self.conversation.pk: 4})
+        self.assertFalse(ArchivedMessage.objects.exists())
+
+    def test_export_includes_archived_messages(self):
+        archive_due_messages()
+        url = f"/api/conversations/{self.conversation.pk}/export/"
+        response = self.client.get(url)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["message_id"] for row in rows], self.expected)
+
+        response = self.client.get(url, {"after": self.expected[1]})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["message_id"] for row in rows], self.expected[2:])
+
+    def test_nested_route_reads_both_tiers(self):
+        before = self.client.get(self.messages).json()["results"]
+        archive_due_messages()
+        cache.clear()
+        after = self.client.get(self.messages).json()["results"]
+        self.assertEqual(after, before)
+        self.assertEqual([m["message_id"] for m in after], self.expected)
+
+        compact = self.client.get(self.messages, {"repr": "compact"}).json()["results"]
+        self.assertEqual([m["message_id"] for m in compact], self.expected)
+
+    def test_pages_span_tiers_in_both_directions(self):
+        archive_due_messages()
+        seen, url = [], self.messages + "?page_size=4"
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(m["message_id"] for m in page["results"])
+            last, url = page, page["next"]
+        self.assertEqual(seen, self.expected)
+        previous = self.client.get(last["previous"]).json()["results"]
+        self.assertEqual([m["message_id"] for m in previous], self.expected[:4])
+
+    def test_archived_message_detail(self):
+        archive_due_messages()
+        message_id = self.expected[0]
+        response = self.client.get(f"{self.messages}{message_id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message_id"], message_id)
+        other = make_conversation([self.alice])
+        response = self.client.get(f"/api/conversations/{other.pk}/messages/{message_id}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_command_reports_totals(self):
+        out = StringIO()
+        call_command("archive_messages", stdout=out)
+        self.assertIn("Archived 4 messages from 1 conversations", out.getvalue())
+
+
+class PerformanceMiddlewareTests(APITestMixin, TestCase):
+    """Requests report their timings and feed the per-route stats"""
+
+    def setUp(self):
+        super().setUp()
+        metrics.route_stats.reset()
+        metrics.slow_queries.reset()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=3)
+        self.messages = f"/api/conversations/{self.conversation.pk}/messages/"
+
+    def server_timing(self, response):
+        return dict(
+            (part.split(";")[0].strip(), part) for part in response["Server-Timing"].split(",")
+        )
+
+    def test_server_timing_counts_queries(self):
+        queries, response = self.count_queries(self.messages)
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{queries} queries"', timing["db"])
+        self.assertEqual(set(timing), {"db", "serialize", "render", "total"})
+        self.assertNotIn("serialize;dur=0.00", timing["serialize"])
+
+    def test_routes_are_aggregated(self):
+        for _ in range(3):
+            self.client.get(self.messages)
+        self.client.get(f"/api/conversations/{self.conversation.pk}/")
+        routes = metrics.route_stats.snapshot()
+        self.assertEqual(routes["GET conversation-messages-list"]["requests"], 3)
+        self.assertEqual(routes["GET conversation-detail"]["requests"], 1)
+        self.assertEqual(sum(routes["GET conversation-messages-list"]["buckets"].values()), 3)
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.get(self.messages)
+        self.assertEqual(self.client.get("/api/stats/performance/").status_code, 403)
+        self.alice.is_staff = True
+        self.alice.save()
+        data = self.client.get("/api/stats/performance/").json()
+        self.assertIn("GET conversation-messages-list", data["routes"])
+        self.assertIn("hit_ratio", data["response_cache"])
+        self.assertEqual(self.client.delete("/api/stats/performance/").status_code, 204)
+
+    def test_slow_queries_are_sampled_without_parameters(self):
+        threshold, metrics.slow_queries.threshold_ms = metrics.slow_queries.threshold_ms, 0
+        try:
+            self.client.get(self.messages)
+        finally:
+            metrics.slow_queries.threshold_ms = threshold
+        samples = metrics.slow_queries.snapshot()
+        self.assertTrue(samples)
+        self.assertEqual(samples, sorted(samples, key=lambda s: -s["duration_ms"]))
+        self.assertTrue(all(self.conversation.pk.hex not in s["sql"] for s in samples))
+
+    def test_queries_outside_requests_are_not_counted(self):
+        timings, token = metrics.start_request()
+        metrics.end_request(token)
+        User.objects.count()
+        self.assertEqual(timings.queries, 0)
+
+    def test_install_inside_an_execute_wrapper_block_keeps_stack_order(self):
+        def caller_wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        connection.execute_wrappers.remove(metrics.record_queries)
+        self.addCleanup(metrics.install, connection)
+        with connection.execute_wrapper(caller_wrapper):
+            metrics.install(connection)  # as connection_created does for a lazily opened connection
+        self.assertEqual(connection.execute_wrappers, [metrics.record_queries])
+
+    def test_histogram_percentiles(self):
+        histogram = metrics.Histogram()
+        timings = metrics.RequestTimings()
+        for total_ms in [0.5] * 90 + [30] * 9 + [9000]:
+            histogram.add(total_ms, timings)
+        self.assertEqual(histogram.percentile(50), 1)
+        self.assertEqual(histogram.percentile(95), 50)
+        self.assertIsNone(histogram.percentile(100))
+
+
+class TokenBucketStoreTests(TestCase):
+    """Bucket arithmetic, eviction and thread safety of the in-process store"""
+
+    def test_burst_then_refill(self):
+        store = InMemoryBucketStore()
+        results = [store.consume("k", burst=3, rate=2.0, now=100.0) for _ in range(4)]
+        self.assertEqual([allowed for allowed, _ in results], [True, True, True, False])
+        self.assertAlmostEqual(results[-1][1], 0.5)
+        allowed, retry_after = store.consume("k", burst=3, rate=2.0, now=100.4)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.1)
+        self.assertTrue(store.consume("k", burst=3, rate=2.0, now=100.5)[0])
+
+    def test_cost_above_burst_never_passes(self):
+        self.assertEqual(InMemoryBucketStore().consume("k", burst=2, rate=1.0, cost=3), (False, None))
+
+    def test_refilled_buckets_are_evicted(self):
+        store = InMemoryBucketStore(stripes=1, sweep_interval=10)
+        store.consume("idle", burst=5, rate=1.0, now=0.0)
+        for second in range(3):
+            store.consume("busy", burst=5, rate=1.0, now=float(second))
+        self.assertEqual(len(store), 2)
+        store.consume("busy", burst=5, rate=1.0, now=10.0)
+        self.assertEqual(len(store), 1)
+
+    def test_concurrent_consumers_share_one_burst(self):
+        store = InMemoryBucketStore()
+        allowed = []
+
+        def worker():
+            for _ in range(50):
+                allowed.append(store.consume("shared", burst=100, rate=1e-9)[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 100)
+
+
+class SendThrottleTests(APITestMixin, TestCase):
+    """Message sends are throttled per user and per conversation with a correct Retry-After"""
+
+    def setUp(self):
+        super().setUp()
+        get_bucket_store().clear()
+        self.conversation = make_conversation([self.alice, self.bob])
+        self.messages = f"/api/conversations/{self.conversation.pk}/messages/"
+
+    def send(self, client=None):
+        return (client or self.client).post(self.messages, {"message_body": "hi"}, format="json")
+
+    @override_settings(CHATS_SEND_THROTTLE_USER={"burst": 2, "rate": 0.25})
+    def test_user_bucket(self):
+        self.assertEqual([self.send().status_code for _ in range(2)], [201, 201])
+        response = self.send()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "4")
+        self.assertEqual(self.client.get(self.messages).status_code, 200)
+
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        self.assertEqual(self.send(bob).status_code, 201)
+
+    @override_settings(CHATS_SEND_THROTTLE_CONVERSATION={"burst": 3, "rate": 2.0})
+    def test_conversation_bucket_is_shared_by_senders(self):
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        statuses = [self.send(client).status_code for client in (self.client, bob, self.client, bob)]
+        self.assertEqual(statuses, [201, 201, 201, 429])
+        other = make_conversation([self.alice])
+        response = self.client.post(
+            f"/api/conversations/{other.pk}/messages/", {"message_body": "hi"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(CHATS_SEND_THROTTLE_CONVERSATION={"burst": 2, "rate": 0.25})
+    def test_conversation_bucket_ignores_pk_spelling(self):
+        pk = self.conversation.pk
+        urls = [self.messages] + [f"/api/conversations/{value}/messages/" for value in (str(pk).upper(), pk.hex)]
+        statuses = [self.client.post(url, {"message_body": "hi"}, format="json").status_code for url in urls]
+        self.assertEqual(statuses, [201, 201, 429])
+
+    @override_settings(CHATS_SEND_THROTTLE_USER={"burst": 1, "rate": 0.25})
+    def test_rejected_sends_do_not_take_tokens(self):
+        for _ in range(3):
+            response = self.client.post(self.messages, {"message_body": ""}, format="json")
+            self.assertEqual(response.status_code, 400)
+        missing = "/api/conversations/00000000-0000-0000-0000-000000000000/messages/"
+        self.assertEqual(self.client.post(missing, {"message_body": "hi"}, format="json").status_code, 404)
+        self.assertEqual(self.send().status_code, 201)
+        self.assertEqual(self.send().status_code, 429)
+
+    @override_settings(
+        CHATS_SEND_THROTTLE_USER={"burst": 3, "rate": 0.001},
+        CHATS_SEND_THROTTLE_CONVERSATION={"burst": 1, "rate": 0.001},
+    )
+    def test_conversation_rejection_refunds_the_user_bucket(self):
+        self.assertEqual(self.send().status_code, 201)
+        self.assertEqual([self.send().status_code for _ in range(5)], [429] * 5)
+        others = [make_conversation([self.alice, self.bob]) for _ in range(2)]
+        statuses = [
+            self.client.post(f"/api/conversations/{other.pk}/messages/", {"message_body": "hi"}, format="json")
+            .status_code
+            for other in others
+        ]
+        self.assertEqual(statuses, [201, 201])
+
+    def test_store_refund(self):
+        store = InMemoryBucketStore()
+        self.assertEqual(store.consume("k", burst=1, rate=1, now=100.0), (True, 0.0))
+        self.assertEqual(store.consume("k", burst=1, rate=1, now=100.0), (False, 1.0))
+        store.refund("k", burst=1, rate=1, now=100.0)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.consume("k", burst=1, rate=1, now=100.0), (True, 0.0))
+        store.refund("missing", burst=1, rate=1, now=100.0)
+
+    @override_settings(CHATS_SEND_THROTTLE_USER=None, CHATS_SEND_THROTTLE_CONVERSATION=None)
+    def test_disabled(self):
+        self.assertTrue(all(self.send().status_code == 201 for _ in range(40)))
+
+
+class ConversationCreateTests(APITestMixin, TestCase):
+    """Creating conversations validates participants and does not duplicate direct chats"""
+
+    def create(self, participants, **headers):
+        return self.client.post(
+            "/api/conversations/", {"participants": [str(u) for u in participants]}, format="json", **headers
+        )
+
+    def test_direct_conversation_is_reused(self):
+        first = self.create([self.alice.pk, self.bob.pk])
+        second = self.create([self.bob.pk, self.alice.pk])
+
+        self.assertEqual(first.status_code, 201, first.content)
+        self.assertEqual(second.status_code, 200, second.content)
+        self.assertEqual(first.json()["conversation_id"], second.json()["conversation_id"])
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_group_conversations_are_not_merged(self):
+        carol = make_user("carol")
+        self.create([self.alice.pk, self.bob.pk, carol.pk])
+        response = self.create([self.alice.pk, self.bob.pk, carol.pk])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Conversation.objects.count(), 2)
+        self.assertFalse(Conversation.objects.exclude(participant_key=None).exists())
+
+    def test_unknown_or_malformed_participants_are_rejected(self):
+        missing = self.create([self.alice.pk, "00000000-0000-0000-0000-000000000000"])
+        malformed = self.client.post("/api/conversations/", {"participants": ["nope"]}, format="json")
+
+        self.assertEqual(missing.status_code, 400)
+        self.assertIn("00000000-0000-0000-0000-000000000000", missing.json()["error"])
+        self.assertEqual(malformed.status_code, 400)
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_participants_are_validated_in_one_query(self):
+        users = [make_user(f"user{i}") for i in range(5)]
+        with CaptureQueriesContext(connection) as ctx:
+            self.create([self.alice.pk] + [u.pk for u in users])
+        lookups = [q for q in ctx.captured_queries if q["sql"].startswith('SELECT "chats_user"."user_id" AS "pk"')]
+        self.assertEqual(len(lookups), 1)
+
+    def test_idempotency_key_replays_first_response(self):
+        carol = make_user("carol")
+        participants = [self.alice.pk, self.bob.pk, carol.pk]
+        first = self.create(participants, HTTP_IDEMPOTENCY_KEY="retry-1")
+        second = self.create(participants, HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(first.json()["conversation_id"], second.json()["conversation_id"])
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_idempotency_key_reused_for_other_request(self):
+        self.create([self.alice.pk, self.bob.pk], HTTP_IDEMPOTENCY_KEY="retry-1")
+        response = self.create([self.alice.pk, make_user("carol").pk], HTTP_IDEMPOTENCY_KEY="retry-1")
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(CHATS_IDEMPOTENCY_KEY_TTL=0)
+    def test_expired_idempotency_key_is_replaced(self):
+        carol = make_user("carol")
+        participants = [self.alice.pk, self.bob.pk, carol.pk]
+        self.create(participants, HTTP_IDEMPOTENCY_KEY="retry-1")
+        response = self.create(participants, HTTP_IDEMPOTENCY_KEY="retry-1")
+
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Conversation.objects.count(), 2)
+
+    def test_participant_key_follows_membership(self):
+        conversation = make_conversation([self.alice, self.bob])
+        self.assertEqual(conversation.participant_key, Conversation.direct_key([self.alice.pk, self.bob.pk]))
+
+        carol = make_user("carol")
+        conversation.participants.add(carol)
+        conversation.refresh_from_db()
+        self.assertIsNone(conversation.participant_key)
+
+        self.assertEqual(self.create([self.alice.pk, self.bob.pk]).status_code, 201)
+        conversation.participants.remove(carol)
+        conversation.refresh_from_db()
+        # The pair has a direct conversation again, so this one stays unkeyed.
+        self.assertIsNone(conversation.participant_key)
+
+
+class AdminTests(APITestMixin, TestCase):
+    """Admin changelists and actions stay set-based on large tables"""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(
+            username="root", email="root@example.com", password="pw", first_name="Root", last_name="Admin"
+        )
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.conversation = make_conversation([self.alice, self.bob], message_count=5)
+        self.conversation.refresh_inbox_fields()
+
+    def test_message_changelist_query_count_is_constant(self):
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get("/admin/chats/message/")
+        self.assertEqual(response.status_code, 200)
+
+        users = [make_user(f"user{i}") for i in range(4)]
+        make_conversation(users, message_count=40)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get("/admin/chats/message/")
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_paginator_uses_statistics_when_unfiltered(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        queryset = Message.objects.order_by("-sent_at")
+        self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 5)
+        with CaptureQueriesContext(connection) as ctx:
+            EstimatedCountPaginator(queryset, 10).count
+        self.assertNotIn("COUNT", ctx.captured_queries[-1]["sql"])
+
+    def test_filtered_count_is_capped(self):
+        paginator = EstimatedCountPaginator(Message.objects.filter(sender=self.alice).order_by("-sent_at"), 10)
+        paginator.max_count = 2
+        self.assertEqual(paginator.count, 2)
+
+    def test_delete_action_refreshes_inbox(self):
+        latest = self.conversation.last_message_id
+        older = Message.objects.exclude(pk=latest).values_list("pk", flat=True)[:2]
+        selected = [str(pk) for pk in older] + [str(latest)]
+        response = self.client.post(
+            "/admin/chats/message/", {"action": "delete_messages", "_selected_action": selected}
+        )
+        self.assertEqual(response.status_code, 302)
+
+        self.conversation.refresh_from_db()
+        expected = Conversation.objects.get(pk=self.conversation.pk)
+        expected.refresh_inbox_fields(save=False)
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(self.conversation.message_count, 2)
+        self.assertEqual(self.conversation.last_message_id, expected.last_message_id)
+        self.assertEqual(self.conversation.last_message_at, expected.last_message_at)
+
+    def test_refresh_inbox_counts_empty_conversations(self):
+        empty = make_conversation([self.alice])
+        Conversation.objects.filter(pk=empty.pk).update(message_count=7)
+        Conversation.refresh_inbox([empty.pk])
+        empty.refresh_from_db()
+        self.assertEqual(empty.message_count, 0)
+        self.assertIsNone(empty.last_message_id)
+        self.assertEqual(empty.last_message_at, empty.created_at)
+
+    def test_change_forms_render(self):
+        message = Message.objects.first()
+        for url in (
+            f"/admin/chats/conversation/{self.conversation.pk}/change/",
+            f"/admin/chats/message/{message.pk}/change/",
+            "/admin/chats/conversation/",
+        ):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_str_does_not_query(self):
+        message = Message.objects.first()
+        with self.assertNumQueries(0):
+            str(message)
+            str(self.conversation)
+
+
+class JobQueueTests(APITestMixin, TestCase):
+    """Background jobs are enqueued with the message and retried until they succeed or run out"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob])
+        self.calls = []
+        jobs.TASKS["tests.record"] = self.record
+
+    def tearDown(self):
+        jobs.TASKS.pop("tests.record", None)
+
+    def record(self, fail=0, **payload):
+        self.calls.append(payload)
+        if len(self.calls) <= fail:
+            raise RuntimeError("boom")
+
+    def test_message_create_enqueues_fan_out(self):
+        received = []
+
+        def receiver(sender, message, **kwargs):
+            received.append(message.message_body)
+
+        message_sent.connect(receiver)
+        self.addCleanup(message_sent.disconnect, receiver)
+        response = self.client.post(
+            f"/api/conversations/{self.conversation.pk}/messages/", {"message_body": "hi"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        job = Job.objects.get()
+        self.assertEqual(job.task, "chats.fan_out_messages")
+        self.assertEqual(job.payload, {"message_ids": [response.json()["message_id"]]})
+
+        self.assertEqual(jobs.drain("test"), 1)
+        self.assertEqual(received, ["hi"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_sends_queue_no_jobs_without_receivers(self):
+        response = self.client.post(
+            f"/api/conversations/{self.conversation.pk}/messages/", {"message_body": "hi"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            "/api/messages/bulk/",
+            {"messages": [{"conversation": str(self.conversation.pk), "message_body": "bulk"}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(Job.objects.exists())
+
+    def test_rolled_back_enqueue_leaves_no_job(self):
+        try:
+            with transaction.atomic():
+                Job.objects.create(task="tests.record")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_is_retried_with_backoff(self):
+        Job.objects.create(task="tests.record", payload={"fail": 1})
+        with override_settings(CHATS_JOB_RETRY_BASE=60), self.assertLogs("chats.jobs", "ERROR"):
+            self.assertEqual(jobs.drain("test"), 1)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("boom", job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=29))
+        self.assertEqual(jobs.drain("test"), 0)  # not due yet
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(jobs.drain("test"), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(len(self.calls), 2)
+
+    def test_job_fails_after_max_attempts(self):
+        Job.objects.create(task="tests.record", payload={"fail": 5}, max_attempts=2)
+        with self.assertLogs("chats.jobs", "ERROR"):
+            jobs.drain("test")
+            Job.objects.update(run_at=timezone.now())
+            jobs.drain("test")
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIsNotNone(job.failed_at)
+
+    def test_unknown_task_fails_immediately(self):
+        Job.objects.create(task="tests.missing")
+        with self.assertLogs("chats.jobs", "ERROR"):
+            jobs.drain("test")
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_jobs_are_claimed_once(self):
+        for _ in range(3):
+            Job.objects.create(task="tests.record")
+        first = jobs.claim("a", 2)
+        second = jobs.claim("b", 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(jobs.claim("c", 2), [])
+
+    @override_settings(CHATS_JOB_LEASE=60)
+    def test_expired_claim_is_requeued(self):
+        Job.objects.create(task="tests.record")
+        stale = jobs.claim("dead", 1)[0]
+        later = timezone.now() + timedelta(seconds=61)
+        with self.assertLogs("chats.jobs", "WARNING"):
+            retaken = jobs.claim("alive", 1, now=later)[0]
+        self.assertEqual(retaken.pk, stale.pk)
+        self.assertEqual(retaken.attempts, 2)
+        # The first worker finishing late must not delete the new claim.
+        jobs.run_job(stale)
+        self.assertTrue(Job.objects.filter(pk=stale.pk).exists())
+
+    @override_settings(CHATS_JOB_LEASE=60)
+    def test_job_that_keeps_losing_its_lease_fails(self):
+        job = Job.objects.create(task="tests.record", max_attempts=2)
+        now = timezone.now()
+        with self.assertLogs("chats.jobs", "WARNING"):
+            for attempt in range(2):
+                now += timedelta(seconds=61)
+                self.assertEqual([j.pk for j in jobs.claim(f"crashed-{attempt}", 1, now=now)], [job.pk])
+            self.assertEqual(jobs.claim("alive", 1, now=now + timedelta(seconds=61)), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.claimed_by), (Job.FAILED, 2, ""))
+        self.assertIn("Lease expired", job.last_error)
+
+    def test_deploy_check_warns_without_workers(self):
+        with override_settings(CHATS_JOB_WORKERS=0):
+            self.assertEqual([m.id for m in check_job_workers(None)], ["chats.W001"])
+        with override_settings(CHATS_JOB_WORKERS=2):
+            self.assertEqual(check_job_workers(None), [])
+
+    def test_run_workers_once(self):
+        Job.objects.create(task="tests.record", payload={"n": 1})
+        out = StringIO()
+        call_command("run_workers", "--once", stdout=out)
+        self.assertIn("Ran 1 jobs", out.getvalue())
+        self.assertEqual(self.calls, [{"n": 1}])
+
+
+class BenchmarkBudgetTests(TestCase):
+    """The API benchmark suite stays within its recorded query budgets"""
+
+    def test_api_routes_within_query_budgets(self):
+        users, _ = seed(users=6, conversations=8, messages=300)
+        options = {"seeded_users": users, "repeat": 1, "check_budgets": True}
+        results = api_benchmark.run(options)
+
+        self.assertEqual(set(results), set(json.loads(api_benchmark.BUDGETS_PATH.read_text())))
+        self.assertTrue(all(r["status"] in (200, 201) for r in results.values()), results)
+        self.assertEqual(api_benchmark.check(results, options), [])
+
+    def test_check_reports_routes_over_budget(self):
+        budgets = json.loads(api_benchmark.BUDGETS_PATH.read_text())
+        results = {name: {"queries": budget + 1} for name, budget in budgets.items()}
+        failures = api_benchmark.check(results, {"check_budgets": True})
+        self.assertEqual(len(failures), len(budgets))
+
+
+class ExportTests(APITestMixin, TestCase):
+    """Conversation history streams out as NDJSON or CSV and can resume"""
+
+    def setUp(self):
+        super().setUp()
+        self.conversation = make_conversation([self.alice, self.bob], message_count=5)
+        self.url = f"/api/conversations/{self.conversation.pk}/export/"
+
+    def lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson_export_streams_every_message(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual([r["message_body"] for r in rows], [f"message {i}" for i in range(5)])
+        self.assertEqual(rows[1]["sender_username"], "bob")
+
+    def test_csv_export_has_a_header(self):
+        lines = self.lines(self.client.get(self.url, {"output": "csv"}))
+        self.assertEqual(lines[0], "message_id,sent_at,sender_id,sender_username,message_body")
+        self.assertEqual(len(lines), 6)
+
+    def test_accept_header_selects_the_format(self):
+        response = self.client.get(self.url, HTTP_ACCEPT="text/csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(self.lines(response)[0], "message_id,sent_at,sender_id,sender_username,message_body")
+
+        response = self.client.get(self.url, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len([json.loads(line) for line in self.lines(response)]), 5)
+
+    def test_resume_after_message_id(self):
+        rows = [json.loads(line) for line in self.lines(self.client.get(self.url))]
+        resumed = self.lines(self.client.get(self.url, {"after": rows[2]["message_id"]}))
+        self.assertEqual([json.loads(line)["message_body"] for line in resumed], ["message 3", "message 4"])
+
+    def test_bad_resume_position_is_rejected_before_streaming(self):
+        self.assertEqual(self.client.get(self.url, {"after": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"since": "yesterday"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"output": "xml"}).status_code, 400)
+
+    def test_only_participants_can_export(self):
+        self.client.force_authenticate(make_user("eve"))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command("export_conversation", str(self.conversation.pk), "--output-format", "csv", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+
+class DatabaseProfileTests(TestCase):
+    """SQLite profiles and the read replica router"""
+
+    def test_production_profile_applies_pragmas_on_connect(self):
+        config = sqlite_database("/tmp/app.sqlite3", "production")
+        self.assertEqual(config["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertIn("PRAGMA journal_mode=WAL", config["OPTIONS"]["init_command"])
+        self.assertIn("PRAGMA busy_timeout=5000", config["OPTIONS"]["init_command"])
+        self.assertGreater(config["CONN_MAX_AGE"], 0)
+
+    def test_read_only_alias_cannot_write(self):
+        config = sqlite_database("/tmp/app.sqlite3", "production", read_only=True)
+        self.assertEqual(config["NAME"], "file:/tmp/app.sqlite3?mode=ro")
+        self.assertNotIn("journal_mode", config["OPTIONS"]["init_command"])
+        self.assertNotIn("transaction_mode", config["OPTIONS"])
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            sqlite_database("/tmp/app.sqlite3", "turbo")
+
+    def test_router_keeps_reads_inside_transactions_on_the_writer(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_write(Message), "default")
+        self.assertFalse(router.allow_migrate("replica", "chats"))
+        # TestCase wraps every test in a transaction on default.
+        self.assertEqual(router.db_for_read(Message), "default")
+
+    def test_router_pins_a_request_to_the_writer_after_it_writes(self):
+        router = ReadReplicaRouter()
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Message))
+            router.db_for_write(Message)
+            seen.append(router.db_for_read(Message))
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(view)
+        with mock.patch.object(connection, "in_atomic_block", False):
+            middleware(RequestFactory().post("/"))
+            middleware(RequestFactory().get("/"))
+            seen.append(router.db_for_read(Message))
+        self.assertEqual(seen, ["replica", "default", "replica", "default", "replica"])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class TokenAuthenticationTests(TestCase):
+    """Bearer tokens are hashed, cached, revocable and expire"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = make_user("dana", password="correct horse")
+        self.client = APIClient()
+
+    def issue(self):
+        response = self.client.post(
+            "/api/auth/tokens/", {"email": "dana@example.com", "password": "correct horse"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()["token"]
+
+    def get_inbox(self, raw):
+        return self.client.get("/api/conversations/inbox/", HTTP_AUTHORIZATION=f"Bearer {raw}")
+
+    def test_issue_requires_the_password(self):
+        response = self.client.post(
+            "/api/auth/tokens/", {"email": "dana@example.com", "password": "wrong"}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_only_the_digest_is_stored(self):
+        raw = self.issue()
+        token = AuthToken.objects.get()
+        self.assertNotEqual(token.digest, raw)
+        self.assertEqual(token.digest, AuthToken.hash(raw))
+
+    def test_cached_token_skips_the_lookup(self):
+        raw = self.issue()
+        self.assertEqual(self.get_inbox(raw).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get_inbox(raw).status_code, 200)
+        self.assertFalse(any("chats_authtoken" in q["sql"] for q in ctx.captured_queries))
+
+    def test_cached_user_is_not_shared_between_requests(self):
+        cache = TokenCache()
+        cache.put("a", self.user, None)
+        self.user.first_name = "changed by the caller"
+        first, second = cache.get("a")[0], cache.get("a")[0]
+        self.assertIsNot(first, second)
+        first._request_scratch = "x"
+        first.first_name = "changed by a request"
+        self.assertFalse(hasattr(second, "_request_scratch"))
+        self.assertEqual(cache.get("a")[0].first_name, "Dana")
+        self.assertEqual(cache.get("a")[0].pk, self.user.pk)
+
+    def test_revoked_token_is_rejected_immediately(self):
+        raw = self.issue()
+        self.assertEqual(self.get_inbox(raw).status_code, 200)
+        response = self.client.delete("/api/auth/tokens/current/", HTTP_AUTHORIZATION=f"Bearer {raw}")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_inbox(raw).status_code, 401)
+
+    def test_deactivating_the_user_evicts_cached_tokens(self):
+        raw = self.issue()
+        self.assertEqual(self.get_inbox(raw).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_inbox(raw).status_code, 401)
+
+    def test_expired_token_is_rejected(self):
+        raw = self.issue()
+        AuthToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        token_cache.clear()
+        self.assertEqual(self.get_inbox(raw).status_code, 401)
+
+    def test_cache_is_bounded(self):
+        cache = TokenCache(max_entries=2)
+        for digest in "abc":
+            cache.put(digest, self.user, None)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))
+        cache.invalidate_user(self.user.pk)
+        self.assertEqual(len(cache), 0)
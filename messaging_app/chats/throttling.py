@@ -0,0 +1,189 @@
+"""
+Token-bucket throttles for sending messages.
+
+Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+second; a send takes one. The in-process store keeps a single float per
+bucket, the time it will be full again (the GCRA form of a token bucket), in
+lock-striped dicts so concurrent senders rarely share a lock. A bucket that
+has refilled is indistinguishable from a new one, so idle buckets are swept
+without changing any answer. ``CHATS_THROTTLE_STORE`` names the store class;
+a shared store (e.g. Redis) only has to implement :class:`BaseBucketStore`.
+"""
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_STORE = "chats.throttling.InMemoryBucketStore"
+DEFAULT_STRIPES = 64
+DEFAULT_SWEEP_INTERVAL = 60.0
+
+
+class BaseBucketStore:
+    """Interface every bucket store implements"""
+
+    def consume(self, key, burst, rate, cost=1):
+        """
+        Take ``cost`` tokens from ``key``'s bucket if it has them.
+
+        Returns ``(allowed, retry_after)``: ``retry_after`` is the number of
+        seconds until the bucket holds ``cost`` tokens, 0 when allowed and
+        ``None`` when ``cost`` exceeds ``burst`` and never will.
+        """
+        raise NotImplementedError
+
+    def refund(self, key, burst, rate, cost=1):
+        """Give back ``cost`` tokens that ``consume`` took from ``key``'s bucket"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryBucketStore(BaseBucketStore):
+    """Single-process store; each process throttles independently"""
+
+    def __init__(self, stripes=DEFAULT_STRIPES, sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._buckets = [{} for _ in range(stripes)]
+        self._swept = [0.0] * stripes
+
+    def consume(self, key, burst, rate, cost=1, now=None):
+        if cost > burst:
+            return False, None
+        now = time.monotonic() if now is None else now
+        index = hash(key) % len(self._locks)
+        buckets = self._buckets[index]
+        with self._locks[index]:
+            if now - self._swept[index] >= self.sweep_interval:
+                self._sweep(buckets, now)
+                self._swept[index] = now
+            # full_at - now is how far below full the bucket is, in seconds of refill
+            full_at = max(buckets.get(key, now), now)
+            tokens = burst - (full_at - now) * rate
+            if tokens >= cost:
+                buckets[key] = full_at + cost / rate
+                return True, 0.0
+            return False, (cost - tokens) / rate
+
+    def refund(self, key, burst, rate, cost=1, now=None):
+        now = time.monotonic() if now is None else now
+        index = hash(key) % len(self._locks)
+        buckets = self._buckets[index]
+        with self._locks[index]:
+            full_at = buckets.get(key)
+            if full_at is None:
+                return
+            full_at -= cost / rate
+            if full_at <= now:
+                del buckets[key]
+            else:
+                buckets[key] = full_at
+
+    def clear(self):
+        for lock, buckets in zip(self._locks, self._buckets):
+            with lock:
+                buckets.clear()
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._buckets)
+
+    @staticmethod
+    def _sweep(buckets, now):
+        for key in [key for key, full_at in buckets.items() if full_at <= now]:
+            del buckets[key]
+
+
+@lru_cache(maxsize=None)
+def get_bucket_store():
+    """The process-wide bucket store configured by ``CHATS_THROTTLE_STORE``"""
+    return import_string(getattr(settings, "CHATS_THROTTLE_STORE", DEFAULT_STORE))()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle backed by a token bucket per ``get_key()``.
+
+    ``setting`` names a ``{"burst": tokens, "rate": tokens per second}`` dict;
+    ``None`` turns the throttle off.
+    """
+    setting = None
+    scope = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        self.taken = None
+        config = getattr(settings, self.setting, None)
+        key = self.get_key(request, view)
+        if config is None or key is None:
+            return True
+        bucket = f"{self.scope}:{key}"
+        allowed, self.retry_after = get_bucket_store().consume(bucket, config["burst"], config["rate"])
+        if allowed:
+            self.taken = (bucket, config)
+        return allowed
+
+    def refund(self):
+        """Return the token ``allow_request`` took, if it took one"""
+        if self.taken is not None:
+            bucket, config = self.taken
+            get_bucket_store().refund(bucket, config["burst"], config["rate"])
+            self.taken = None
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserSendThrottle(TokenBucketThrottle):
+    """Messages a single user may send, across all conversations"""
+    setting = "CHATS_SEND_THROTTLE_USER"
+    scope = "send-user"
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class ConversationSendThrottle(TokenBucketThrottle):
+    """Messages a single conversation accepts, from all of its senders together"""
+    setting = "CHATS_SEND_THROTTLE_CONVERSATION"
+    scope = "send-conversation"
+
+    def get_key(self, request, view):
+        """The canonical conversation id, so re-casing or undashing it does not open a new bucket"""
+        value = view.kwargs.get("conversation_pk") or request.data.get("conversation")
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None  # not a conversation; the view rejects the request anyway
+
+
+SEND_THROTTLES = [UserSendThrottle, ConversationSendThrottle]
+
+
+def check_send_throttles(request, view):
+    """
+    Take a token from every send bucket, or raise ``Throttled`` with the
+    longest wait as ``APIView.check_throttles`` does.
+
+    Views call this once the send has been validated, and a send that one
+    bucket rejects gets its tokens back from the others, so rejected
+    requests do not drain the buckets.
+    """
+    throttles = [throttle() for throttle in SEND_THROTTLES]
+    waits = [throttle.wait() for throttle in throttles if not throttle.allow_request(request, view)]
+    if waits:
+        for throttle in throttles:
+            throttle.refund()
+        known = [wait for wait in waits if wait is not None]
+        raise Throttled(max(known) if known else None)
@@ -1,6 +1,10 @@
 from django.urls import path, include
 from rest_framework_nested import routers
-from .views import ConversationViewSet, MessageViewSet
+from .streams import message_stream
+from .views import (
+    AuthTokenView, ConversationViewSet, CurrentAuthTokenView, MessageBulkCreateView, MessageViewSet,
+    PerformanceStatsView,
+)
 
 router = routers.DefaultRouter()
 router.register(r"conversations", ConversationViewSet, basename="conversation")
@@ -10,6 +14,11 @@ conversations_router = routers.NestedDefaultRouter(router, r"conversations", loo
 conversations_router.register(r"messages", MessageViewSet, basename="conversation-messages")
 
 urlpatterns = [
+    path("conversations/<uuid:conversation_pk>/stream/", message_stream, name="conversation-stream"),
+    path("messages/bulk/", MessageBulkCreateView.as_view(), name="message-bulk-create"),
+    path("auth/tokens/", AuthTokenView.as_view(), name="auth-token"),
+    path("auth/tokens/current/", CurrentAuthTokenView.as_view(), name="auth-token-current"),
+    path("stats/performance/", PerformanceStatsView.as_view(), name="performance-stats"),
     path("", include(router.urls)),
     path("", include(conversations_router.urls)),
 ]
@@ -1,40 +1,274 @@
-from rest_framework import viewsets, status, filters
+import uuid
+from datetime import timedelta
+
+from rest_framework import generics, viewsets, status, filters, permissions
+from rest_framework.decorators import action
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+
+from .cache import VersionedResponseCacheMixin, bump_conversation_version, stats as cache_stats
+from .compact import compact_conversation, compact_message, message_rows, wants_compact
+from .export import FORMATS as EXPORT_FORMATS, ExportError, encode, export_rows, export_tiers
+from .metrics import phase, route_stats, slow_queries
+from .authentication import HashedTokenAuthentication
+from .models import ArchivedMessage, AuthToken, Conversation, IdempotencyKey, Message, User
+from .pagination import InboxCursorPagination, MessageCursorPagination
+from .renderers import CSVRenderer, FastJSONRenderer, NDJSONRenderer
+from .search import MessageSearchFilter, build_match_query
+from .serializers import (
+    BulkMessageItemSerializer, ConversationSerializer, InboxConversationSerializer,
+    MessageSearchResultSerializer, MessageSerializer,
+)
+from .streams import publish_message
+from .tasks import queue_fan_out
+from .throttling import check_send_throttles
+
 
-from .models import Conversation, Message
-from .serializers import ConversationSerializer, MessageSerializer
+def conversation_read_queryset():
+    """Conversations with participants, messages and senders prefetched in a fixed number of queries"""
+    return Conversation.objects.prefetch_related(
+        Prefetch("participants"),
+        Prefetch(
+            "messages",
+            queryset=Message.objects.select_related("sender").order_by("sent_at"),
+            to_attr="ordered_messages",
+        ),
+    )
 
 
-class ConversationViewSet(viewsets.ModelViewSet):
+class ConversationViewSet(VersionedResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Conversation.objects.all().order_by("-created_at")
     serializer_class = ConversationSerializer
+    lookup_value_regex = "[0-9a-fA-F-]{32,36}"
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     filter_backends = [filters.SearchFilter]
     search_fields = ["participants__username", "participants__email"]
 
+    def get_queryset(self):
+        if self.action in ("list", "retrieve"):
+            return conversation_read_queryset().order_by("-created_at")
+        return super().get_queryset()
+
+    def retrieve(self, request, *args, **kwargs):
+        if wants_compact(request, self):
+            return self.cached_response(request, kwargs["pk"], lambda: self.compact_retrieve(kwargs["pk"]))
+        return self.cached_response(
+            request, kwargs["pk"], lambda: super(ConversationViewSet, self).retrieve(request, *args, **kwargs)
+        )
+
+    def compact_retrieve(self, pk):
+        data = compact_conversation(pk)
+        if data is None:
+            raise Http404("No Conversation matches the given query.")
+        return Response(data)
+
     def create(self, request, *args, **kwargs):
-        """Create a new conversation with participants"""
-        participants_ids = request.data.get("participants", [])
+        """
+        Create a conversation with participants, or return the existing one for
+        a two-person conversation. Requests with an ``Idempotency-Key`` header
+        are answered from the first request that used the key.
+        """
+        if hasattr(request.data, "getlist"):
+            participants_ids = request.data.getlist("participants")
+        else:
+            participants_ids = request.data.get("participants", [])
         if not participants_ids:
             return Response(
                 {"error": "At least one participant is required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        conversation = Conversation.objects.create()
-        conversation.participants.set(participants_ids)
+        if not isinstance(participants_ids, list):
+            participants_ids = [participants_ids]
+        try:
+            participants_ids = {uuid.UUID(str(pk)) for pk in participants_ids}
+        except ValueError:
+            return Response({"error": "Participants must be user ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        request_hash = Conversation.participant_set_hash(participants_ids)
+        key = request.headers.get("Idempotency-Key")
+        if key:
+            replay = self.replay_idempotent(request, key, request_hash)
+            if replay is not None:
+                return replay
+
+        found = set(User.objects.filter(pk__in=participants_ids).values_list("pk", flat=True))
+        if found != participants_ids:
+            unknown = sorted(str(pk) for pk in participants_ids - found)
+            return Response(
+                {"error": f"Unknown participants: {', '.join(unknown)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not key:
+            conversation, created = Conversation.open(participants_ids)
+            return self.conversation_response(conversation.pk, created)
+        try:
+            with transaction.atomic():
+                conversation, created = Conversation.open(participants_ids)
+                IdempotencyKey.objects.create(
+                    user=request.user, key=key, request_hash=request_hash,
+                    conversation=conversation, created=created,
+                )
+        except IntegrityError:
+            # A concurrent retry stored the key first; its conversation is the answer.
+            return self.replay_idempotent(request, key, request_hash)
+        return self.conversation_response(conversation.pk, created)
+
+    def replay_idempotent(self, request, key, request_hash):
+        """The stored response for ``key``, None if unused or expired, 422 if it was used for another request"""
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if stored is None:
+            return None
+        ttl = getattr(settings, "CHATS_IDEMPOTENCY_KEY_TTL", 24 * 3600)
+        if stored.created_at < timezone.now() - timedelta(seconds=ttl):
+            stored.delete()
+            return None
+        if stored.request_hash != request_hash:
+            return Response(
+                {"error": "Idempotency-Key was already used with different participants"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        response = self.conversation_response(stored.conversation_id, stored.created)
+        response["Idempotent-Replayed"] = "true"
+        return response
+
+    def conversation_response(self, pk, created):
+        conversation = conversation_read_queryset().get(pk=pk)
         serializer = self.get_serializer(conversation)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
+    @action(detail=False, methods=["get"])
+    def inbox(self, request):
+        """The user's conversations by last activity, without message history"""
+        queryset = (
+            Conversation.objects.filter(participants=request.user)
+            .select_related("last_message__sender")
+            .prefetch_related("participants")
+        )
+        paginator = InboxCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = InboxConversationSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
-class MessageViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=["get"], renderer_classes=[NDJSONRenderer, CSVRenderer, FastJSONRenderer])
+    def export(self, request, pk=None):
+        """
+        Stream the full history as NDJSON (default) or CSV; resume with ?after= or ?since=
+
+        The format comes from ?output=, else from the negotiated renderer
+        (``Accept: text/csv`` / ``application/x-ndjson`` or ?format=).
+        """
+        negotiated = request.accepted_renderer.format
+        output = request.query_params.get("output", negotiated if negotiated in EXPORT_FORMATS else "ndjson")
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        members = Conversation.objects.filter(pk=pk)
+        if not request.user.is_staff:
+            members = members.filter(participants=request.user)
+        if not members.exists():
+            return Response({"error": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            tiers = export_tiers(
+                pk, since=request.query_params.get("since"), after=request.query_params.get("after")
+            )
+        except ExportError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(encode(export_rows(tiers), output), content_type=EXPORT_FORMATS[output])
+        response["Content-Disposition"] = f'attachment; filename="conversation-{pk}.{output}"'
+        return response
+
+    @action(detail=False, methods=["get"], url_path="search")
+    def search_messages(self, request):
+        """Best-ranked messages matching ?search= across the user's conversations"""
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 20)), 100))
+        except ValueError:
+            limit = 20
+        backend = MessageSearchFilter()
+        if not build_match_query(backend.get_search_text(request)):
+            return Response({"results": []})
+        queryset = backend.filter_queryset(request, Message.objects.select_related("sender"), self)
+        results = queryset.order_by("search_rank", "message_id")[:limit]
+        serializer = MessageSearchResultSerializer(results, many=True, context=self.get_serializer_context())
+        return Response({"results": serializer.data})
+
+
+class MessageViewSet(VersionedResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all().order_by("sent_at")
     serializer_class = MessageSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ["message_body", "sender__username"]
+    pagination_class = MessageCursorPagination
+    filter_backends = [MessageSearchFilter]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        """Only the messages of the conversation named by the nested route"""
+        queryset = super().get_queryset().select_related("sender")
+        conversation_pk = self.kwargs.get("conversation_pk")
+        if conversation_pk is not None:
+            queryset = queryset.filter(conversation_id=conversation_pk)
+        return queryset
+
+    def get_tiers(self, queryset):
+        """
+        The nested list reads the hot table first, then the archive. Search
+        only covers the hot tier, which is the one in the FTS index.
+        """
+        conversation_pk = self.kwargs.get("conversation_pk")
+        if conversation_pk is None or MessageSearchFilter.search_param in self.request.query_params:
+            return [queryset]
+        archived = ArchivedMessage.objects.filter(conversation_id=conversation_pk).select_related("sender")
+        return [queryset, archived]
+
+    def paginate_queryset(self, queryset):
+        return super().paginate_queryset(self.get_tiers(queryset))
+
+    def get_object(self):
+        """Archived messages can still be read by id through the nested route"""
+        try:
+            return super().get_object()
+        except Http404:
+            conversation_pk = self.kwargs.get("conversation_pk")
+            if self.action != "retrieve" or conversation_pk is None:
+                raise
+        message = generics.get_object_or_404(
+            ArchivedMessage.objects.select_related("sender"),
+            pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field],
+            conversation_id=conversation_pk,
+        )
+        self.check_object_permissions(self.request, message)
+        return message
+
+    def list(self, request, *args, **kwargs):
+        conversation_pk = kwargs.get("conversation_pk")
+        if conversation_pk is None:
+            return super().list(request, *args, **kwargs)
+        if wants_compact(request, self):
+            return self.cached_response(request, conversation_pk, self.compact_list)
+        return self.cached_response(
+            request, conversation_pk, lambda: super(MessageViewSet, self).list(request, *args, **kwargs)
+        )
+
+    def compact_list(self):
+        tiers = self.get_tiers(self.filter_queryset(self.get_queryset()))
+        page = self.paginator.paginate_queryset([message_rows(tier) for tier in tiers], self.request, view=self)
+        with phase("serialize"):
+            data = [compact_message(row) for row in page]
+        return self.get_paginated_response(data)
 
     def create(self, request, *args, **kwargs):
         """Send a message to an existing conversation"""
-        conversation_id = request.data.get("conversation")
+        conversation_id = self.kwargs.get("conversation_pk") or request.data.get("conversation")
         message_body = request.data.get("message_body")
 
         if not conversation_id or not message_body:
@@ -44,8 +278,165 @@ class MessageViewSet(viewsets.ModelViewSet):
             )
 
         conversation = get_object_or_404(Conversation, conversation_id=conversation_id)
-        message = Message.objects.create(
-            sender=request.user, conversation=conversation, message_body=message_body
-        )
+        check_send_throttles(request, self)
+        with transaction.atomic():
+            message = Message.objects.create(
+                sender=request.user, conversation=conversation, message_body=message_body
+            )
+            Conversation.record_message(message)
+            queue_fan_out([message])
+            transaction.on_commit(lambda: publish_message(message))
         serializer = self.get_serializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            conversation = Conversation.objects.select_for_update().get(pk=instance.conversation_id)
+            instance.delete()
+            conversation.refresh_inbox_fields()
+
+
+class MessageBulkCreateView(APIView):
+    """
+    Ingest many messages across many conversations in one request.
+
+    Invalid items are reported by index and skipped; the valid ones are
+    inserted together in a single transaction.
+    """
+    max_messages = getattr(settings, "CHATS_BULK_MAX_MESSAGES", 5000)
+    batch_size = 500
+
+    def post(self, request):
+        items = request.data.get("messages") if isinstance(request.data, dict) else None
+        if not isinstance(items, list) or not items:
+            return Response(
+                {"error": "messages must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.max_messages:
+            return Response(
+                {"error": f"At most {self.max_messages} messages per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(items)
+        valid = []
+        context = {"request": request}
+        for index, item in enumerate(items):
+            serializer = BulkMessageItemSerializer(data=item, context=context)
+            if serializer.is_valid():
+                data = serializer.validated_data
+                data.setdefault("sender", request.user.pk)
+                valid.append((index, data))
+            else:
+                results[index] = {"index": index, "errors": serializer.errors}
+
+        members = self.memberships(valid)
+        senders = self.senders(request, valid)
+        messages = []
+        for index, data in valid:
+            if (data["conversation"], data["sender"]) not in members:
+                results[index] = {
+                    "index": index,
+                    "errors": {"conversation": ["Sender is not a participant of this conversation."]},
+                }
+                continue
+            message = Message(
+                conversation_id=data["conversation"],
+                sender=senders[data["sender"]],
+                message_body=data["message_body"],
+            )
+            if "sent_at" in data:
+                message.sent_at = data["sent_at"]
+            messages.append(message)
+            results[index] = {"index": index, "message_id": str(message.message_id)}
+
+        if messages:
+            with transaction.atomic():
+                Message.objects.bulk_create(messages, batch_size=self.batch_size)
+                latest = {}
+                counts = {}
+                for message in messages:
+                    key = message.conversation_id
+                    counts[key] = counts.get(key, 0) + 1
+                    if key not in latest or message.sent_at >= latest[key].sent_at:
+                        latest[key] = message
+                for key, message in latest.items():
+                    Conversation.record_message(message, count=counts[key])
+                    bump_conversation_version(key)  # bulk_create sends no post_save
+                queue_fan_out(messages)
+                transaction.on_commit(lambda: [publish_message(m) for m in messages])
+
+        if len(messages) == len(items):
+            response_status = status.HTTP_201_CREATED
+        elif messages:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"created": len(messages), "results": results}, status=response_status)
+
+    def memberships(self, valid):
+        """(conversation_id, user_id) pairs that exist, fetched with one query"""
+        if not valid:
+            return set()
+        through = Conversation.participants.through
+        return set(
+            through.objects.filter(
+                conversation_id__in={data["conversation"] for _, data in valid},
+                user_id__in={data["sender"] for _, data in valid},
+            ).values_list("conversation_id", "user_id")
+        )
+
+    def senders(self, request, valid):
+        ids = {data["sender"] for _, data in valid} - {request.user.pk}
+        senders = User.objects.in_bulk(ids) if ids else {}
+        senders[request.user.pk] = request.user
+        return senders
+
+
+class AuthTokenView(APIView):
+    """Exchange email and password for a bearer token (the only request that pays for the password hash)"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        email = request.data.get("email")
+        password = request.data.get("password")
+        if not email or not password:
+            return Response(
+                {"error": "email and password are required"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        user = authenticate(request, username=email, password=password)
+        if user is None:
+            return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+        ttl = timedelta(seconds=getattr(settings, "CHATS_TOKEN_TTL", 30 * 24 * 3600))
+        token, raw = AuthToken.issue(user, ttl=ttl, name=str(request.data.get("name", ""))[:100])
+        return Response(
+            {"token": raw, "expires_at": token.expires_at}, status=status.HTTP_201_CREATED
+        )
+
+
+class CurrentAuthTokenView(APIView):
+    """Revoke the bearer token used for this request"""
+    authentication_classes = [HashedTokenAuthentication]
+
+    def delete(self, request):
+        AuthToken.objects.get(digest=request.auth).revoke()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class PerformanceStatsView(APIView):
+    """Per-route latency histograms, sampled slow queries and response cache counters (staff only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "window_seconds": route_stats.window,
+            "routes": route_stats.snapshot(),
+            "slow_queries": slow_queries.snapshot(),
+            "response_cache": cache_stats.snapshot(),
+        })
+
+    def delete(self, request):
+        route_stats.reset()
+        slow_queries.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -2,6 +2,9 @@
 ASGI config for messaging_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn messaging_app.asgi:application``)
+to enable the Server-Sent Events stream at
+``/api/conversations/<id>/stream/``; under WSGI that endpoint answers 501.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
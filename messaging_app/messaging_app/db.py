@@ -0,0 +1,132 @@
+"""
+SQLite connection profiles and read/write routing for messaging_app.
+
+``settings.py`` picks a profile with the ``MESSAGING_DB_PROFILE`` environment
+variable. The ``production`` profile switches the database to WAL (readers
+no longer block on the writer), applies the PRAGMAs below on every new
+connection, starts write transactions as ``BEGIN IMMEDIATE`` so concurrent
+writers queue on ``busy_timeout`` instead of failing with "database is
+locked", and keeps connections open between requests.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Per-request state of ReadYourWritesMiddleware; None outside a request.
+_request_state = ContextVar('replica_request_state', default=None)
+
+PROFILES = {
+    # Django's defaults: rollback journal, deferred transactions, one connection per request.
+    'default': {
+        'pragmas': {},
+        'transaction_mode': None,
+        'timeout': 5,
+        'conn_max_age': 0,
+    },
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',  # durable across app crashes; WAL makes it safe
+            'busy_timeout': 5000,  # ms
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64000,  # negative = KiB, i.e. 64 MiB per connection
+            'temp_store': 'MEMORY',
+            'foreign_keys': 'ON',
+        },
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 5,
+        'conn_max_age': 600,
+    },
+}
+
+
+def init_command(pragmas):
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
+def sqlite_database(name, profile='default', read_only=False):
+    """A ``DATABASES`` entry for the SQLite file ``name`` configured by ``profile``"""
+    try:
+        config = PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown database profile {profile!r}; choose from {', '.join(PROFILES)}")
+    pragmas = dict(config['pragmas'])
+    options = {'timeout': config['timeout']}
+    if read_only:
+        # journal_mode cannot be changed on a read-only connection
+        pragmas.pop('journal_mode', None)
+        pragmas['query_only'] = 'ON'
+        name = f'file:{name}?mode=ro'
+    elif config['transaction_mode']:
+        options['transaction_mode'] = config['transaction_mode']
+    if pragmas:
+        options['init_command'] = init_command(pragmas)
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': options,
+        'CONN_MAX_AGE': config['conn_max_age'],
+        'CONN_HEALTH_CHECKS': config['conn_max_age'] > 0,
+    }
+
+
+class ReadReplicaRouter:
+    """
+    Send ORM reads to the ``replica`` alias and everything else to ``default``.
+
+    Reads inside a transaction on ``default`` stay there. Within a request
+    wrapped by :class:`ReadYourWritesMiddleware`, every read after the
+    request's first write goes to ``default`` too, so a lagging replica
+    never hides what the request just wrote. Outside a request only the
+    transaction rule applies.
+    """
+    read_alias = 'replica'
+    write_alias = 'default'
+
+    def db_for_read(self, model, **hints):
+        from django.db import connections
+
+        state = _request_state.get()
+        if (state is not None and state['wrote']) or connections[self.write_alias].in_atomic_block:
+            return self.write_alias
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return self.write_alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == self.write_alias
+
+
+class ReadYourWritesMiddleware:
+    """Scope :class:`ReadReplicaRouter`'s pin to the writer to a single request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request_state.set({'wrote': False})
+        try:
+            return self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+    async def __acall__(self, request):
+        # A mutable dict, so writes made in sync_to_async threads are seen here too
+        token = _request_state.set({'wrote': False})
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_state.reset(token)
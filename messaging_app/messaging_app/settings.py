@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .db import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chats.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,10 +78,37 @@ WSGI_APPLICATION = 'messaging_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# MESSAGING_DB_PROFILE=production enables WAL, tuned PRAGMAs, IMMEDIATE write
+# transactions and persistent connections (see messaging_app/db.py).
+# MESSAGING_DB_REPLICA=<path> adds a read-only 'replica' alias that the router
+# sends ORM reads to; point it at the same file to get a separate read
+# connection, or at a replicated copy (e.g. Litestream/LiteFS). A request
+# reads from 'default' once it has written, so replica lag never hides its
+# own writes (ReadYourWritesMiddleware).
+
+DATABASE_PROFILE = os.environ.get('MESSAGING_DB_PROFILE', 'default')
+
 DATABASES = {
+    'default': sqlite_database(BASE_DIR / 'db.sqlite3', DATABASE_PROFILE),
+}
+
+if os.environ.get('MESSAGING_DB_REPLICA'):
+    DATABASES['replica'] = sqlite_database(
+        os.environ['MESSAGING_DB_REPLICA'], DATABASE_PROFILE, read_only=True
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['messaging_app.db.ReadReplicaRouter']
+    MIDDLEWARE.insert(1, 'messaging_app.db.ReadYourWritesMiddleware')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'messaging-app',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
     }
 }
 
@@ -131,7 +162,51 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'chats.authentication.HashedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
 }
+
+# Chats app
+
+# Real-time message streaming (chats.streams, served under ASGI)
+CHATS_BROKER = 'chats.broker.InMemoryBroker'
+CHATS_STREAM_QUEUE_SIZE = 100  # events buffered per connection before it is cut off
+CHATS_STREAM_KEEPALIVE = 15  # seconds between SSE keepalive comments
+
+CHATS_BULK_MAX_MESSAGES = 5000  # items accepted per POST /api/messages/bulk/
+CHATS_IDEMPOTENCY_KEY_TTL = 24 * 3600  # seconds an Idempotency-Key on conversation create is honoured
+
+# Background jobs (chats.jobs): fan-out work after a message is sent, queued only
+# while chats.tasks.message_sent has receivers
+CHATS_JOB_WORKERS = int(os.environ.get('MESSAGING_JOB_WORKERS', '0'))  # threads per web process; 0 leaves jobs to manage.py run_workers (check --deploy warns)
+CHATS_JOB_BATCH_SIZE = 10  # jobs a worker claims at a time
+CHATS_JOB_POLL_INTERVAL = 1.0  # seconds between looks at an empty queue
+CHATS_JOB_LEASE = 300  # seconds before a running job whose worker vanished is requeued
+CHATS_JOB_RETRY_BASE = 5  # seconds before the first retry; doubles per attempt
+CHATS_JOB_RETRY_MAX = 3600
+
+# Token buckets for sending messages (chats.throttling); None disables a throttle
+CHATS_THROTTLE_STORE = 'chats.throttling.InMemoryBucketStore'
+CHATS_SEND_THROTTLE_USER = {'burst': 30, 'rate': 1.0}  # tokens, tokens refilled per second
+CHATS_SEND_THROTTLE_CONVERSATION = {'burst': 120, 'rate': 10.0}
+
+# Versioned response cache for conversation and message reads (chats.cache)
+CHATS_RESPONSE_CACHE = 'default'
+CHATS_RESPONSE_CACHE_TIMEOUT = 300
+
+# Request instrumentation (chats.middleware, chats.metrics); stats at /api/stats/performance/
+CHATS_SERVER_TIMING = True  # add a Server-Timing header to every response
+CHATS_METRICS_WINDOW = 300  # seconds per histogram window; stats cover the last one to two windows
+CHATS_SLOW_QUERY_MS = 100  # queries at least this slow are candidates for sampling
+CHATS_SLOW_QUERY_SAMPLES = 20  # slowest queries kept
+
+# Bearer tokens (chats.authentication)
+CHATS_TOKEN_TTL = 30 * 24 * 3600  # seconds a newly issued token stays valid
+CHATS_TOKEN_CACHE_SIZE = 10000  # resolved tokens kept in each process
+CHATS_TOKEN_CACHE_TTL = 60  # seconds before a cached token is re-checked against the database
+
+# Message archival (chats.archive, manage.py archive_messages)
+CHATS_ARCHIVE_AFTER_DAYS = 365  # default age before a message moves to the archive; None disables it
+CHATS_ARCHIVE_BATCH_SIZE = 1000  # messages moved per transaction
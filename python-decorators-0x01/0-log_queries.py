@@ -1,30 +1,49 @@
-import sqlite3
 import functools
-from datetime import datetime
+import time
+
+from db_pool import get_pool
+from db_stream import iter_rows, streaming_connection
+from query_log import call_arguments, default_logger as query_logger, row_count
 
 def log_queries(func):
-    """Decorator that logs the SQL query before executing it"""
+    """Decorator that times each query and logs it from a background thread (see query_log)"""
+    sql_name, sql_at, params_at = call_arguments(func)
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if 'query' in kwargs:
-            print(f"[{timestamp}] Executing SQL Query: {kwargs['query']}")
-        elif len(args) > 0:
-            print(f"[{timestamp}] Executing SQL Query: {args[0]}")
-        return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            rows, error = None, e
+            raise
+        else:
+            rows = row_count(result)
+            error = None
+            return result
+        finally:
+            ended = time.perf_counter()
+            query = kwargs[sql_name] if sql_name in kwargs else args[sql_at] if sql_at < len(args) else None
+            params = kwargs["params"] if "params" in kwargs else args[params_at] if params_at < len(args) else None
+            query_logger.record(query, params, started, ended, rows, error)
     return wrapper
 
 
 @log_queries
 def fetch_all_users(query):
-    conn = sqlite3.connect('users.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+@streaming_connection
+def stream_all_users(conn, query, size=1000):
+    """Like fetch_all_users, yielding rows ``size`` at a time instead of building one list"""
+    yield from iter_rows(conn, query, size=size)
 
 
 if __name__ == "__main__":
     users = fetch_all_users(query="SELECT * FROM users")
     print(users)
+    query_logger.dump()
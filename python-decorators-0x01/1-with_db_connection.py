@@ -1,15 +1,13 @@
-import sqlite3
 import functools
 
+from db_pool import get_pool
+
 def with_db_connection(func):
-    """Decorator to handle opening and closing the DB connection"""
+    """Decorator to borrow a pooled DB connection for the call"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
+        with get_pool().connection() as conn:
             return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
     return wrapper
 
 
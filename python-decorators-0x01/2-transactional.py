@@ -1,32 +1,54 @@
-import sqlite3
 import functools
 
+from db_pool import get_pool
+from db_stream import bulk_execute
+from query_cache import default_cache, track_writes
+from write_batch import default_committer
+
 def with_db_connection(func):
-    """Handles DB connection automatically"""
+    """Borrows a pooled DB connection for the call"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
+        with get_pool().connection() as conn:
             return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
     return wrapper
 
 
 def transactional(func):
-    """Decorator to manage transactions"""
+    """Decorator to manage transactions; committed writes invalidate cached queries on their tables"""
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
         try:
-            result = func(conn, *args, **kwargs)
+            with track_writes(conn) as written:
+                result = func(conn, *args, **kwargs)
             conn.commit()
-            return result
         except Exception as e:
             conn.rollback()
             raise e
+        if written:
+            default_cache.invalidate_tables(written)
+        return result
     return wrapper
 
 
+def group_commit(committer=default_committer):
+    """Runs the write in a batch shared with concurrent callers, one commit per batch
+
+    Use instead of ``with_db_connection`` + ``transactional``: the function
+    still gets a connection and its own result or exception, but runs in a
+    savepoint of a transaction committed with other queued writes.
+    ``wrapper.submit(...)`` queues a call without waiting for it.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return committer.submit(func, args, kwargs).result()
+
+        wrapper.submit = lambda *args, **kwargs: committer.submit(func, args, kwargs)
+        return wrapper
+    return decorator
+
+
 @with_db_connection
 @transactional
 def update_user_email(conn, user_id, new_email):
@@ -34,6 +56,19 @@ def update_user_email(conn, user_id, new_email):
     cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
 
 
+@with_db_connection
+@transactional
+def update_user_emails(conn, updates):
+    """Apply ``(new_email, user_id)`` pairs from any iterable in one statement and one commit"""
+    return bulk_execute(conn, "UPDATE users SET email = ? WHERE id = ?", updates)
+
+
+@group_commit()
+def update_user_email_batched(conn, user_id, new_email):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
 if __name__ == "__main__":
     update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
     print("Email updated successfully!")
@@ -1,45 +1,68 @@
 import time
-import sqlite3
 import functools
 
+from db_pool import get_pool
+from db_stream import iter_cursor, open_cursor
+from retry_policy import decorrelated_jitter, default_budget, is_transient
+
 def with_db_connection(func):
-    """Handles DB connection automatically"""
+    """Borrows a pooled DB connection for the call"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
+        with get_pool().connection() as conn:
             return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
     return wrapper
 
 
-def retry_on_failure(retries=3, delay=2):
-    """Retries DB function on failure"""
+def retry_on_failure(retries=3, delay=2, max_delay=None, max_elapsed=None, budget=default_budget):
+    """Retries DB function on transient failure (locked/busy database, pool timeout)
+
+    Sleeps grow from ``delay`` with decorrelated jitter up to ``max_delay``
+    (default ``delay * 16``) and stop once ``max_elapsed`` seconds (default
+    ``max_delay * retries``) would be exceeded. Each retry spends from the
+    process-wide ``budget``; when it is empty the error is raised at once.
+    Apply it outside ``with_db_connection`` so every attempt borrows the
+    connection again after the failed one was rolled back.
+    """
+    max_delay = delay * 16 if max_delay is None else max_delay
+    max_elapsed = max_delay * retries if max_elapsed is None else max_elapsed
+
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(retries):
+            budget.record_call()
+            started = time.monotonic()
+            sleeps = decorrelated_jitter(delay, max_delay)
+            for attempt in range(1, retries + 1):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    print(f"Attempt {attempt+1} failed: {e}")
-                    last_exception = e
-                    time.sleep(delay)
-            raise last_exception
+                    if not is_transient(e) or attempt == retries:
+                        raise
+                    pause = next(sleeps)
+                    if time.monotonic() - started + pause > max_elapsed or not budget.try_spend():
+                        raise
+                    print(f"Attempt {attempt} failed: {e}; retrying in {pause:.3f}s")
+                    time.sleep(pause)
         return wrapper
     return decorator
 
 
-@with_db_connection
 @retry_on_failure(retries=3, delay=1)
+@with_db_connection
 def fetch_users_with_retry(conn):
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users")
     return cursor.fetchall()
 
 
+def stream_users_with_retry(size=1000):
+    """Yields users ``size`` at a time; checkout and query are retried, rows already yielded cannot be"""
+    checkout, cursor = retry_on_failure(retries=3, delay=1)(open_cursor)("SELECT * FROM users", size=size)
+    with checkout:
+        yield from iter_cursor(cursor, size)
+
+
 if __name__ == "__main__":
     users = fetch_users_with_retry()
     print(users)
@@ -1,30 +1,26 @@
-import sqlite3
 import functools
 
-query_cache = {}
+from db_pool import get_pool
+from query_cache import default_cache as query_cache, tables_in
 
 def with_db_connection(func):
-    """Handles DB connection automatically"""
+    """Borrows a pooled DB connection for the call"""
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect("users.db")
-        try:
+        with get_pool().connection() as conn:
             return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
     return wrapper
 
 
 def cache_query(func):
-    """Caches query results based on SQL string"""
+    """Caches query results by normalized SQL and parameters, until a write to one of its tables"""
     @functools.wraps(func)
     def wrapper(conn, query, *args, **kwargs):
-        if query in query_cache:
-            print(f"Cache hit for query: {query}")
-            return query_cache[query]
-        print(f"Cache miss for query: {query}")
-        result = func(conn, query, *args, **kwargs)
-        query_cache[query] = result
+        key = query_cache.make_key(query, (*args, *sorted(kwargs.items())))
+        result, hit = query_cache.get_or_load(
+            key, tables_in(query), lambda: func(conn, query, *args, **kwargs)
+        )
+        print(f"Cache {'hit' if hit else 'miss'} for query: {query}")
         return result
     return wrapper
 
@@ -0,0 +1,106 @@
+"""Calls per second of a decorated lookup: connect-per-call versus the shared pool
+
+Usage: python benchmark_db_pool.py [--calls N] [--threads 1 4 ...] [--pool-size N]
+
+Runs against a scratch users.db in a temporary directory, never ./users.db.
+"""
+import argparse
+import functools
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db_pool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+    conn.executemany(
+        "INSERT INTO users (id, name, email, age) VALUES (?, ?, ?, ?)",
+        ((i, f"user{i}", f"user{i}@example.com", 20 + i % 50) for i in range(1, rows + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def connect_per_call(func):
+    """The decorator as it was: a new connection for every call"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        conn = sqlite3.connect("users.db")
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            conn.close()
+    return wrapper
+
+
+@connect_per_call
+def get_user_unpooled(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+def run(func, calls, threads, rows):
+    per_thread = calls // threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        start.wait()
+        for i in range(per_thread):
+            func(user_id=(offset + i) % rows + 1)
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            seed("users.db", args.rows)
+            os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+            pooled = load_script("1-with_db_connection.py").get_user_by_id
+            pooled(user_id=1)  # open the first connection and switch to WAL outside the timing
+
+            print(f"{'threads':>7} {'connect/call':>14} {'pooled':>14} {'speedup':>8}")
+            for threads in args.threads:
+                before = run(get_user_unpooled, args.calls, threads, args.rows)
+                after = run(pooled, args.calls, threads, args.rows)
+                print(f"{threads:>7} {before:>12.0f}/s {after:>12.0f}/s {after / before:>7.1f}x")
+            print("pool stats:", db_pool.get_pool().stats())
+            db_pool.get_pool().close()
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
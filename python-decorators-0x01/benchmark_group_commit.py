@@ -0,0 +1,113 @@
+"""Writes per second of update_user_email: one commit per call versus group commit
+
+Usage: python benchmark_group_commit.py [--calls N] [--threads 1 4 ...] [--synchronous FULL|NORMAL]
+
+Threads call the decorated function and wait for it, as request handlers
+would; the "pipelined" row is one thread queueing every call with
+``submit`` before collecting the results. With --synchronous FULL (the
+default here) every commit is an fsync, which is the cost group commit
+shares. Runs against a scratch users.db in a temporary directory, never
+./users.db.
+"""
+import argparse
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db_pool
+from write_batch import GroupCommitter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+    conn.executemany(
+        "INSERT INTO users (id, name, email, age) VALUES (?, ?, ?, ?)",
+        ((i, f"user{i}", f"user{i}@example.com", 20 + i % 50) for i in range(1, rows + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(func, calls, threads, rows, tag):
+    per_thread = calls // threads
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        start.wait()
+        for i in range(per_thread):
+            user_id = (offset + i) % rows + 1
+            func(user_id=user_id, new_email=f"{tag}{user_id}@example.com")
+
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - began)
+
+
+def pipelined(func, calls, rows, tag):
+    began = time.perf_counter()
+    pending = [
+        func.submit(user_id=i % rows + 1, new_email=f"{tag}{i % rows + 1}@example.com") for i in range(calls)
+    ]
+    for write in pending:
+        write.result()
+    return calls / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--synchronous", default="FULL")
+    parser.add_argument("--max-wait-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            seed("users.db", args.rows)
+            db_pool.DEFAULT_PRAGMAS["synchronous"] = args.synchronous  # read when the pool opens connections
+            os.environ["DB_POOL_SIZE"] = str(max(args.threads) + 1)
+            script = load_script("2-transactional.py")
+            committer = GroupCommitter(max_wait=args.max_wait_ms / 1000)
+            batched = script.group_commit(committer)(script.update_user_email_batched.__wrapped__)
+
+            print(f"{'threads':>9} {'commit/call':>13} {'group':>13} {'speedup':>8}")
+            for threads in args.threads:
+                before = run(script.update_user_email, args.calls, threads, args.rows, f"a{threads}-")
+                after = run(batched, args.calls, threads, args.rows, f"b{threads}-")
+                print(f"{threads:>9} {before:>11.0f}/s {after:>11.0f}/s {after / before:>7.1f}x")
+            before = run(script.update_user_email, args.calls, 1, args.rows, "c-")
+            after = pipelined(batched, args.calls, args.rows, "d-")
+            print(f"{'pipelined':>9} {before:>11.0f}/s {after:>11.0f}/s {after / before:>7.1f}x")
+
+            with db_pool.get_pool().connection() as conn:
+                stale = conn.execute("SELECT COUNT(*) FROM users WHERE email NOT LIKE 'd-%'").fetchone()[0]
+            print("group commit stats:", committer.stats(), "rows not updated by the last run:", stale)
+            committer.close()
+            db_pool.get_pool().close()
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Per-call overhead of log_queries: the print-based decorator versus the queued logger
+
+Usage: python benchmark_query_log.py [--calls N] [--sample-rate R]
+
+Each decorator wraps the same function twice: one that does nothing (pure
+overhead) and one that runs a primary-key lookup on a scratch SQLite
+database. Printed output goes to os.devnull, the cheapest place it can go;
+on a terminal or a pipe the old decorator costs more.
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from query_log import QueryLogger
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def print_log_queries(func):
+    """The decorator as it was"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if 'query' in kwargs:
+            print(f"[{timestamp}] Executing SQL Query: {kwargs['query']}")
+        elif len(args) > 0:
+            print(f"[{timestamp}] Executing SQL Query: {args[0]}")
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def load_log_queries(logger):
+    """log_queries from 0-log_queries.py, recording into ``logger``"""
+    spec = importlib.util.spec_from_file_location("log_queries_0", os.path.join(HERE, "0-log_queries.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.query_logger = logger
+    return module.log_queries
+
+
+def per_call_us(func, calls, **kwargs):
+    start = time.perf_counter()
+    for i in range(calls):
+        func(params=(i % 1000 + 1,), **kwargs)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def best_of(variants, calls, rounds, **kwargs):
+    """Fastest round of each variant, rounds interleaved so drift hits all of them"""
+    best = {name: float("inf") for name in variants}
+    for _ in range(rounds):
+        for name, (func, redirect) in variants.items():
+            with redirect():
+                best[name] = min(best[name], per_call_us(func, calls // rounds, **kwargs))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+    conn.executemany(
+        "INSERT INTO users VALUES (?, ?, ?)", ((i, f"user{i}", f"user{i}@example.com") for i in range(1, 1001))
+    )
+
+    def noop(query, params=()):
+        return []
+
+    def lookup(query, params=()):
+        return conn.execute(query, params).fetchall()
+
+    devnull = open(os.devnull, "w")
+    logger = QueryLogger(sample_rate=args.sample_rate, slow_ms=100, sink=lambda record: devnull.write(str(record)))
+    query = "SELECT * FROM users WHERE id = ?"
+    log_queries = load_log_queries(logger)
+
+    print(f"{'function':>8} {'undecorated':>12} {'print':>10} {'queued':>10} {'queued/print':>13}")
+    to_devnull = functools.partial(contextlib.redirect_stdout, devnull)
+    for name, func in (("noop", noop), ("lookup", lookup)):
+        variants = {
+            "bare": (func, contextlib.nullcontext),
+            "print": (print_log_queries(func), to_devnull),
+            "queued": (log_queries(func), contextlib.nullcontext),
+        }
+        best = best_of(variants, args.calls, args.rounds, query=query)
+        logger.flush(timeout=60)
+        old, new = best["print"] - best["bare"], best["queued"] - best["bare"]
+        print(f"{name:>8} {best['bare']:>10.2f}us {old:>8.2f}us {new:>8.2f}us {new / old:>12.0%}")
+    print("(decorator columns are overhead over the undecorated call)")
+    print("histogram:", logger.histograms())
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
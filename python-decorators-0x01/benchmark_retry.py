@@ -0,0 +1,145 @@
+"""Read-modify-write transactions under lock contention: the fixed-delay retry versus the retry policy
+
+Usage: python benchmark_retry.py [--threads N] [--calls N] [--work S] [--retries N] [--delay S]
+
+Every call runs BEGIN; SELECT; (--work pause) UPDATE; COMMIT on one
+counter row. In WAL mode the UPDATE fails with "database is locked" straight
+away, without waiting out busy_timeout, whenever another thread committed
+since the SELECT. "fixed" is the old decorator applied inside
+with_db_connection as it was, so it retries on the connection whose
+transaction is still open; "fixed/out" is the same decorator applied
+outside, which re-borrows but still retries in lockstep; "policy" is the
+new retry_on_failure. Runs against a scratch users.db in a temporary
+directory, never ./users.db.
+"""
+import argparse
+import contextlib
+import functools
+import importlib.util
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import db_pool
+from retry_policy import RetryBudget
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def fixed_retry(retries=3, delay=2):
+    """The decorator as it was"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            last_exception = None
+            for attempt in range(retries):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    print(f"Attempt {attempt+1} failed: {e}")
+                    last_exception = e
+                    time.sleep(delay)
+            raise last_exception
+        return wrapper
+    return decorator
+
+
+def increment(conn, attempts, work):
+    attempts.append(1)
+    conn.execute("BEGIN")
+    (value,) = conn.execute("SELECT value FROM counter WHERE id = 1").fetchone()
+    time.sleep(work)  # the application deciding what to write
+    conn.execute("UPDATE counter SET value = ? WHERE id = 1", (value + 1,))
+    conn.commit()
+
+
+def run(func, threads, calls, work):
+    """Per-call latencies, failures and attempts of ``threads`` threads making ``calls`` calls each"""
+    start = threading.Barrier(threads + 1)
+    latencies, errors, attempts = [], [], []
+
+    def worker():
+        start.wait()
+        for _ in range(calls):
+            began = time.perf_counter()
+            try:
+                func(attempts=attempts, work=work)
+            except sqlite3.Error as exc:
+                errors.append(str(exc))
+            latencies.append(time.perf_counter() - began)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - began, sorted(latencies), errors, len(attempts)
+
+
+def counter_value():
+    with db_pool.get_pool().connection() as conn:
+        return conn.execute("SELECT value FROM counter WHERE id = 1").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--work", type=float, default=0.0005, help="seconds between the read and the write")
+    parser.add_argument("--delay", type=float, default=0.005, help="fixed delay, and the policy's base delay")
+    args = parser.parse_args()
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            os.environ["DB_POOL_SIZE"] = str(args.threads)
+            script = load_script("3-retry_on_failure.py")
+            budget = RetryBudget()
+            variants = {
+                "fixed": script.with_db_connection(fixed_retry(args.retries, args.delay)(increment)),
+                "fixed/out": fixed_retry(args.retries, args.delay)(script.with_db_connection(increment)),
+                "policy": script.retry_on_failure(args.retries, args.delay, budget=budget)(
+                    script.with_db_connection(increment)
+                ),
+            }
+            with db_pool.get_pool().connection() as conn:
+                conn.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)")
+                conn.execute("INSERT INTO counter VALUES (1, 0)")
+                conn.commit()
+
+            print(f"{'retry':>9} {'ok/s':>8} {'failed':>7} {'attempts':>9} {'p50':>9} {'p99':>9} {'lost':>5}")
+            for name, func in variants.items():
+                before = counter_value()
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    seconds, latencies, errors, attempts = run(func, args.threads, args.calls, args.work)
+                ok = len(latencies) - len(errors)
+                lost = ok - (counter_value() - before)
+                p50, p99 = (latencies[int(len(latencies) * pct)] * 1000 for pct in (0.5, 0.99))
+                print(
+                    f"{name:>9} {ok / seconds:>8.0f} {len(errors):>7} {attempts:>9} "
+                    f"{p50:>7.1f}ms {p99:>7.1f}ms {lost:>5}"
+                )
+                if errors:
+                    print(f"{'':>9} last error: {errors[-1]}")
+            print("budget:", budget.stats())
+            print("pool stats:", db_pool.get_pool().stats())
+            db_pool.get_pool().close()
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Peak memory of reading the whole users table: fetchall versus the streaming variants, plus bulk writes
+
+Usage: python benchmark_streaming.py [--rows 250000 1000000 ...] [--fetch-size N] [--write-rows N]
+
+The table is grown to each --rows size (inserted with bulk_execute from a
+generator) and read in full by fetch_all_users / fetch_users_with_retry
+and by their streaming variants. Peak memory is what tracemalloc sees
+Python allocate during the read; SQLite's own page cache is bounded by the
+pool's cache_size pragma either way. Writes compare one execute per row
+with bulk_execute, both inside a single transaction. Runs against a
+scratch users.db in a temporary directory, never ./users.db.
+"""
+import argparse
+import contextlib
+import importlib.util
+import os
+import tempfile
+import time
+import tracemalloc
+
+import db_pool
+from db_stream import bulk_execute
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def user_rows(start, stop):
+    for i in range(start + 1, stop + 1):
+        yield i, f"user{i}", f"user{i}@example.com", 20 + i % 50
+
+
+def measure(read):
+    """``(rows, total age, peak MiB, seconds)`` of consuming ``read()``"""
+    tracemalloc.start()
+    began = time.perf_counter()
+    count = ages = 0
+    for row in read():
+        count += 1
+        ages += row[3]
+    seconds = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return count, ages, peak, seconds
+
+
+def write_rows_per_second(rows, bulk):
+    with db_pool.get_pool().connection() as conn:
+        conn.execute("DROP TABLE IF EXISTS users_copy")
+        conn.execute("CREATE TABLE users_copy (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+        conn.commit()
+        sql = "INSERT INTO users_copy (id, name, email, age) VALUES (?, ?, ?, ?)"
+        began = time.perf_counter()
+        if bulk:
+            bulk_execute(conn, sql, user_rows(0, rows))
+        else:
+            for row in user_rows(0, rows):
+                conn.execute(sql, row)
+        conn.commit()
+        return rows / (time.perf_counter() - began)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--fetch-size", type=int, default=1000)
+    parser.add_argument("--write-rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            logged = load_script("0-log_queries.py")
+            retried = load_script("3-retry_on_failure.py")
+            query = "SELECT * FROM users"
+            variants = {
+                "fetch_all_users": lambda: logged.fetch_all_users(query=query),
+                "stream_all_users": lambda: logged.stream_all_users(query=query, size=args.fetch_size),
+                "fetch_users_with_retry": retried.fetch_users_with_retry,
+                "stream_users_with_retry": lambda: retried.stream_users_with_retry(size=args.fetch_size),
+            }
+            with db_pool.get_pool().connection() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+                conn.commit()
+
+            print(f"{'rows':>8} {'function':>24} {'peak':>10} {'time':>8}")
+            seeded = 0
+            for rows in sorted(args.rows):
+                with db_pool.get_pool().connection() as conn:
+                    bulk_execute(conn, "INSERT INTO users VALUES (?, ?, ?, ?)", user_rows(seeded, rows))
+                    conn.commit()
+                seeded = rows
+                for name, read in variants.items():
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        count, ages, peak, seconds = measure(read)
+                    assert count == rows, (name, count)
+                    print(f"{rows:>8} {name:>24} {peak:>7.1f}MiB {seconds:>7.2f}s")
+
+            print(f"\n{'writes':>8} {'execute/row':>13} {'bulk_execute':>13}")
+            single = write_rows_per_second(args.write_rows, bulk=False)
+            bulk = write_rows_per_second(args.write_rows, bulk=True)
+            print(f"{args.write_rows:>8} {single:>11.0f}/s {bulk:>11.0f}/s ({bulk / single:.1f}x)")
+            logged.query_logger.flush()
+            db_pool.get_pool().close()
+        finally:
+            os.chdir(previous)
+
+
+if __name__ == "__main__":
+    main()
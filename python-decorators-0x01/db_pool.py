@@ -0,0 +1,207 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from query_cache import TrackingConnection
+
+DEFAULT_DATABASE = "users.db"
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",      # readers do not block the writer
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,       # ms to wait for a lock instead of failing at once
+    "foreign_keys": "ON",
+    "cache_size": -16000,       # negative = KiB
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No connection became free within the pool's timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections, opened lazily up to ``size``
+
+    A thread that already holds a connection gets the same one back when it
+    checks out again, so nested decorated calls share one connection and
+    transaction. Idle connections are pinged before reuse once they have
+    been idle ``ping_after`` seconds; a broken one is replaced. A connection
+    returned with an open transaction is rolled back, as closing it did,
+    and one that fails a ping after an error escaped the call is discarded
+    so the next checkout gets a fresh connection.
+    """
+
+    def __init__(
+        self, database=DEFAULT_DATABASE, size=5, timeout=5.0, pragmas=None, ping_after=30.0, statement_cache=256
+    ):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.ping_after = ping_after
+        self.statement_cache = statement_cache  # prepared statements kept per connection, keyed by SQL text
+        self._idle = []  # (connection, returned_at); used LIFO so warm connections stay warm
+        self._opened = 0
+        self._closed = False
+        self._available = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._stats = dict.fromkeys(
+            ("checkouts", "reentrant", "waits", "timeouts", "opened", "replaced", "rollbacks", "discarded"), 0
+        )
+        self._wait_seconds = 0.0
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            factory=TrackingConnection,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def acquire(self):
+        """Check out a connection; release it with :meth:`release`"""
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            self._local.depth += 1
+            with self._available:
+                self._stats["reentrant"] += 1
+            return held
+
+        conn = self._take()
+        self._local.held = conn
+        self._local.depth = 1
+        return conn
+
+    def release(self, conn, broken=False):
+        """Return a connection; ``broken`` closes it instead of keeping it for reuse"""
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        self._local.held = None
+        healthy = not broken
+        if healthy and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                healthy = False
+            with self._available:
+                self._stats["rollbacks"] += 1
+        with self._available:
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._stats["discarded"] += not healthy
+                self._opened -= 1
+                conn.close()
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, broken=not self._ping(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def _take(self):
+        deadline = None
+        with self._available:
+            self._stats["checkouts"] += 1
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("Connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    break
+                if deadline is None:
+                    self._stats["waits"] += 1
+                    started = time.monotonic()
+                    deadline = started + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    if not self._idle and self._opened >= self.size:
+                        self._stats["timeouts"] += 1
+                        self._wait_seconds += time.monotonic() - started
+                        raise PoolTimeout(f"No connection available within {self.timeout}s")
+            if deadline is not None:
+                self._wait_seconds += time.monotonic() - started
+
+        if conn is None:
+            return self._open()
+        if time.monotonic() - returned_at >= self.ping_after and not self._ping(conn):
+            conn.close()
+            with self._available:
+                self._stats["replaced"] += 1
+            return self._open()
+        return conn
+
+    def _open(self):
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._available:
+                self._opened -= 1
+                self._available.notify()
+            raise
+        with self._available:
+            self._stats["opened"] += 1
+        return conn
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def stats(self):
+        with self._available:
+            return {
+                **self._stats,
+                "wait_seconds": round(self._wait_seconds, 6),
+                "open": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._opened - len(self._idle),
+                "size": self.size,
+            }
+
+    def close(self):
+        """Close idle connections now and the rest as they are released"""
+        with self._available:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+            self._opened -= len(self._idle)
+            self._idle = []
+            self._available.notify_all()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database=DEFAULT_DATABASE):
+    """The process-wide pool for ``database``; DB_POOL_SIZE, DB_POOL_TIMEOUT and DB_STATEMENT_CACHE configure it"""
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(
+                database,
+                size=int(os.environ.get("DB_POOL_SIZE", 5)),
+                timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5.0)),
+                statement_cache=int(os.environ.get("DB_STATEMENT_CACHE", 256)),
+            )
+        return pool
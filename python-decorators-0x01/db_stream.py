@@ -0,0 +1,72 @@
+import functools
+from contextlib import ExitStack
+
+from db_pool import get_pool
+
+DEFAULT_FETCH_SIZE = 1000
+
+
+def iter_cursor(cursor, size=DEFAULT_FETCH_SIZE):
+    """Yield a cursor's rows ``size`` at a time, so only one batch is in memory"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_rows(conn, sql, params=(), size=DEFAULT_FETCH_SIZE):
+    """Run ``sql`` and yield its rows in batches of ``size``
+
+    Pass the same SQL string each time with values as ``params``: sqlite3
+    keeps prepared statements per connection keyed by their text, so the
+    statement is compiled once per pooled connection, not once per call.
+    """
+    cursor = conn.cursor()
+    cursor.arraysize = size
+    try:
+        yield from iter_cursor(cursor.execute(sql, params), size)
+    finally:
+        cursor.close()
+
+
+def streaming_connection(func):
+    """Decorator for generator functions: the pooled connection stays checked out until the generator finishes
+
+    The connection is returned when the consumer exhausts or closes the
+    generator (or it is garbage collected), so consume it fully or wrap it
+    in ``contextlib.closing``, in the thread that started it: the pool
+    tracks checkouts per thread.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_pool().connection() as conn:
+            yield from func(conn, *args, **kwargs)
+    return wrapper
+
+
+def open_cursor(sql, params=(), size=DEFAULT_FETCH_SIZE):
+    """
+    Check out a pooled connection and run ``sql`` on it; returns ``(checkout, cursor)``
+
+    Closing ``checkout`` (an ``ExitStack``) gives the connection back. If the
+    query raises, the connection is returned at once, discarded if broken,
+    so a retry of this function borrows again.
+    """
+    with ExitStack() as stack:
+        conn = stack.enter_context(get_pool().connection())
+        cursor = conn.cursor()
+        cursor.arraysize = size
+        cursor.execute(sql, params)
+        return stack.pop_all(), cursor
+
+
+def bulk_execute(conn, sql, rows):
+    """Run ``sql`` once per parameter tuple in ``rows``; returns the rows affected
+
+    ``rows`` may be a generator: ``executemany`` pulls one tuple at a time
+    through a single prepared statement, so nothing is built up in memory.
+    Does not commit, so it composes with ``transactional`` and
+    ``group_commit``: all of ``rows`` is written in the caller's transaction.
+    """
+    return conn.executemany(sql, rows).rowcount
@@ -0,0 +1,321 @@
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_SPACE = re.compile(r"\s+")
+_TABLE = re.compile(r"\b(?:from|join|into|update)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+_WRITE_ACTIONS = {
+    sqlite3.SQLITE_INSERT: 0,
+    sqlite3.SQLITE_UPDATE: 0,
+    sqlite3.SQLITE_DELETE: 0,
+    sqlite3.SQLITE_DROP_TABLE: 0,
+    sqlite3.SQLITE_ALTER_TABLE: 1,  # the table name is the second argument
+}
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and case outside string literals so equivalent queries share a key"""
+    parts = _LITERAL.split(sql.strip().rstrip(";").strip())
+    return "".join(
+        part if index % 2 else _SPACE.sub(" ", part).lower()
+        for index, part in enumerate(parts)
+    )
+
+
+def tables_in(sql):
+    """Names of the tables a statement reads or writes, lower-cased"""
+    return frozenset(name.lower() for name in _TABLE.findall(_LITERAL.sub("''", sql)))
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def estimate_size(value):
+    """Approximate bytes held by a query result (rows of scalars, nested one or two levels)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(item) for item in row)
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "tables")
+
+    def __init__(self, value, size, expires_at, tables):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.tables = tables
+
+
+class _Flight:
+    """A load in progress that concurrent misses for the same key wait on"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class QueryCache:
+    """Thread-safe LRU cache of query results with TTL, a byte budget and per-table invalidation
+
+    Concurrent misses for one key run the query once; the others wait for
+    its result. A result loaded while one of its tables was invalidated is
+    returned but not stored, since it may predate the write.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._versions = {}
+        self._flights = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ("hits", "misses", "collapsed", "evictions", "expirations", "invalidations", "uncacheable"), 0
+        )
+
+    @staticmethod
+    def make_key(sql, params=()):
+        return normalize_sql(sql), _freeze(params)
+
+    def get_or_load(self, key, tables, load):
+        """Return ``(value, hit)`` for ``key``, calling ``load()`` once on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.value, True
+                self._remove(key)
+                self._stats["expirations"] += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats["misses"] += 1
+                versions = {table: self._versions.get(table, 0) for table in tables}
+            else:
+                self._stats["collapsed"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            flight.value = load()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store(key, flight.value, tables, versions)
+            flight.done.set()
+        return flight.value, False
+
+    def _store(self, key, value, tables, versions):
+        if any(self._versions.get(table, 0) != version for table, version in versions.items()):
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            self._stats["uncacheable"] += 1
+            return
+        self._entries[key] = _Entry(value, size, time.monotonic() + self.ttl, tables)
+        self._bytes += size
+        for table in tables:
+            self._by_table.setdefault(table, set()).add(key)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def invalidate_tables(self, tables):
+        """Drop every entry that read any of ``tables``"""
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._versions[table] = self._versions.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "entries": len(self._entries), "bytes": self._bytes}
+
+
+default_cache = QueryCache()
+
+
+def _written_table(action, arg1, arg2):
+    position = _WRITE_ACTIONS.get(action)
+    if position is None:
+        return None
+    table = arg2 if position else arg1
+    return table.lower() if table else None
+
+
+class TrackingConnection(sqlite3.Connection):
+    """Connection that knows which tables each of its statements writes
+
+    SQLite consults the authorizer only while it prepares a statement, and
+    installing one expires every statement already prepared. So the
+    authorizer is installed once, when the connection opens, and what it
+    reports is remembered per SQL text for statements that are later
+    reused from the statement cache. ``ConnectionPool`` opens these.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared = None  # tables written by the statement being prepared, None when idle
+        self._prepared_any = False
+        self._writes_by_sql = OrderedDict()
+        self._writes_memo_size = max(kwargs.get("cached_statements", 128), 128) * 2
+        self._written = None  # the set track_writes is filling, if any
+        self.set_authorizer(self._authorize)
+
+    def _authorize(self, action, arg1, arg2, db_name, source):
+        if self._prepared is not None:
+            table = _written_table(action, arg1, arg2)
+            if table:
+                self._prepared.add(table)
+            self._prepared_any = True
+        return sqlite3.SQLITE_OK
+
+    def _before(self):
+        self._prepared, self._prepared_any = set(), False
+
+    def _after(self, sql, memoize=True):
+        tables, self._prepared = self._prepared, None
+        if not self._prepared_any:
+            if self._written is None:
+                return
+            tables = self._writes_by_sql.get(sql)
+            if tables is None:
+                tables = tables_in(sql)  # reused but forgotten: over-invalidating is safe
+        elif memoize:
+            memo = self._writes_by_sql
+            memo[sql] = tables
+            if len(memo) > self._writes_memo_size:
+                del memo[next(iter(memo))]
+        if self._written is not None:
+            self._written.update(tables)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TrackingCursor)
+
+    def execute(self, sql, parameters=()):
+        self._before()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._after(sql)
+
+    def executemany(self, sql, parameters):
+        self._before()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self._after(sql)
+
+    def executescript(self, sql):
+        self._before()
+        try:
+            return super().executescript(sql)
+        finally:
+            self._after(sql, memoize=False)
+
+
+class TrackingCursor(sqlite3.Cursor):
+    """Cursor of a :class:`TrackingConnection`"""
+
+    def execute(self, sql, parameters=()):
+        self.connection._before()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection._after(sql)
+
+    def executemany(self, sql, parameters):
+        self.connection._before()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.connection._after(sql)
+
+    def executescript(self, sql):
+        self.connection._before()
+        try:
+            return super().executescript(sql)
+        finally:
+            self.connection._after(sql, memoize=False)
+
+
+@contextmanager
+def track_writes(conn):
+    """Collect the tables written through ``conn`` inside the block into the yielded set
+
+    Uses the connection's authorizer, so writes made by triggers are seen
+    too. On a :class:`TrackingConnection` that authorizer is already in
+    place and prepared statements survive; on a plain connection one is
+    installed for the block, which expires its prepared statements.
+    """
+    written = set()
+    if isinstance(conn, TrackingConnection):
+        outer, conn._written = conn._written, written
+        try:
+            yield written
+        finally:
+            conn._written = outer
+            if outer is not None:
+                outer.update(written)
+        return
+
+    def authorizer(action, arg1, arg2, db_name, source):
+        table = _written_table(action, arg1, arg2)
+        if table:
+            written.add(table)
+        return sqlite3.SQLITE_OK
+
+    conn.set_authorizer(authorizer)
+    try:
+        yield written
+    finally:
+        conn.set_authorizer(None)
@@ -0,0 +1,247 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timezone
+
+from query_cache import normalize_sql
+
+# Upper bounds (ms) of the latency buckets; the last bucket is open-ended.
+BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """The statement with literals replaced by ``?`` and IN lists folded, so its executions group together"""
+    sql = _STRING.sub("?", normalize_sql(sql))
+    return _LIST.sub("(?+)", _NUMBER.sub("?", sql))
+
+
+class Histogram:
+    """Executions of one statement per latency bucket, with running totals
+
+    Durations are appended to ``pending`` and folded into the buckets a
+    batch at a time: sorting a batch and bisecting it once per bucket is far
+    cheaper than bucketing each value as it arrives.
+    """
+    __slots__ = ("pending", "buckets", "count", "total_ms", "max_ms", "rows", "errors")
+    FOLD_EVERY = 1024
+
+    def __init__(self):
+        self.pending = []
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.errors = 0
+
+    def fold(self, values=None):
+        """Move ``values`` (default: this histogram's pending durations) into the buckets"""
+        if values is None:
+            values, self.pending = self.pending, []
+        if not values:
+            return
+        values = sorted(values)
+        below = 0
+        for index, bound in enumerate(BUCKETS):
+            upto = bisect_right(values, bound, below)
+            self.buckets[index] += upto - below
+            below = upto
+        self.buckets[-1] += len(values) - below
+        self.count += len(values)
+        self.total_ms += sum(values)
+        self.max_ms = max(self.max_ms, values[-1])
+
+    def merge(self, other):
+        """Add ``other`` in, leaving it untouched (it may belong to a running thread)"""
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.rows += other.rows
+        self.errors += other.errors
+        self.fold(list(other.pending))
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the ``pct``-th percentile (None if open-ended)"""
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else None
+        return None
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 4) if self.count else None,
+            "max_ms": round(self.max_ms, 4),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "rows": self.rows,
+            "errors": self.errors,
+        }
+
+
+def write_json_line(record, stream=None):
+    (stream or sys.stdout).write(json.dumps(record, default=str) + "\n")
+
+
+class QueryLogger:
+    """Query timings in per-thread histograms, log records written by a background thread
+
+    The calling thread folds each execution into its own histogram (keyed
+    by statement fingerprint, so memory is bounded by distinct statements
+    rather than distinct literals; no locking) and only queues a structured
+    record for a ``sample_rate`` share of executions, plus every one at or
+    over ``slow_ms`` or that failed. The drain thread formats those and
+    hands them to ``sink``. :meth:`histograms` merges the threads'
+    histograms.
+    """
+
+    def __init__(self, sample_rate=0.01, slow_ms=100.0, sink=write_json_line):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.sink = sink
+        self.dropped = 0  # records that could not be formatted or written
+        self._queue = queue.SimpleQueue()
+        self._local = threading.local()
+        self._per_thread = []  # every thread's {sql: Histogram}
+        self._lock = threading.Lock()
+        self._thread = None
+        # perf_counter() + offset ~= time.time(), so the caller reads one clock only
+        self._wall_offset = time.time() - time.perf_counter()
+
+    def record(self, sql, params, started, ended, rows=None, error=None):
+        """Account one execution; ``started``/``ended`` are ``time.perf_counter()`` readings"""
+        ms = (ended - started) * 1000
+        try:
+            histograms = self._local.histograms
+        except AttributeError:
+            histograms = self._local.histograms = {}
+            with self._lock:
+                self._per_thread.append(histograms)
+        # Keyed by fingerprint: statements with inlined literals share one histogram
+        key = fingerprint(sql) if type(sql) is str else "<unknown>"
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        pending = histogram.pending
+        pending.append(ms)
+        if rows:
+            histogram.rows += rows
+        if error is not None:
+            histogram.errors += 1
+        if len(pending) >= Histogram.FOLD_EVERY:
+            histogram.fold()
+        if ms >= self.slow_ms or error is not None or random.random() < self.sample_rate:
+            if self._thread is None:
+                self._start()
+            self._queue.put((sql, params, started, ms, rows, error))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._drain, name="query-log", daemon=True)
+                thread.start()
+                self._thread = thread
+                atexit.register(self.flush)
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, threading.Event):  # flush marker
+                item.set()
+                continue
+            try:
+                self.sink(self._format(*item))
+            except Exception:
+                self.dropped += 1
+
+    def _format(self, sql, params, started, ms, rows, error):
+        record = {
+            "at": datetime.fromtimestamp(started + self._wall_offset, timezone.utc).isoformat(timespec="milliseconds"),
+            "sql": sql,
+            "params": params,
+            "fingerprint": fingerprint(sql) if isinstance(sql, str) else None,
+            "duration_ms": round(ms, 4),
+            "rows": rows,
+            "slow": ms >= self.slow_ms,
+        }
+        if error is not None:
+            record["error"] = f"{type(error).__name__}: {error}"
+        return record
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued record has been written"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def histograms(self):
+        """``{fingerprint: summary}`` over all threads, largest total time first"""
+        merged = {}
+        with self._lock:
+            per_thread = list(self._per_thread)
+        for histograms in per_thread:
+            for key, histogram in list(histograms.items()):
+                merged.setdefault(key, Histogram()).merge(histogram)
+        ranked = sorted(merged.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return {key: histogram.summary() for key, histogram in ranked}
+
+    def dump(self, stream=None):
+        """Write the per-fingerprint histograms as one JSON document"""
+        stream = stream or sys.stdout
+        json.dump(self.histograms(), stream, indent=2)
+        stream.write("\n")
+
+    def reset(self):
+        with self._lock:
+            for histograms in self._per_thread:
+                histograms.clear()
+
+
+default_logger = QueryLogger(
+    sample_rate=float(os.environ.get("QUERY_LOG_SAMPLE", 0.01)),
+    slow_ms=float(os.environ.get("QUERY_LOG_SLOW_MS", 100)),
+)
+
+
+def call_arguments(func):
+    """``(sql_name, sql_position, params_position)`` of ``func``'s parameters
+
+    The SQL is the ``query`` or ``sql`` parameter (else the first) and the
+    params the ``params`` parameter; a missing one gets a position past the
+    end, so callers can test ``position < len(args)`` without a branch for it.
+    """
+    parameters = list(inspect.signature(func).parameters)
+    sql_name = next((name for name in ("query", "sql") if name in parameters), parameters[0] if parameters else None)
+
+    def position(name):
+        return parameters.index(name) if name in parameters else len(parameters) + 1
+
+    return sql_name, position(sql_name), position("params")
+
+
+def row_count(result):
+    """Rows in a fetched result or affected by a cursor, None when unknown"""
+    if type(result) is list:
+        return len(result)
+    rowcount = getattr(result, "rowcount", -1)
+    return rowcount if isinstance(rowcount, int) and rowcount >= 0 else None
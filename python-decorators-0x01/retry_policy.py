@@ -0,0 +1,70 @@
+import random
+import sqlite3
+import threading
+import time
+
+TRANSIENT_MESSAGES = ("database is locked", "database table is locked", "database is busy", "busy")
+
+
+def is_transient(exc):
+    """True for errors a later attempt can succeed on: lock contention and pool exhaustion"""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return any(text in message for text in TRANSIENT_MESSAGES) or type(exc).__name__ == "PoolTimeout"
+
+
+def decorrelated_jitter(base, cap):
+    """Sleep lengths growing roughly threefold per attempt, each drawn at random
+
+    Every delay is uniform between ``base`` and three times the previous one,
+    capped at ``cap``, so callers that failed together retry apart.
+    """
+    delay = base
+    while True:
+        delay = min(cap, random.uniform(base, delay * 3))
+        yield delay
+
+
+class RetryBudget:
+    """Process-wide allowance of retries, so retries cannot multiply load when most calls fail
+
+    Every call deposits ``ratio`` of a retry and time adds ``min_per_second``,
+    both up to ``max_tokens``; every retry spends one. With the default 0.2,
+    retries add at most about 20% to the calls being made once the reserve
+    is used up.
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=10.0, max_tokens=100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(("calls", "retries", "rejected"), 0)
+
+    def record_call(self):
+        with self._lock:
+            self._stats["calls"] += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self):
+        """Take one retry from the budget; False means fail now instead of retrying"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.max_tokens, self._tokens + (now - self._refilled_at) * self.min_per_second)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self._stats["retries"] += 1
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "tokens": round(self._tokens, 2)}
+
+
+default_budget = RetryBudget()
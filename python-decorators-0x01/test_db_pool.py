@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the db_pool module.
+Run from this directory with ``python -m unittest``; every test uses a
+scratch database in a temporary directory.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test cases for ConnectionPool"""
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.database = os.path.join(scratch.name, "users.db")
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.commit()
+        conn.close()
+
+    def make_pool(self, **kwargs):
+        pool = ConnectionPool(self.database, **{"size": 2, "timeout": 0.05, **kwargs})
+        self.addCleanup(pool.close)
+        return pool
+
+    @staticmethod
+    def checkout(pool):
+        """Check a connection out and straight back in, returning it"""
+        with pool.connection() as conn:
+            return conn
+
+    def in_thread(self, func):
+        """Run ``func`` on another thread and return what it returned or raised"""
+        outcome = {}
+
+        def target():
+            try:
+                outcome["value"] = func()
+            except BaseException as exc:
+                outcome["error"] = exc
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        return outcome
+
+    def test_reentrant_checkout_on_the_same_thread(self):
+        """Nested checkouts on one thread share a connection and return it once"""
+        pool = self.make_pool()
+        with pool.connection() as outer:
+            with pool.connection() as inner:
+                self.assertIs(inner, outer)
+            self.assertEqual(pool.stats()["in_use"], 1)
+        stats = pool.stats()
+        self.assertEqual((stats["reentrant"], stats["opened"], stats["idle"]), (1, 1, 1))
+
+    def test_other_threads_get_their_own_connection(self):
+        """A checkout on another thread does not reuse the held connection"""
+        pool = self.make_pool()
+        with pool.connection() as held:
+            other = self.in_thread(lambda: self.checkout(pool))["value"]
+        self.assertIsNot(other, held)
+        self.assertEqual(pool.stats()["idle"], 2)
+
+    def test_timeout_when_the_pool_is_exhausted(self):
+        """PoolTimeout is raised once every connection stays checked out past the timeout"""
+        pool = self.make_pool(size=1)
+        with pool.connection():
+            outcome = self.in_thread(pool.acquire)
+        self.assertIsInstance(outcome["error"], PoolTimeout)
+        self.assertIsInstance(outcome["error"], sqlite3.OperationalError)
+        self.assertEqual((pool.stats()["waits"], pool.stats()["timeouts"]), (1, 1))
+
+    def test_waiter_gets_a_released_connection(self):
+        """A thread waiting on a full pool is handed the connection released meanwhile"""
+        pool = self.make_pool(size=1, timeout=5)
+        conn = pool.acquire()
+        started = threading.Event()
+
+        def wait_for_connection():
+            started.set()
+            with pool.connection() as other:
+                return other
+
+        thread_outcome = {}
+        thread = threading.Thread(target=lambda: thread_outcome.update(value=wait_for_connection()))
+        thread.start()
+        started.wait()
+        pool.release(conn)
+        thread.join()
+        self.assertIs(thread_outcome["value"], conn)
+
+    def test_open_transaction_is_rolled_back_on_release(self):
+        """A connection returned mid-transaction is rolled back before reuse"""
+        pool = self.make_pool()
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO users (name) VALUES ('uncommitted')")
+            self.assertTrue(conn.in_transaction)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(pool.stats()["rollbacks"], 1)
+        with pool.connection() as again:
+            self.assertIs(again, conn)
+            self.assertEqual(again.execute("SELECT COUNT(*) FROM users").fetchone()[0], 0)
+
+    def test_broken_connection_is_discarded_after_an_error(self):
+        """A connection that fails its ping after an error escaped is closed, not reused"""
+        pool = self.make_pool()
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as broken:
+                broken.close()
+                raise RuntimeError("query failed")
+        stats = pool.stats()
+        self.assertEqual((stats["discarded"], stats["open"], stats["idle"]), (1, 0, 0))
+        with pool.connection() as fresh:
+            self.assertIsNot(fresh, broken)
+            self.assertEqual(fresh.execute("SELECT 1").fetchone(), (1,))
+
+    def test_healthy_connection_survives_an_error(self):
+        """An error raised by the caller does not cost a working connection"""
+        pool = self.make_pool()
+        with self.assertRaises(RuntimeError):
+            with pool.connection() as conn:
+                raise RuntimeError("caller failed")
+        with pool.connection() as again:
+            self.assertIs(again, conn)
+        self.assertEqual(pool.stats()["discarded"], 0)
+
+    def test_idle_connection_failing_its_ping_is_replaced(self):
+        """An idle connection past ping_after that no longer answers is swapped for a new one"""
+        pool = self.make_pool(ping_after=0)
+        with pool.connection() as conn:
+            pass
+        conn.close()
+        with pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+            self.assertEqual(replacement.execute("SELECT 1").fetchone(), (1,))
+        stats = pool.stats()
+        self.assertEqual((stats["replaced"], stats["opened"], stats["open"]), (1, 2, 1))
+
+    def test_close_while_connections_are_checked_out(self):
+        """close() shuts idle connections at once and checked-out ones when they come back"""
+        pool = self.make_pool()
+        with pool.connection() as held:
+            idle = self.in_thread(lambda: self.checkout(pool))["value"]
+            pool.close()
+            with self.assertRaises(sqlite3.ProgrammingError):
+                idle.execute("SELECT 1")
+            self.assertEqual(held.execute("SELECT 1").fetchone(), (1,))
+            self.assertEqual(pool.stats()["open"], 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            held.execute("SELECT 1")
+        self.assertEqual(pool.stats()["open"], 0)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            pool.acquire()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the query_cache module.
+Run from this directory with ``python -m unittest``.
+"""
+import sqlite3
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from query_cache import QueryCache, TrackingConnection, track_writes
+
+
+class TestQueryCache(unittest.TestCase):
+    """Test cases for QueryCache"""
+
+    def test_concurrent_misses_run_the_query_once(self):
+        """Callers missing on a key that is already loading wait for that load"""
+        cache = QueryCache()
+        key = cache.make_key("SELECT * FROM users")
+        loading, release = threading.Event(), threading.Event()
+        loads = []
+
+        def load():
+            loads.append(1)
+            loading.set()
+            release.wait(5)
+            return [(1, "alice")]
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.get_or_load(key, {"users"}, load)))
+        leader.start()
+        loading.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(cache.get_or_load(key, {"users"}, load)))
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        while cache.stats()["collapsed"] < 3:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(sorted(hit for _, hit in results), [False, True, True, True])
+        self.assertTrue(all(value == [(1, "alice")] for value, _ in results))
+        self.assertEqual((cache.stats()["misses"], cache.stats()["collapsed"]), (1, 3))
+
+    def test_load_error_reaches_every_waiter_and_is_not_cached(self):
+        """A failed load is re-raised to the callers that waited on it"""
+        cache = QueryCache()
+        key = cache.make_key("SELECT * FROM users")
+        loading, release = threading.Event(), threading.Event()
+        errors = []
+
+        def load():
+            loading.set()
+            release.wait(5)
+            raise sqlite3.OperationalError("database is locked")
+
+        def call():
+            try:
+                cache.get_or_load(key, {"users"}, load)
+            except sqlite3.OperationalError as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        loading.wait(5)
+        threads.append(threading.Thread(target=call))
+        threads[1].start()
+        while cache.stats()["collapsed"] < 1:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_invalidation_drops_only_entries_of_that_table(self):
+        """Writing a table removes the results that read it and keeps the rest"""
+        cache = QueryCache()
+        users = cache.make_key("SELECT * FROM users")
+        orders = cache.make_key("SELECT * FROM orders")
+        cache.get_or_load(users, {"users"}, lambda: ["u"])
+        cache.get_or_load(orders, {"orders"}, lambda: ["o"])
+        cache.invalidate_tables({"USERS"})
+        self.assertEqual(cache.get_or_load(users, {"users"}, lambda: ["u2"]), (["u2"], False))
+        self.assertEqual(cache.get_or_load(orders, {"orders"}, lambda: ["o2"]), (["o"], True))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_result_loaded_across_an_invalidation_is_not_stored(self):
+        """A load that overlapped a write to its table is returned but not cached"""
+        cache = QueryCache()
+        key = cache.make_key("SELECT * FROM users WHERE id = ?", (1,))
+
+        def load():
+            cache.invalidate_tables({"users"})  # a writer commits while the query runs
+            return ["stale"]
+
+        self.assertEqual(cache.get_or_load(key, {"users"}, load), (["stale"], False))
+        self.assertEqual(cache.get_or_load(key, {"users"}, lambda: ["fresh"]), (["fresh"], False))
+        self.assertEqual(cache.get_or_load(key, {"users"}, lambda: ["again"]), (["fresh"], True))
+
+    def test_other_tables_do_not_block_storing(self):
+        """Writes to unrelated tables during a load leave the result cacheable"""
+        cache = QueryCache()
+        key = cache.make_key("SELECT * FROM users")
+
+        def load():
+            cache.invalidate_tables({"orders"})
+            return ["u"]
+
+        cache.get_or_load(key, {"users"}, load)
+        self.assertEqual(cache.get_or_load(key, {"users"}, lambda: ["other"]), (["u"], True))
+
+
+class TestTrackWrites(unittest.TestCase):
+    """Test cases for track_writes and TrackingConnection"""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", factory=TrackingConnection, cached_statements=16)
+        self.addCleanup(self.conn.close)
+        self.conn.executescript("""
+            CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT);
+            CREATE TABLE audit (user_id INTEGER);
+            CREATE TABLE orders (id INTEGER PRIMARY KEY);
+            CREATE TRIGGER users_audit AFTER UPDATE ON users BEGIN
+                INSERT INTO audit VALUES (new.id);
+            END;
+            INSERT INTO users VALUES (1, 'a'), (2, 'b');
+        """)
+
+    def test_every_run_of_a_cached_statement_is_seen(self):
+        """Writes through a reused prepared statement and its triggers are recorded each time"""
+        for user_id in (1, 2, 1):
+            with track_writes(self.conn) as written:
+                self.conn.cursor().execute("UPDATE users SET email = ? WHERE id = ?", ("x", user_id))
+                self.conn.execute("SELECT * FROM orders").fetchall()
+            self.assertEqual(written, {"users", "audit"})
+
+    def test_reads_and_untracked_writes_record_nothing(self):
+        """Only statements run inside the block count"""
+        self.conn.execute("DELETE FROM orders")
+        with track_writes(self.conn) as written:
+            self.conn.execute("SELECT * FROM users").fetchall()
+        self.assertEqual(written, set())
+
+    def test_nested_blocks_report_to_the_outer_one(self):
+        """A write inside a nested block is also a write of the enclosing block"""
+        with track_writes(self.conn) as outer:
+            with track_writes(self.conn) as inner:
+                self.conn.executemany("INSERT INTO orders VALUES (?)", [(1,), (2,)])
+        self.assertEqual(inner, {"orders"})
+        self.assertEqual(outer, {"orders"})
+
+    def test_authorizer_is_not_reinstalled(self):
+        """Tracking a block leaves the connection's prepared statements alone"""
+        with patch.object(TrackingConnection, "set_authorizer") as set_authorizer:
+            with track_writes(self.conn):
+                self.conn.execute("DELETE FROM orders")
+        set_authorizer.assert_not_called()
+
+    def test_plain_connections_are_tracked_too(self):
+        """A connection opened without the factory gets an authorizer for the block"""
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY)")
+        for _ in range(2):
+            with track_writes(conn) as written:
+                conn.execute("INSERT INTO orders DEFAULT VALUES")
+            self.assertEqual(written, {"orders"})
+
+
+if __name__ == "__main__":
+    unittest.main()
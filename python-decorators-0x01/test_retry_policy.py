@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the retry_policy module and the retry_on_failure decorator.
+Run from this directory with ``python -m unittest``.
+"""
+import contextlib
+import importlib.util
+import io
+import os
+import random
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+from db_pool import PoolTimeout
+from retry_policy import RetryBudget, decorrelated_jitter, is_transient
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_script(filename):
+    spec = importlib.util.spec_from_file_location(filename.replace("-", "_")[:-3], os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TestDecorrelatedJitter(unittest.TestCase):
+    """Test cases for decorrelated_jitter"""
+
+    def test_delays_stay_within_bounds(self):
+        """Every delay is at least base, at most cap and at most three times the previous one"""
+        random.seed(0)
+        previous = base = 0.05
+        sleeps = decorrelated_jitter(base, cap=2.0)
+        for _ in range(10000):
+            delay = next(sleeps)
+            self.assertGreaterEqual(delay, base)
+            self.assertLessEqual(delay, min(2.0, previous * 3))
+            previous = delay
+
+    def test_delays_reach_the_cap(self):
+        """Delays grow until they are held at the cap"""
+        random.seed(1)
+        sleeps = decorrelated_jitter(0.01, cap=1.0)
+        self.assertEqual(max(next(sleeps) for _ in range(200)), 1.0)
+
+
+class TestRetryBudget(unittest.TestCase):
+    """Test cases for RetryBudget"""
+
+    def test_stops_once_the_budget_is_spent(self):
+        """Retries are refused once the tokens are used up"""
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=2)
+        self.assertEqual([budget.try_spend() for _ in range(4)], [True, True, False, False])
+        self.assertEqual(budget.stats(), {"calls": 0, "retries": 2, "rejected": 2, "tokens": 0})
+
+    def test_calls_earn_retries(self):
+        """Each call deposits ``ratio`` of a retry, up to ``max_tokens``"""
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+        budget.try_spend()
+        budget.record_call()
+        self.assertFalse(budget.try_spend())
+        budget.record_call()
+        budget.record_call()
+        self.assertTrue(budget.try_spend())
+        for _ in range(10):
+            budget.record_call()
+        self.assertEqual(budget.stats()["tokens"], 1)
+
+    def test_time_refills_the_budget(self):
+        """``min_per_second`` tokens come back per second even without calls"""
+        with patch("retry_policy.time.monotonic", return_value=100.0):
+            budget = RetryBudget(ratio=0, min_per_second=2, max_tokens=1)
+            self.assertTrue(budget.try_spend())
+            self.assertFalse(budget.try_spend())
+        with patch("retry_policy.time.monotonic", return_value=100.5):
+            self.assertTrue(budget.try_spend())
+
+
+class TestIsTransient(unittest.TestCase):
+    """Test cases for is_transient"""
+
+    def test_classification(self):
+        """Lock contention and pool exhaustion are retried, other errors are not"""
+        self.assertTrue(is_transient(sqlite3.OperationalError("database is locked")))
+        self.assertTrue(is_transient(PoolTimeout("No connection available within 5s")))
+        self.assertFalse(is_transient(sqlite3.OperationalError("no such table: users")))
+        self.assertFalse(is_transient(sqlite3.IntegrityError("UNIQUE constraint failed")))
+        self.assertFalse(is_transient(ValueError("database is locked")))
+
+
+class TestRetryOnFailure(unittest.TestCase):
+    """Test cases for retry_on_failure"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.retry_on_failure = staticmethod(load_script("3-retry_on_failure.py").retry_on_failure)
+
+    def flaky(self, failures, error=None):
+        calls = []
+
+        def func():
+            calls.append(1)
+            if len(calls) <= failures:
+                raise error or sqlite3.OperationalError("database is locked")
+            return "ok"
+        return func, calls
+
+    def run_quietly(self, func):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+
+    def test_transient_errors_are_retried(self):
+        """A call that fails transiently and then succeeds returns its result"""
+        func, calls = self.flaky(2)
+        budget = RetryBudget()
+        wrapped = self.retry_on_failure(retries=3, delay=0.001, budget=budget)(func)
+        self.assertEqual(self.run_quietly(wrapped), "ok")
+        self.assertEqual((len(calls), budget.stats()["retries"]), (3, 2))
+
+    def test_exhausted_budget_stops_retrying(self):
+        """Once the budget is empty the error is raised without another attempt"""
+        func, calls = self.flaky(10)
+        budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+        wrapped = self.retry_on_failure(retries=5, delay=0.001, budget=budget)(func)
+        with self.assertRaises(sqlite3.OperationalError):
+            self.run_quietly(wrapped)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(budget.stats()["rejected"], 1)
+
+    def test_permanent_errors_are_not_retried(self):
+        """Errors a retry cannot fix are raised at once and spend nothing"""
+        func, calls = self.flaky(1, sqlite3.OperationalError("no such table: users"))
+        budget = RetryBudget()
+        wrapped = self.retry_on_failure(retries=3, delay=0.001, budget=budget)(func)
+        with self.assertRaises(sqlite3.OperationalError):
+            wrapped()
+        self.assertEqual((len(calls), budget.stats()["retries"]), (1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
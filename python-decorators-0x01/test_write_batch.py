@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the write_batch module.
+Run from this directory with ``python -m unittest``; every test uses a
+scratch database in a temporary directory.
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import db_pool
+from query_cache import default_cache
+from write_batch import GroupCommitter
+
+
+def insert_user(conn, user_id, fail=False):
+    conn.execute("INSERT INTO users (id, email) VALUES (?, ?)", (user_id, f"user{user_id}@example.com"))
+    if fail:
+        raise ValueError(f"user {user_id} rejected")
+    return user_id
+
+
+class TestGroupCommitter(unittest.TestCase):
+    """Test cases for GroupCommitter"""
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.database = os.path.join(scratch.name, "users.db")
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+        conn.commit()
+        conn.close()
+        self.addCleanup(lambda: db_pool.get_pool(self.database).close())
+
+    def make_committer(self, **kwargs):
+        committer = GroupCommitter(self.database, **kwargs)
+        self.addCleanup(committer.close)
+        return committer
+
+    def user_ids(self):
+        conn = sqlite3.connect(self.database)
+        try:
+            return [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+        finally:
+            conn.close()
+
+    def test_failing_call_rolls_back_only_its_own_savepoint(self):
+        """One call raising leaves the rest of its batch committed"""
+        committer = self.make_committer(max_wait=0.2)
+        pending = [
+            committer.submit(insert_user, (1,)),
+            committer.submit(insert_user, (2,), {"fail": True}),
+            committer.submit(insert_user, (3,)),
+        ]
+        self.assertEqual(pending[0].result(5), 1)
+        with self.assertRaisesRegex(ValueError, "user 2 rejected"):
+            pending[1].result(5)
+        self.assertEqual(pending[2].result(5), 3)
+        self.assertEqual(self.user_ids(), [1, 3])
+        stats = committer.stats()
+        self.assertEqual((stats["batches"], stats["calls"], stats["failed_calls"]), (1, 3, 1))
+        self.assertEqual(stats["failed_batches"], 0)
+
+    def test_failed_batch_fails_every_call(self):
+        """When BEGIN cannot take the write lock, each call in the batch gets that error"""
+        blocker = sqlite3.connect(self.database)
+        self.addCleanup(blocker.close)
+        blocker.execute("BEGIN IMMEDIATE")
+        committer = self.make_committer(max_wait=0.2)
+        with patch.dict(db_pool.DEFAULT_PRAGMAS, busy_timeout=0):
+            pending = [committer.submit(insert_user, (user_id,)) for user_id in (1, 2)]
+            for write in pending:
+                with self.assertRaisesRegex(sqlite3.OperationalError, "locked"):
+                    write.result(5)
+        blocker.rollback()
+        self.assertEqual(committer.stats()["failed_batches"], 1)
+        self.assertEqual(self.user_ids(), [])
+
+    def test_commit_invalidates_the_written_tables(self):
+        """Committed batches drop cached results that read the tables they wrote"""
+        key = default_cache.make_key("SELECT * FROM users")
+        self.addCleanup(default_cache.clear)
+        default_cache.get_or_load(key, {"users"}, lambda: ["cached"])
+        committer = self.make_committer()
+        committer.submit(insert_user, (1,)).result(5)
+        self.assertEqual(default_cache.get_or_load(key, {"users"}, lambda: ["fresh"]), (["fresh"], False))
+
+    def test_close_commits_what_is_queued(self):
+        """close() lets the writer finish the queue before it stops"""
+        committer = self.make_committer(max_wait=0.05)
+        pending = [committer.submit(insert_user, (user_id,)) for user_id in range(1, 6)]
+        committer.close()
+        self.assertTrue(all(write.done.is_set() for write in pending))
+        self.assertEqual(self.user_ids(), [1, 2, 3, 4, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
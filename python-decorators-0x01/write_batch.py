@@ -0,0 +1,145 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from db_pool import DEFAULT_DATABASE, get_pool
+from query_cache import default_cache, track_writes
+
+_STOP = object()
+
+
+class PendingWrite:
+    """One queued call; :meth:`result` waits for its batch to commit"""
+    __slots__ = ("func", "args", "kwargs", "done", "value", "error")
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self, timeout=None):
+        """The call's return value once committed; re-raises its own error or the batch's"""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Write not committed yet")
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class GroupCommitter:
+    """Runs queued write calls together, one transaction and one commit per batch
+
+    A background thread takes every call queued while the previous batch
+    was committing, up to ``max_batch``; a ``max_wait`` above zero also
+    holds each batch open that many seconds for more calls. It runs them
+    in order on one pooled connection under ``BEGIN IMMEDIATE``. Each call
+    gets its own savepoint: one that raises is rolled back to it and gets
+    its exception while the rest still commit. If the transaction itself
+    fails (BEGIN or COMMIT), every call in the batch gets that error.
+
+    Calls run on the writer thread's connection, so a caller must not hold
+    a write transaction of its own on the same database while waiting.
+    """
+
+    def __init__(self, database=DEFAULT_DATABASE, max_wait=0.0, max_batch=100):
+        self.database = database
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = dict.fromkeys(("calls", "batches", "failed_calls", "failed_batches"), 0)
+
+    def submit(self, func, args=(), kwargs=None):
+        """Queue ``func(conn, *args, **kwargs)`` and return its :class:`PendingWrite`"""
+        pending = PendingWrite(func, args, kwargs or {})
+        if self._thread is None:
+            self._start()
+        self._queue.put(pending)
+        return pending
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                thread.start()
+                self._thread = thread
+                atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        failed = 0
+        try:
+            with get_pool(self.database).connection() as conn:
+                with track_writes(conn) as written:
+                    conn.execute("BEGIN IMMEDIATE")
+                    for pending in batch:
+                        conn.execute("SAVEPOINT group_write")
+                        try:
+                            pending.value = pending.func(conn, *pending.args, **pending.kwargs)
+                        except Exception as exc:
+                            pending.error = exc
+                            failed += 1
+                            conn.execute("ROLLBACK TO group_write")
+                        conn.execute("RELEASE group_write")
+                    conn.commit()
+        except Exception as exc:
+            for pending in batch:
+                pending.error = pending.error or exc
+            failed = len(batch)
+            written = ()
+        if written:
+            default_cache.invalidate_tables(written)
+        with self._lock:
+            self._stats["calls"] += len(batch)
+            self._stats["batches"] += 1
+            self._stats["failed_calls"] += failed
+            self._stats["failed_batches"] += failed == len(batch)
+        for pending in batch:
+            pending.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mean_batch"] = round(stats["calls"] / stats["batches"], 2) if stats["batches"] else None
+        return stats
+
+    def close(self, timeout=5.0):
+        """Commit what is queued and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+
+default_committer = GroupCommitter(
+    max_wait=float(os.environ.get("GROUP_COMMIT_WAIT_MS", 0)) / 1000,
+    max_batch=int(os.environ.get("GROUP_COMMIT_MAX_BATCH", 100)),
+)